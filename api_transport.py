@@ -0,0 +1,279 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# --- 共享 HTTP 传输层 ---
+# 三个前端 (main.py / main_zhuiwen_mode.py / chat-bot-clear.py) 共用同一个长连接池，
+# 避免每次发送都重新进行 TCP + TLS 握手。
+
+# CHATBOT_API_URL 可以把请求指向其他兼容服务 (例如 benchmarks/sse_server.py 本地替身)
+API_URL = os.environ.get("CHATBOT_API_URL", "https://api.bltcy.cn/v1/chat/completions")
+
+
+class TransportConfig:
+    """
+    传输层配置。所有参数都可以通过环境变量覆盖：
+      CHATBOT_POOL_CONNECTIONS  缓存的主机连接池数量
+      CHATBOT_POOL_MAXSIZE      每个主机保持的最大空闲连接数
+      CHATBOT_IDLE_TIMEOUT      空闲多少秒后回收连接 (0 表示不回收)
+      CHATBOT_HTTP2             设为 1 时使用 httpx 的 HTTP/2 多路复用 (需安装 httpx[http2])
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, idle_timeout=90.0, http2=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.http2 = http2
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            pool_connections=int(os.environ.get("CHATBOT_POOL_CONNECTIONS", 4)),
+            pool_maxsize=int(os.environ.get("CHATBOT_POOL_MAXSIZE", 10)),
+            idle_timeout=float(os.environ.get("CHATBOT_IDLE_TIMEOUT", 90.0)),
+            http2=os.environ.get("CHATBOT_HTTP2", "0").lower() in ("1", "true", "yes")
+        )
+
+
+class TransportError(requests.exceptions.RequestException):
+    """HTTP/2 (httpx) 后端的网络错误，继承 RequestException 以便调用方统一捕获"""
+
+
+class _Http1StreamResponse:
+    """
+    requests.Response 的薄包装：iter_bytes() / iter_lines() 始终返回同一个迭代器。
+    调用方在 [DONE] 处 break 时，底层 urllib3 生成器不会被关闭 (关闭会直接断开连接)，
+    退出 with 块时再由 drain() 读完 chunked 结束标记，连接即可回到池中。
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._iterator = None
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def text(self):
+        return self._response.text
+
+    def iter_bytes(self):
+        """
+        按到达顺序返回原始字节块。chunked 响应每个 HTTP chunk 一到就返回 (服务端通常一个 SSE 事件一个 chunk)；
+        非 chunked 响应与 iter_lines() 一样按 512 字节读取。
+        """
+        if self._iterator is None:
+            self._iterator = self._response.iter_content(chunk_size=None if self._response.raw.chunked else 512)
+        return self._iterator
+
+    def iter_lines(self):
+        if self._iterator is None:
+            self._iterator = self._response.iter_lines()
+        return self._iterator
+
+    def set_read_timeout(self, seconds):
+        """流开始后调整底层 socket 的读超时 (例如收到首字后改用更短的停顿超时)；连接复用时 urllib3 会重新设置"""
+        connection = getattr(self._response.raw, "connection", None) or getattr(self._response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            sock.settimeout(seconds)
+
+    def abort(self):
+        """从其他线程中止读取：关闭 socket 的读写两端，阻塞在 recv 上的读取线程会立即返回"""
+        connection = getattr(self._response.raw, "connection", None) or getattr(self._response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def drain(self):
+        for _ in self._iterator or self.iter_bytes():
+            pass
+
+    def close(self):
+        self._response.close()
+
+
+class _Http2StreamResponse:
+    """把 httpx 的流式响应包装成与 requests.Response 相同的接口 (status_code / text / iter_bytes / iter_lines)"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def text(self):
+        self._response.read()
+        return self._response.text
+
+    def iter_bytes(self):
+        try:
+            yield from self._response.iter_bytes()
+        except Exception as e:
+            raise TransportError(e)
+
+    def iter_lines(self):
+        try:
+            for line in self._response.iter_lines():
+                yield line.encode('utf-8')
+        except Exception as e:
+            raise TransportError(e)
+
+    def set_read_timeout(self, seconds):
+        """httpx 的读超时在请求开始时就固定了，这里不做调整 (停顿由调用方按读超时处理)"""
+
+    def abort(self):
+        """HTTP/2 连接由多个流共用，不能关闭 socket；读取线程在收到下一帧时检查停止标记"""
+
+
+class PooledTransport:
+    """
+    持有一个长生命周期的 requests.Session (或 HTTP/2 模式下的 httpx.Client)。
+    连接在请求之间保持 keep-alive，并由后台线程在空闲超时后回收。
+    """
+
+    def __init__(self, config=None):
+        self.config = config or TransportConfig.from_env()
+        self._lock = threading.Lock()
+        self._client = None
+        self._active_streams = 0
+        self._last_used = time.monotonic()
+        self._closed = False
+
+        self._reaper = None
+        if self.config.idle_timeout > 0:
+            self._reaper = threading.Thread(target=self._reap_idle_connections, daemon=True)
+            self._reaper.start()
+
+    # --- 客户端创建与回收 ---
+
+    def _create_client(self):
+        if self.config.http2:
+            try:
+                import httpx
+            except ImportError:
+                raise ImportError("CHATBOT_HTTP2=1 需要安装 httpx[http2]：pip install 'httpx[http2]'")
+
+            limits = httpx.Limits(
+                max_connections=self.config.pool_maxsize,
+                max_keepalive_connections=self.config.pool_maxsize,
+                keepalive_expiry=self.config.idle_timeout or None
+            )
+            return httpx.Client(http2=True, limits=limits, timeout=None)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _acquire_client(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("传输层已关闭")
+            if self._client is None:
+                self._client = self._create_client()
+            self._active_streams += 1
+            self._last_used = time.monotonic()
+            return self._client
+
+    def _release_client(self):
+        with self._lock:
+            self._active_streams -= 1
+            self._last_used = time.monotonic()
+
+    def _reap_idle_connections(self):
+        """后台线程：连接池空闲超过 idle_timeout 秒且没有进行中的流时，关闭所有连接"""
+        interval = max(self.config.idle_timeout / 2, 1.0)
+        while not self._closed:
+            time.sleep(interval)
+            with self._lock:
+                idle_for = time.monotonic() - self._last_used
+                if self._client is not None and self._active_streams == 0 and idle_for >= self.config.idle_timeout:
+                    self._client.close()
+                    self._client = None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    # --- 流式请求 ---
+
+    @contextmanager
+    def stream(self, url, headers, json, timeout=60, trace=None):
+        """
+        发送流式 POST 请求，返回带 status_code / text / iter_bytes() / iter_lines() 的响应对象。
+        timeout 可以是秒数，也可以是 (连接超时, 读超时) 元组。
+        trace(事件名, 信息) 在 HTTP/2 模式下作为 httpx 的 trace 扩展，报告建立连接等事件 (requests 不支持，忽略)。
+        正常退出 with 块时读完剩余字节，使连接回到池中复用；异常或提前退出时直接关闭连接。
+        """
+        client = self._acquire_client()
+        try:
+            if self.config.http2:
+                yield from self._stream_http2(client, url, headers, json, timeout, trace)
+            else:
+                yield from self._stream_http1(client, url, headers, json, timeout)
+        finally:
+            self._release_client()
+
+    def _stream_http1(self, session, url, headers, json, timeout):
+        response = _Http1StreamResponse(
+            session.post(url, headers=headers, json=json, stream=True, timeout=timeout)
+        )
+        try:
+            yield response
+            response.drain()
+        finally:
+            response.close()
+
+    def _stream_http2(self, client, url, headers, json, timeout, trace=None):
+        import httpx
+
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        try:
+            extensions = {"trace": trace} if trace is not None else None
+            with client.stream("POST", url, headers=headers, json=json, timeout=timeout,
+                               extensions=extensions) as response:
+                yield _Http2StreamResponse(response)
+                response.read()
+        except httpx.HTTPError as e:
+            raise TransportError(e)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """返回进程内共享的传输层实例 (首次调用时按环境变量创建)"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = PooledTransport()
+        return _transport
+
+
+def configure_transport(config):
+    """用新的配置替换共享传输层，旧的连接池会被关闭"""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = PooledTransport(config)
+        return _transport
@@ -0,0 +1,372 @@
+import asyncio
+import collections
+import os
+import threading
+
+from api_transport import API_URL, TransportConfig, get_transport
+from context_window import estimate_tokens, request_tokens
+from conversation import build_messages
+from rate_limiter import get_rate_limiter
+from retry_policy import RetryPolicy, StreamError, final_error, http_error
+from sse_parser import DeltaDecoder
+
+
+# --- asyncio 流式引擎 ---
+# 所有对话的流式请求共用一个后台事件循环线程，并发数由 FairScheduler 限制，
+# 取代 "每条消息一个 threading.Thread + 一个 socket" 的做法。
+# 事件循环 → Tk 主线程的渲染队列在 tk_bridge.TkEventBridge 中。
+
+
+def _build_request(prompt, api_key, model_name, system_prompt, history=None, partial_response=None):
+    payload = {
+        "model": model_name,
+        "stream": True,
+        "messages": build_messages(prompt, system_prompt, history, partial_response)
+    }
+    headers = {
+        "Accept": "text/event-stream",
+        "Authorization": api_key,
+        "Content-Type": "application/json"
+    }
+    return headers, payload
+
+
+class FairScheduler:
+    """
+    限制同时运行的流的数量；超出上限时在等待的对象 (owner，例如标签页或多模型对比窗口) 中
+    优先放行最久没有轮到的那个，一次提交很多个流的对象不会让其他对话一直排在后面。
+    只在事件循环线程中使用，不需要加锁。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        # owner -> 等待中的 Future 队列 (按开始等待的先后排列)
+        self._waiting = collections.OrderedDict()
+        # owner -> 正在运行的数量；owner -> 最近一次放行的序号 (只保留正在运行或等待中的 owner)
+        self._running = collections.Counter()
+        self._last_served = {}
+        self._sequence = 0
+
+    @property
+    def waiting(self):
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    async def acquire(self, owner=None):
+        if self.active < self.limit and not self._waiting:
+            self._grant(owner)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(owner, collections.deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 刚分到名额就被取消：把名额让给下一个
+                self.release(owner)
+            else:
+                self._discard(owner, waiter)
+            raise
+
+    def release(self, owner=None):
+        self.active -= 1
+        self._running[owner] -= 1
+        if self._running[owner] <= 0:
+            del self._running[owner]
+            if owner not in self._waiting:
+                self._last_served.pop(owner, None)
+        self._wake()
+
+    def _grant(self, owner):
+        self.active += 1
+        self._running[owner] += 1
+        self._sequence += 1
+        self._last_served[owner] = self._sequence
+
+    def _discard(self, owner, waiter):
+        waiters = self._waiting.get(owner)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[owner]
+                if owner not in self._running:
+                    self._last_served.pop(owner, None)
+
+    def _wake(self):
+        while self.active < self.limit and self._waiting:
+            # 最久没有轮到 (或从未轮到) 的 owner 先开始；相同时按开始等待的先后
+            owner = min(self._waiting, key=lambda candidate: self._last_served.get(candidate, 0))
+            waiters = self._waiting[owner]
+            waiter = waiters.popleft()
+            if not waiters:
+                del self._waiting[owner]
+            if not waiter.done():
+                self._grant(owner)
+                waiter.set_result(None)
+
+
+class AsyncStreamEngine:
+    """
+    在单个后台线程中运行 asyncio 事件循环。
+    submit() 可以从任意线程 (包括 Tk 主线程) 调用，返回 concurrent.futures.Future。
+    """
+
+    def __init__(self, max_concurrency=8, config=None, retry_policy=None):
+        self.max_concurrency = max_concurrency
+        self.config = config or TransportConfig.from_env()
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self.scheduler = FairScheduler(max_concurrency)
+        self._thread = threading.Thread(target=self._run_loop, name="chatbot-async-engine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro, on_done=None, owner=None):
+        """
+        把协程交给后台事件循环执行，同时受 max_concurrency 限制；排队时不同 owner 的请求轮流开始。
+        on_done(cancelled) 在协程真正结束后 (包括排队时就被取消) 于事件循环线程中调用一次；
+        与返回的 Future 的回调不同，调用它时协程已经不会再产生任何输出。
+        """
+        return asyncio.run_coroutine_threadsafe(self._bounded(coro, on_done, owner), self._loop)
+
+    async def _bounded(self, coro, on_done=None, owner=None):
+        cancelled = False
+        try:
+            await self.scheduler.acquire(owner)
+            try:
+                return await coro
+            finally:
+                self.scheduler.release(owner)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # 排队期间被取消时协程还没有开始，关闭它以免出现 "never awaited" 警告
+            coro.close()
+            if on_done is not None:
+                on_done(cancelled)
+
+    def close(self):
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # --- 流式对话 ---
+
+    def _get_client(self):
+        """懒加载 httpx.AsyncClient；未安装 httpx 时返回 None，退回线程读取方式"""
+        if self._client is None:
+            try:
+                import httpx
+            except ImportError:
+                return None
+
+            limits = httpx.Limits(
+                max_connections=self.config.pool_maxsize,
+                max_keepalive_connections=self.config.pool_maxsize,
+                keepalive_expiry=self.config.idle_timeout or None
+            )
+            self._client = httpx.AsyncClient(http2=self.config.http2, limits=limits, timeout=None)
+        return self._client
+
+    def warm_up(self):
+        """提前创建 HTTP 客户端 (须在事件循环中调用)，避免首个请求的计时包含客户端初始化开销"""
+        self._get_client()
+
+    async def astream_chat(self, prompt, api_key, model_name, system_prompt, history=None, on_retry=None,
+                           metrics=None):
+        """
+        异步生成器版本的 call_api_stream：逐块 yield 模型返回的文本。
+        history 为此前的 user / assistant 消息列表 (连问模式)。
+        失败时按 self.retry_policy 重试，中途断开时从已输出的内容续写；
+        每次重试前在事件循环中调用 on_retry(第几次失败, 等待秒数, 错误, 是否续写)。
+        metrics 为 turn_metrics.StreamMetrics 时记录连接、首字节和每个文本块的到达时间。
+        每次请求 (包括重试) 发出前先向共享的限流器申请额度，额度不足时在事件循环中等待。
+        必须在引擎的事件循环中迭代 (即在 submit() 提交的协程里使用)。
+        """
+        policy = self.retry_policy
+        limiter = get_rate_limiter()
+        partial_response = ""
+        attempt = 0
+        while True:
+            attempt += 1
+            prompt_tokens = request_tokens(build_messages(prompt, system_prompt, history, partial_response))
+            throttled = limiter.reserve(api_key, model_name, prompt_tokens)
+            if throttled > 0:
+                try:
+                    await asyncio.sleep(throttled)
+                except asyncio.CancelledError:
+                    # 等待期间被停止，请求没有发出：退回预扣的额度
+                    limiter.cancel(api_key, model_name, prompt_tokens)
+                    raise
+            if metrics is not None:
+                metrics.note_throttled(throttled)
+                metrics.start_attempt()
+            received_before = len(partial_response)
+            try:
+                async for content in self._astream_once(prompt, api_key, model_name, system_prompt, history,
+                                                        partial_response, metrics):
+                    if metrics is not None:
+                        metrics.mark_content(content)
+                    partial_response += content
+                    yield content
+                return
+            except StreamError as e:
+                if not policy.should_retry(e, attempt, partial_response):
+                    raise final_error(e, attempt)
+                delay = policy.backoff(attempt, e.retry_after)
+                if on_retry:
+                    on_retry(attempt, delay, e, bool(partial_response))
+                await asyncio.sleep(delay)
+            finally:
+                # 输出的 tokens 在本次请求结束后补扣
+                limiter.settle(api_key, model_name, estimate_tokens(partial_response[received_before:]))
+
+    async def _astream_once(self, prompt, api_key, model_name, system_prompt, history, partial_response,
+                            metrics=None):
+        """发送一次请求；所有失败都转换为 StreamError"""
+        headers, payload = _build_request(prompt, api_key, model_name, system_prompt, history, partial_response)
+        client = self._get_client()
+
+        if client is None:
+            async for content in self._astream_via_thread(headers, payload, metrics):
+                yield content
+            return
+
+        import httpx
+
+        policy = self.retry_policy
+        timeout = httpx.Timeout(policy.read_timeout, connect=policy.connect_timeout)
+        received = False
+        # trace 扩展报告建立 TCP / TLS 连接的时间点
+        extensions = {"trace": metrics.atrace} if metrics is not None else None
+        try:
+            async with client.stream("POST", API_URL, headers=headers, json=payload, timeout=timeout,
+                                     extensions=extensions) as response:
+                if metrics is not None:
+                    metrics.mark_headers()
+                # 按响应头中的限流信息和 429 调整共享限流器
+                get_rate_limiter().observe(headers["Authorization"], payload["model"], response.status_code,
+                                           response.headers)
+                if response.status_code != 200:
+                    error_details = (await response.aread()).decode('utf-8', errors='replace')
+                    raise http_error(response.status_code, response.headers, error_details)
+
+                async for content in self._iter_contents(response.aiter_bytes()):
+                    received = True
+                    yield content
+
+        except httpx.TimeoutException as e:
+            if isinstance(e, httpx.ConnectTimeout):
+                raise StreamError(f"连接超时 ({policy.connect_timeout:g} 秒)", retryable=True)
+            if received:
+                raise StreamError(f"数据流停顿超过 {policy.stall_timeout:g} 秒", retryable=True)
+            raise StreamError(f"等待首字超时 ({policy.first_token_timeout:g} 秒)", retryable=True)
+        except httpx.HTTPError as e:
+            raise StreamError(f"网络连接或请求错误: {e}", retryable=True)
+
+    async def _iter_contents(self, chunks):
+        """
+        把原始字节块交给增量 SSE 解析器取出内容，同时检查超时：第一个文本块必须在 first_token_timeout 内到达，
+        之后相邻两个数据块的间隔不能超过 stall_timeout。
+        """
+        policy = self.retry_policy
+        loop = asyncio.get_running_loop()
+        first_token_deadline = loop.time() + policy.first_token_timeout
+        received = False
+        decoder = DeltaDecoder()
+        chunks = chunks.__aiter__()
+        while not decoder.done:
+            wait = policy.stall_timeout if received else max(first_token_deadline - loop.time(), 0)
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), wait)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                if received:
+                    raise StreamError(f"数据流停顿超过 {policy.stall_timeout:g} 秒", retryable=True)
+                raise StreamError(f"等待首字超时 ({policy.first_token_timeout:g} 秒)", retryable=True)
+
+            for content in decoder.feed(chunk):
+                received = True
+                yield content
+
+    async def _astream_via_thread(self, headers, payload, metrics=None):
+        """没有异步 HTTP 客户端时，在线程池里读取共享连接池的响应，再转交给事件循环"""
+        chunks = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        end = object()
+        # 事件循环一侧超时或放弃时通知读取线程尽快停止
+        stop = threading.Event()
+        policy = self.retry_policy
+        # 正在读取的响应；读取线程读完所有行后清空，之后不能再中止 (连接要回到池中复用)
+        reading = {"response": None}
+        reading_lock = threading.Lock()
+
+        def reader():
+            try:
+                with get_transport().stream(API_URL, headers=headers, json=payload,
+                                            timeout=(policy.connect_timeout, policy.read_timeout),
+                                            trace=metrics.trace if metrics is not None else None) as response:
+                    if metrics is not None:
+                        metrics.mark_headers()
+                    get_rate_limiter().observe(headers["Authorization"], payload["model"], response.status_code,
+                                               response.headers)
+                    if response.status_code != 200:
+                        raise http_error(response.status_code, response.headers, response.text)
+                    with reading_lock:
+                        reading["response"] = response
+                    for chunk in response.iter_bytes():
+                        if stop.is_set():
+                            # 抛出异常而不是 break：退出 with 块时直接关闭连接，不再读完剩余内容
+                            raise StreamError("读取已取消")
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                    with reading_lock:
+                        reading["response"] = None
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, end)
+
+        async def queued_chunks():
+            while True:
+                item = await chunks.get()
+                if item is end:
+                    return
+                if isinstance(item, StreamError):
+                    raise item
+                if isinstance(item, Exception):
+                    raise StreamError(f"网络连接或请求错误: {item}", retryable=True)
+                yield item
+
+        loop.run_in_executor(None, reader)
+        finished = False
+        try:
+            async for content in self._iter_contents(queued_chunks()):
+                yield content
+            finished = True
+        finally:
+            stop.set()
+            if not finished:
+                # 超时、出错或被取消 (用户点击停止)：直接中止阻塞中的读取，立即释放连接
+                with reading_lock:
+                    if reading["response"] is not None:
+                        reading["response"].abort()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """返回进程内共享的流式引擎 (首次调用时启动后台事件循环，并发上限由 CHATBOT_MAX_STREAMS 设置)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncStreamEngine(max_concurrency=int(os.environ.get("CHATBOT_MAX_STREAMS", 8)))
+        return _engine
@@ -0,0 +1,195 @@
+"""
+无界面批处理入口：把 JSONL 文件中的问题批量发送给模型，结果逐条写入输出 JSONL。
+
+输入每行一个 JSON 对象：
+    {"prompt": "...", "model": "gpt-5.1", "scenario": "程序代码助手", "id": "可选的唯一标识"}
+model / scenario 省略时使用命令行参数 --model / --scenario 的值。
+
+用法:
+    python batch_cli.py prompts.jsonl -o results.jsonl -c 4 --api-key "Bearer sk-..."
+    python batch_cli.py prompts.jsonl --profile    # 同时生成性能分析报告
+    python batch_cli.py prompts.jsonl -c 16 --rate-limits "gpt-5.1=500/200000,*=60/-"
+
+输出文件中已经成功完成的条目在重新运行时会被跳过，因此中断后可以直接重跑续传。
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from api_transport import TransportConfig, configure_transport
+from chat_api import call_api_stream
+from chat_config import MODEL_LIST, SYSTEM_PROMPT_MAP
+from profiling import ProfileSession
+from rate_limiter import RateLimiter, configure_rate_limiter, parse_limits, parse_model_limits
+from turn_metrics import StreamMetrics
+
+
+def load_items(input_path, default_model, default_scenario):
+    """读取输入 JSONL，为每一条补全 model / scenario 并分配稳定的 id"""
+    items = []
+    seen = {}
+    with open(input_path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{input_path} 第 {line_no} 行不是合法的 JSON: {e}")
+            if not data.get("prompt"):
+                raise ValueError(f"{input_path} 第 {line_no} 行缺少 prompt 字段")
+
+            item = {
+                "prompt": data["prompt"],
+                "model": data.get("model") or default_model,
+                "scenario": data.get("scenario") or default_scenario
+            }
+            if item["scenario"] not in SYSTEM_PROMPT_MAP:
+                raise ValueError(f"{input_path} 第 {line_no} 行的场景无效: {item['scenario']}")
+
+            item_id = data.get("id")
+            if item_id is None:
+                # 没有显式 id 时按内容生成，相同内容重复出现时追加序号
+                digest = hashlib.sha256(
+                    json.dumps([item["prompt"], item["model"], item["scenario"]], ensure_ascii=False).encode('utf-8')
+                ).hexdigest()[:16]
+                seen[digest] = seen.get(digest, 0) + 1
+                item_id = digest if seen[digest] == 1 else f"{digest}-{seen[digest]}"
+            item["id"] = str(item_id)
+            items.append(item)
+    return items
+
+
+def load_completed_ids(output_path):
+    """读取已有输出中成功完成的条目 id；失败的条目和被截断的半行会在重跑时重新执行"""
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get("error"):
+                completed.add(record.get("id"))
+    return completed
+
+
+def run_item(item, api_key):
+    """执行一条请求，返回带计时信息的结果记录 (metrics 为连接、首字节、文本块间隔和生成速度等延迟指标)"""
+    record = {
+        "id": item["id"],
+        "model": item["model"],
+        "scenario": item["scenario"],
+        "prompt": item["prompt"],
+        "started_at": datetime.now().isoformat(timespec='seconds')
+    }
+    chunks = []
+    metrics = StreamMetrics(item["model"], item["scenario"])
+    retries = []
+    try:
+        for chunk in call_api_stream(item["prompt"], api_key, item["model"], SYSTEM_PROMPT_MAP[item["scenario"]],
+                                     on_retry=lambda attempt, delay, e, resuming: retries.append(str(e)),
+                                     metrics=metrics):
+            chunks.append(chunk)
+        record["error"] = None
+        metrics.finish()
+    except Exception as e:
+        record["error"] = str(e)
+        metrics.finish("error", e)
+
+    record["response"] = ''.join(chunks)
+    record.update(metrics.timing())
+    record["chunks"] = len(chunks)
+    record["retries"] = len(retries)
+    latency = metrics.as_record()
+    record["metrics"] = {key: latency[key] for key in ("throttled_ms", "connect_ms", "ttfb_ms", "gap_p50_ms",
+                                                       "gap_p95_ms", "gap_max_ms", "tokens", "tokens_per_s")}
+    return record
+
+
+def run_batch(items, output_path, api_key, concurrency):
+    """并发执行所有未完成的条目，每完成一条立即追加写入输出文件"""
+    completed = load_completed_ids(output_path)
+    pending = [item for item in items if item["id"] not in completed]
+    print(f"共 {len(items)} 条，已完成 {len(items) - len(pending)} 条，本次执行 {len(pending)} 条 (并发 {concurrency})")
+    if not pending:
+        return 0
+
+    failures = 0
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_item, item, api_key) for item in pending]
+        for done_count, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+            status = "失败: " + record["error"] if record["error"] else "完成"
+            if record["error"]:
+                failures += 1
+            print(f"[{done_count}/{len(pending)}] {record['id']} ({record['model']}) "
+                  f"{record['duration_ms']:.0f} ms {status}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量发送 JSONL 中的问题 (无界面)")
+    parser.add_argument("input", type=Path, help="输入 JSONL 文件，每行包含 prompt / model / scenario")
+    parser.add_argument("-o", "--output", type=Path, help="输出 JSONL 文件 (默认: <输入文件名>.out.jsonl)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行的请求数 (默认 4)")
+    parser.add_argument("--api-key", default=os.environ.get("CHATBOT_API_KEY"),
+                        help="API Key，默认读取环境变量 CHATBOT_API_KEY")
+    parser.add_argument("--model", default=MODEL_LIST[0], help="条目未指定 model 时使用的模型")
+    parser.add_argument("--scenario", default=list(SYSTEM_PROMPT_MAP.keys())[0],
+                        help="条目未指定 scenario 时使用的场景")
+    parser.add_argument("--rate-limits", default=os.environ.get("CHATBOT_RATE_LIMITS", ""),
+                        help="每个模型的 RPM/TPM 上限，例如 \"gpt-5.1=500/200000,*=60/-\" (默认读取 CHATBOT_RATE_LIMITS)")
+    parser.add_argument("--key-rate-limit", default=os.environ.get("CHATBOT_KEY_RATE_LIMIT"),
+                        help="API Key 跨所有模型的 RPM/TPM 总上限 (默认读取 CHATBOT_KEY_RATE_LIMIT)")
+    parser.add_argument("--profile", action="store_true",
+                        help="分析各线程的热点函数和内存增长，报告写入输出文件所在目录 (也可设置 CHATBOT_PROFILE=1)")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("请通过 --api-key 或环境变量 CHATBOT_API_KEY 提供 API Key")
+    if args.concurrency < 1:
+        parser.error("--concurrency 至少为 1")
+
+    api_key = args.api_key if args.api_key.startswith("Bearer ") else f"Bearer {args.api_key}"
+    output_path = args.output or args.input.with_suffix(".out.jsonl")
+
+    try:
+        items = load_items(args.input, args.model, args.scenario)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+
+    # 连接池至少要容纳全部并发请求，否则多出的请求会反复新建连接
+    config = TransportConfig.from_env()
+    config.pool_maxsize = max(config.pool_maxsize, args.concurrency)
+    configure_transport(config)
+    # 所有并发请求共用一个限流器，额度不足时在发送前等待，而不是被服务端以 429 拒绝
+    configure_rate_limiter(RateLimiter(
+        model_limits=parse_model_limits(args.rate_limits),
+        key_limit=parse_limits(args.key_rate_limit) if args.key_rate_limit else None
+    ))
+
+    profiler = ProfileSession.from_env(["--profile"] if args.profile else None)
+    profiler.start()
+    failures = profiler.run(run_batch, items, output_path, api_key, args.concurrency)
+    report_dir = profiler.stop(output_path.parent)
+    if report_dir is not None:
+        print(f"性能分析报告已写入 {report_dir}")
+    print(f"结果已写入 {output_path}" + (f"，{failures} 条失败 (重新运行即可重试)" if failures else ""))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+SSE 解析微基准：对同一段大回复，比较旧的逐行解析与增量字节解析器 (sse_parser.DeltaDecoder) 的 deltas/s。
+
+  旧路径      requests 的 iter_lines() → decode → startswith("data:") → strip → json.loads → .get() 链
+  新路径      原始字节块直接喂给 DeltaDecoder，分别使用 orjson (已安装时) 和标准库 json
+
+默认按真实 OpenAI 兼容接口的格式 (id / object / created / model / choices / finish_reason) 生成回复，
+每个 SSE 事件一个网络数据块；也可以用 --input 读取录制的原始流，例如:
+    curl -N https://.../v1/chat/completions -H ... -d '{"stream": true, ...}' > capture.sse
+
+用法:
+    python benchmarks/bench_sse_parser.py
+    python benchmarks/bench_sse_parser.py --total-chars 5000000 --payload code --repeat 5
+    python benchmarks/bench_sse_parser.py --input capture.sse --chunk-bytes 1400
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests
+
+from sse_parser import DeltaDecoder, select_json_loads
+from sse_server import PAYLOADS, StandInSettings
+
+
+def record_stream(total_chars, chunk_size, payload):
+    """生成一段完整的流式回复，返回按事件切分的原始字节块列表"""
+    base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000,
+            "model": "bench-model", "system_fingerprint": "fp_bench"}
+
+    def event(delta, finish_reason=None):
+        body = dict(base, choices=[{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}])
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode('utf-8')
+
+    settings = StandInSettings(total_chars=total_chars, chunk_size=chunk_size, payload=payload)
+    chunks = [event({"role": "assistant", "content": ""})]
+    chunks += [event({"content": delta}) for delta in settings.iter_deltas()]
+    chunks.append(event({}, "stop"))
+    chunks.append(b"data: [DONE]\n\n")
+    return chunks
+
+
+def load_capture(path, chunk_bytes):
+    """读取录制的原始 SSE 流；chunk_bytes 为 0 时按事件 (空行) 切分，否则按固定字节数切分"""
+    data = Path(path).read_bytes()
+    if chunk_bytes:
+        return [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+    events = data.replace(b"\r\n", b"\n").split(b"\n\n")
+    return [event + b"\n\n" for event in events if event]
+
+
+class _RecordedRaw:
+    """让 requests.Response 从录制的数据块读取，与 urllib3 逐个返回 HTTP chunk 的行为一致"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def stream(self, chunk_size, decode_content=True):
+        return iter(self._chunks)
+
+
+def parse_legacy(chunks):
+    """原 call_api_stream 中的解析循环"""
+    response = requests.Response()
+    response.raw = _RecordedRaw(chunks)
+    contents = []
+    for line in response.iter_lines():
+        if line:
+            line_str = line.decode('utf-8')
+            if line_str.startswith("data:"):
+                data_str = line_str[5:].strip()
+                if data_str == "[DONE]":
+                    break
+                try:
+                    data = json.loads(data_str)
+                    content = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                    if content:
+                        contents.append(content)
+                except json.JSONDecodeError:
+                    continue
+    return contents
+
+
+def parse_incremental(chunks, loads):
+    decoder = DeltaDecoder(loads)
+    contents = []
+    for chunk in chunks:
+        contents += decoder.feed(chunk)
+        if decoder.done:
+            break
+    return contents
+
+
+def measure(name, fn, chunks, repeat, baseline=None):
+    """取 repeat 次中最快的一次，返回 (deltas/s, 文本)；与 timeit 一样计时期间关闭垃圾回收，减少抖动"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            contents = fn(chunks)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(contents) / best
+    speedup = f"  ({rate / baseline:.2f}x)" if baseline else ""
+    size_mb = sum(len(chunk) for chunk in chunks) / 1024 / 1024
+    print(f"{name:<28} {len(contents):>9} deltas  {best * 1000:9.1f} ms  {rate:>12,.0f} deltas/s  "
+          f"{size_mb / best:7.1f} MB/s{speedup}")
+    return rate, "".join(contents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 解析微基准")
+    parser.add_argument("--total-chars", type=int, default=2_000_000, help="生成的回复字符数")
+    parser.add_argument("--chunk-size", type=int, default=4, help="每个增量的字符数")
+    parser.add_argument("--payload", choices=sorted(PAYLOADS), default="mixed", help="回复内容类型")
+    parser.add_argument("--input", help="录制的原始 SSE 流文件 (设置后忽略以上三项)")
+    parser.add_argument("--chunk-bytes", type=int, default=0, help="--input 的切分字节数，0 表示每个事件一块")
+    parser.add_argument("--repeat", type=int, default=3, help="每种解析方式的运行次数 (取最快一次)")
+    args = parser.parse_args()
+
+    if args.input:
+        chunks = load_capture(args.input, args.chunk_bytes)
+    else:
+        chunks = record_stream(args.total_chars, args.chunk_size, args.payload)
+    print(f"{len(chunks)} 个数据块，共 {sum(len(chunk) for chunk in chunks) / 1024 / 1024:.1f} MB")
+
+    baseline, expected = measure("旧路径 (iter_lines + json)", parse_legacy, chunks, args.repeat)
+    runs = [select_json_loads("json")]
+    fast_loads, backend = select_json_loads()
+    if backend != "json":
+        runs.append((fast_loads, backend))
+    for loads, backend in runs:
+        name = f"增量解析 + {backend}"
+        _rate, text = measure(name, lambda chunks: parse_incremental(chunks, loads), chunks, args.repeat, baseline)
+        if text != expected:
+            print(f"  警告：{name} 的输出与旧路径不一致")
+
+
+if __name__ == '__main__':
+    main()
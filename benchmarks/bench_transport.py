@@ -0,0 +1,105 @@
+"""
+对比 "每轮新建连接 (requests.post)" 与 "共享 keep-alive 连接池 (api_transport)" 的首字延迟 (TTFT)。
+
+用法:
+    python benchmarks/bench_transport.py                # 本地 HTTP，只体现 TCP 握手的节省
+    python benchmarks/bench_transport.py --tls          # 本地 HTTPS (自签名证书)，体现 TCP + TLS 握手的节省
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests
+
+from api_transport import PooledTransport, TransportConfig
+from sse_server import start_server
+
+HEADERS = {"Accept": "text/event-stream", "Content-Type": "application/json"}
+PAYLOAD = {"model": "bench", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def _read_stream(response, start):
+    """读取整个流，返回首个数据块到达的耗时"""
+    ttft = None
+    for line in response.iter_lines():
+        if line and line.startswith(b"data:"):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            if line[5:].strip() == b"[DONE]":
+                break
+    return ttft
+
+
+def bench_fresh_connection(url, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        response = requests.post(url, headers=HEADERS, json=PAYLOAD, stream=True, timeout=60)
+        samples.append(_read_stream(response, start))
+        response.close()
+    return samples
+
+
+def bench_pooled(url, rounds):
+    transport = PooledTransport(TransportConfig(idle_timeout=0))
+    samples = []
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            with transport.stream(url, headers=HEADERS, json=PAYLOAD, timeout=60) as response:
+                samples.append(_read_stream(response, start))
+    finally:
+        transport.close()
+    return samples
+
+
+def _make_self_signed_cert(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True
+    )
+    return certfile, keyfile
+
+
+def _report(name, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{name:<24} TTFT 中位数 {statistics.median(ms):7.2f} ms | 平均 {statistics.mean(ms):7.2f} ms | "
+          f"最大 {max(ms):7.2f} ms")
+    return statistics.median(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接池握手节省基准测试")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--tls", action="store_true", help="使用自签名证书的 HTTPS 服务器")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile = keyfile = None
+        if args.tls:
+            certfile, keyfile = _make_self_signed_cert(tmp)
+            os.environ["REQUESTS_CA_BUNDLE"] = certfile
+
+        server, url = start_server(chunks=20, certfile=certfile, keyfile=keyfile)
+        try:
+            fresh = _report("每轮新建连接", bench_fresh_connection(url, args.rounds))
+            pooled = _report("共享连接池 (keep-alive)", bench_pooled(url, args.rounds))
+        finally:
+            server.shutdown()
+
+    print(f"每轮节省约 {fresh - pooled:.2f} ms ({(1 - pooled / fresh) * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
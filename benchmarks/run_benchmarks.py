@@ -0,0 +1,382 @@
+"""
+端到端流式基准测试：全部针对本地 SSE 替身服务器，不访问真实 API。
+
+  ttft     通过 call_api_stream 连续发送请求，统计首字延迟 p50 / p95 / p99
+  parse    一次大回复 (无延迟) 的解析吞吐量：deltas/s 与 KB/s
+  render   对话标签页的渲染路径 (ConversationTab._process_stream_chunk) 每个数据块的耗时，以及 300 轮长会话中
+           单块耗时和控件行数是否保持不变；需要图形环境；
+           无显示器时用 xvfb-run 运行:  xvfb-run -a python benchmarks/run_benchmarks.py
+  startup  冷启动：每次在新的解释器进程中导入 chat_app 并创建窗口，统计导入耗时、窗口就绪耗时
+           (有显示器时) 和整个进程的耗时，以及启动时是否已经加载了 HTTP 客户端 / asyncio / sqlite3
+  restore  会话恢复：读出一个长对话的会话日志的耗时，以及 (有显示器时) 恢复该对话的窗口就绪耗时
+           和回复区实际渲染的行数 (应只渲染最后几轮，与对话长度无关)
+
+每次运行的结果连同当前 git 提交追加到 benchmarks/results/history.jsonl (本机记录，已在 .gitignore 中忽略)，
+并与上一次记录对比，方便发现跨提交的性能回退。
+
+用法:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --only ttft parse --rounds 200
+    python benchmarks/run_benchmarks.py --only startup --startup-runs 20
+    python benchmarks/run_benchmarks.py --only restore --restore-turns 2000
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import chat_api
+from sse_server import StandInSettings, start_server
+
+RESULTS_FILE = Path(__file__).resolve().parent / "results" / "history.jsonl"
+
+# 比上一次记录变差超过该比例时标记为回退
+REGRESSION_THRESHOLD = 0.10
+
+# 数值越大越好的指标 (其余指标都是越小越好)
+HIGHER_IS_BETTER = ("deltas_per_s", "kb_per_s")
+
+# 启动时不应该加载的重量级模块 (应在第一次发送消息或窗口显示后的后台预加载中导入)
+HEAVY_MODULES = ("requests", "httpx", "asyncio", "sqlite3")
+
+# 在新进程中运行：导入界面模块、创建窗口并处理完首批事件，输出各阶段耗时 (毫秒)
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import tkinter as tk
+import chat_app
+result = {"import_ms": (time.perf_counter() - start) * 1000}
+try:
+    root = tk.Tk()
+except tk.TclError:
+    root = None
+if root is not None:
+    chat_app.AIChatApp(root)
+    result["heavy"] = [name for name in HEAVY if name in sys.modules]
+    root.update()
+    result["window_ms"] = (time.perf_counter() - start) * 1000
+    root.destroy()
+else:
+    result["heavy"] = [name for name in HEAVY if name in sys.modules]
+print(json.dumps(result))
+"""
+
+
+def percentile(samples, pct):
+    """最近秩法百分位数"""
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _with_session_dir(directory, fn):
+    """开启会话恢复并在指定的会话日志目录下运行 fn，不读写用户自己的会话"""
+    settings = {"CHATBOT_SESSION_RESTORE": "1", "CHATBOT_SESSION_DIR": directory}
+    original = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    try:
+        return fn()
+    finally:
+        for name, value in original.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+def _with_server(settings, fn):
+    server, url = start_server(**settings)
+    original_url = chat_api.API_URL
+    chat_api.API_URL = url
+    try:
+        return fn()
+    finally:
+        chat_api.API_URL = original_url
+        server.shutdown()
+
+
+# --- 各项基准 ---
+
+def bench_ttft(rounds):
+    def run():
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            first = None
+            # 读完整个流，连接才会回到连接池，和真实对话的连续轮次一致
+            for _chunk in chat_api.call_api_stream("benchmark", "Bearer bench", "bench", "system"):
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+            samples.append(first)
+        return samples
+
+    samples = _with_server({"chunks": 20, "first_token_delay": 0.0}, run)
+    return {
+        "ttft_p50_ms": round(percentile(samples, 50), 3),
+        "ttft_p95_ms": round(percentile(samples, 95), 3),
+        "ttft_p99_ms": round(percentile(samples, 99), 3)
+    }
+
+
+def bench_parse(total_chars):
+    def run():
+        start = time.perf_counter()
+        deltas = 0
+        size = 0
+        for chunk in chat_api.call_api_stream("benchmark", "Bearer bench", "bench", "system"):
+            deltas += 1
+            size += len(chunk.encode('utf-8'))
+        return deltas, size, time.perf_counter() - start
+
+    deltas, size, elapsed = _with_server({"total_chars": total_chars, "chunk_size": 4, "payload": "mixed"}, run)
+    return {
+        "deltas_per_s": round(deltas / elapsed),
+        "kb_per_s": round(size / 1024 / elapsed, 1)
+    }
+
+
+def bench_render(total_chars):
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("  跳过 render：没有可用的显示器 (请使用 xvfb-run -a 运行)")
+        return {}
+
+    import chat_app as frontend
+    from turn_metrics import StreamMetrics
+
+    root.withdraw()
+    results = {}
+    session_dir = tempfile.TemporaryDirectory()
+    os.environ["CHATBOT_SESSION_DIR"] = session_dir.name
+    try:
+        for payload in ("plain", "bold", "code", "mixed"):
+            window = frontend.AIChatApp(root)
+            tab = window.current_tab
+            tab.stream_metrics = StreamMetrics("bench")
+            deltas = list(StandInSettings(total_chars=total_chars, chunk_size=6, payload=payload).iter_deltas())
+            samples = []
+            for delta in deltas:
+                start = time.perf_counter()
+                tab._process_stream_chunk(delta)
+                root.update_idletasks()
+                samples.append((time.perf_counter() - start) * 1e6)
+
+            tenth = max(len(samples) // 10, 1)
+            early = sum(samples[:tenth]) / tenth
+            late = sum(samples[-tenth:]) / tenth
+            results[f"render_{payload}_mean_us"] = round(sum(samples) / len(samples), 1)
+            results[f"render_{payload}_p95_us"] = round(percentile(samples, 95), 1)
+            # 末尾 10% 与开头 10% 的单块耗时之比；明显大于 1 说明渲染开销随对话长度增长
+            results[f"render_{payload}_growth"] = round(late / early, 2)
+            window.bridge.close()
+            for child in root.winfo_children():
+                child.destroy()
+
+        # 长会话：逐轮经过 TranscriptView，超过保留轮数后每个数据块的耗时应该保持不变
+        window = frontend.AIChatApp(root)
+        tab = window.current_tab
+        tab.stream_metrics = StreamMetrics("bench")
+        deltas = list(StandInSettings(total_chars=2000, chunk_size=6, payload="mixed").iter_deltas())
+        turn_means = []
+        for turn in range(300):
+            tab.transcript.begin_turn(f"问题 {turn}", "bench", "bench")
+            tab.markdown.reset()
+            tab.current_ai_response = ""
+            start = time.perf_counter()
+            for delta in deltas:
+                tab._process_stream_chunk(delta)
+                root.update_idletasks()
+            turn_means.append((time.perf_counter() - start) * 1e6 / len(deltas))
+            tab._flush_markdown()
+            tab._end_transcript_turn()
+        tenth = len(turn_means) // 10
+        results["render_session_mean_us"] = round(sum(turn_means) / len(turn_means), 1)
+        results["render_session_growth"] = round(sum(turn_means[-tenth:]) / sum(turn_means[:tenth]), 2)
+        results["render_session_lines"] = int(tab.output_text.index("end-1c").split(".")[0])
+        window.bridge.close()
+    finally:
+        root.destroy()
+        del os.environ["CHATBOT_SESSION_DIR"]
+        session_dir.cleanup()
+    return results
+
+
+def bench_startup(runs):
+    probe = f"HEAVY = {HEAVY_MODULES!r}\n" + _STARTUP_PROBE
+    # 不继承分析开关，避免测到 cProfile 的开销；会话日志使用空目录 (没有要恢复的对话)
+    env = {name: value for name, value in os.environ.items() if name != "CHATBOT_PROFILE"}
+    session_dir = tempfile.TemporaryDirectory()
+    env["CHATBOT_SESSION_DIR"] = session_dir.name
+    imports, windows, processes, heavy = [], [], [], set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=env, capture_output=True,
+                                text=True, check=True).stdout
+        processes.append((time.perf_counter() - start) * 1000)
+        result = json.loads(output.splitlines()[-1])
+        imports.append(result["import_ms"])
+        if "window_ms" in result:
+            windows.append(result["window_ms"])
+        heavy.update(result["heavy"])
+    session_dir.cleanup()
+
+    if not windows:
+        print("  startup：没有可用的显示器，只统计导入耗时 (请使用 xvfb-run -a 运行以测量窗口就绪耗时)")
+    if heavy:
+        print(f"  startup：启动时已加载 {', '.join(sorted(heavy))}")
+    results = {
+        "startup_import_p50_ms": round(percentile(imports, 50), 1),
+        "startup_process_p50_ms": round(percentile(processes, 50), 1),
+        "startup_heavy_modules": len(heavy)
+    }
+    if windows:
+        results["startup_window_p50_ms"] = round(percentile(windows, 50), 1)
+        results["startup_window_p95_ms"] = round(percentile(windows, 95), 1)
+    return results
+
+
+def bench_restore(turns, runs):
+    import tkinter as tk
+    from session_log import SessionLog
+
+    response = "".join(StandInSettings(total_chars=2000, chunk_size=50, payload="mixed").iter_deltas())
+    with tempfile.TemporaryDirectory() as directory:
+        log = SessionLog(directory)
+        session_id = log.new_id()
+        for number in range(turns):
+            log.append(session_id, "bench", "bench", f"问题 {number}", response)
+        log.save_tabs([{"id": session_id, "model": "bench", "scenario": "bench", "continuous": True}], 0)
+        log.close()
+
+        loads = []
+        for _ in range(runs):
+            log = SessionLog(directory)
+            start = time.perf_counter()
+            saved_tabs, _current = log.load()
+            loads.append((time.perf_counter() - start) * 1000)
+            log.close()
+        assert len(saved_tabs[0]["turns"]) == turns
+        results = {
+            "restore_load_p50_ms": round(percentile(loads, 50), 2),
+            "restore_load_p95_ms": round(percentile(loads, 95), 2)
+        }
+
+        try:
+            root = tk.Tk()
+        except tk.TclError:
+            print("  restore：没有可用的显示器，只统计读取日志的耗时 (请使用 xvfb-run -a 运行)")
+            return results
+
+        import chat_app
+
+        def open_window():
+            start = time.perf_counter()
+            window = chat_app.AIChatApp(root)
+            root.update()
+            elapsed = (time.perf_counter() - start) * 1000
+            lines = int(window.current_tab.output_text.index("end-1c").split(".")[0])
+            window.bridge.close()
+            window.session_log.close()
+            return elapsed, lines
+
+        try:
+            results["restore_window_ms"], results["restore_rendered_lines"] = _with_session_dir(directory, open_window)
+        finally:
+            root.destroy()
+    return results
+
+
+# --- 结果记录与对比 ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _load_previous():
+    if not RESULTS_FILE.exists():
+        return None
+    lines = RESULTS_FILE.read_text(encoding='utf-8').splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def report(results, previous):
+    print()
+    print(f"{'指标':<28}{'本次':>12}{'上次':>12}{'变化':>10}")
+    for name, value in results.items():
+        old = (previous or {}).get("results", {}).get(name)
+        if old in (None, 0):
+            print(f"{name:<28}{value:>12}{'-':>12}")
+            continue
+        change = (value - old) / old
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = "  <-- 回退" if worse > REGRESSION_THRESHOLD and not name.endswith("_growth") else ""
+        print(f"{name:<28}{value:>12}{old:>12}{change * 100:>+9.1f}%{flag}")
+    if previous:
+        print(f"\n对比基准: {previous['commit']} ({previous['timestamp']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 SSE 替身服务器上的端到端流式基准测试")
+    parser.add_argument("--only", nargs="+", choices=("ttft", "parse", "render", "startup", "restore"),
+                        help="只运行指定的基准")
+    parser.add_argument("--rounds", type=int, default=100, help="TTFT 请求次数")
+    parser.add_argument("--parse-chars", type=int, default=2_000_000, help="解析吞吐量测试的回复字符数")
+    parser.add_argument("--render-chars", type=int, default=60_000, help="渲染测试每种负载的字符数")
+    parser.add_argument("--startup-runs", type=int, default=10, help="冷启动测试的进程数")
+    parser.add_argument("--restore-turns", type=int, default=1000, help="会话恢复测试的对话轮数")
+    parser.add_argument("--no-save", action="store_true", help="不写入 results/history.jsonl")
+    args = parser.parse_args()
+
+    selected = args.only or ("ttft", "parse", "render", "startup", "restore")
+    results = {}
+    if "ttft" in selected:
+        print("运行 ttft ...")
+        results.update(bench_ttft(args.rounds))
+    if "parse" in selected:
+        print("运行 parse ...")
+        results.update(bench_parse(args.parse_chars))
+    if "render" in selected:
+        print("运行 render ...")
+        results.update(bench_render(args.render_chars))
+    if "startup" in selected:
+        print("运行 startup ...")
+        results.update(bench_startup(args.startup_runs))
+    if "restore" in selected:
+        print("运行 restore ...")
+        results.update(bench_restore(args.restore_turns, args.startup_runs))
+
+    previous = _load_previous()
+    report(results, previous)
+
+    if not args.no_save:
+        record = {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results
+        }
+        RESULTS_FILE.parent.mkdir(exist_ok=True)
+        with RESULTS_FILE.open('a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"结果已追加到 {RESULTS_FILE.relative_to(ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+本地 OpenAI 兼容的 SSE 替身服务器，用于在不访问 bltcy API 的情况下做基准测试。
+
+用法:
+    python benchmarks/sse_server.py --port 8765
+    python benchmarks/sse_server.py --port 8765 --payload code --chunk-size 16 --delay 0.01
+    python benchmarks/sse_server.py --port 8765 --error-rate 0.2 --error-status 429 --abort-rate 0.1
+    python benchmarks/sse_server.py --port 8765 --stall-rate 0.3 --stall-seconds 40
+    python benchmarks/sse_server.py --port 8765 --certfile cert.pem --keyfile key.pem   # HTTPS
+
+把前端或批处理入口指向替身服务器:
+    CHATBOT_API_URL=http://127.0.0.1:8765/v1/chat/completions python main.py
+"""
+import argparse
+import json
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 各类负载的模板文本，按 chunk_size 循环切片生成数据块
+PAYLOADS = {
+    "plain": "The quick brown fox jumps over the lazy dog. 敏捷的棕色狐狸跳过了懒狗。",
+    "code": "```python\ndef fibonacci(n):\n    a, b = 0, 1\n    for _ in range(n):\n        a, b = b, a + b\n"
+            "    return a\n```\n",
+    "bold": "这是 **一段粗体** 文本，接着是 **another bold phrase** 和普通文字。",
+    "mixed": "## 小标题\n- 列表项 **重点** 和 `inline_code()`\n1. 第一步\n```js\nconsole.log('hi');\n```\n"
+             "普通段落，包含 **粗体** 与 `代码`。\n"
+}
+
+
+class StandInSettings:
+    """替身服务器的行为配置，所有请求共用"""
+
+    def __init__(self, chunks=20, chunk_size=8, total_chars=None, delay=0.0, first_token_delay=0.0,
+                 payload="plain", error_rate=0.0, error_status=500, abort_rate=0.0, stall_rate=0.0,
+                 stall_seconds=5.0, seed=None):
+        if payload not in PAYLOADS:
+            raise ValueError(f"未知的负载类型: {payload}")
+        if total_chars:
+            chunks = -(-total_chars // chunk_size)
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.first_token_delay = first_token_delay
+        self.payload = payload
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.abort_rate = abort_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def roll(self, rate):
+        with self._random_lock:
+            return rate > 0 and self._random.random() < rate
+
+    def iter_deltas(self):
+        template = PAYLOADS[self.payload]
+        position = 0
+        for _ in range(self.chunks):
+            piece = ""
+            while len(piece) < self.chunk_size:
+                take = min(self.chunk_size - len(piece), len(template) - position)
+                piece += template[position:position + take]
+                position = (position + take) % len(template)
+            yield piece
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 + chunked 编码，客户端才能在同一连接上发送下一次请求
+    protocol_version = "HTTP/1.1"
+    # 与真实 SSE 服务一样关闭 Nagle，否则复用连接上的小包会被延迟 ACK 拖慢约 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        try:
+            self._handle_post()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端超时或取消后主动断开，属于正常情况
+            self.close_connection = True
+
+    def _handle_post(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        settings = self.server.settings
+
+        if settings.roll(settings.error_rate):
+            self._send_error(settings.error_status)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        if settings.first_token_delay:
+            time.sleep(settings.first_token_delay)
+
+        abort_at = settings.chunks // 2 if settings.roll(settings.abort_rate) else None
+        stall_at = settings.chunks // 2 if settings.roll(settings.stall_rate) else None
+        for i, delta in enumerate(settings.iter_deltas()):
+            if i == abort_at:
+                # 模拟流中途断开：不发送 chunked 结束标记直接关闭连接
+                self.close_connection = True
+                return
+            if i == stall_at:
+                # 模拟数据流停顿：连接保持打开但长时间没有数据
+                time.sleep(settings.stall_seconds)
+            payload = {"choices": [{"delta": {"content": delta}}]}
+            self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            if settings.delay:
+                time.sleep(settings.delay)
+
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _send_error(self, status):
+        body = json.dumps({"error": {"message": "injected error", "code": status}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_server(host="127.0.0.1", port=0, certfile=None, keyfile=None, **settings):
+    """在后台线程中启动服务器，返回 (server, url)；settings 见 StandInSettings"""
+    server = ThreadingHTTPServer((host, port), SSEHandler)
+    server.daemon_threads = True
+    server.settings = StandInSettings(**settings)
+
+    scheme = "http"
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"{scheme}://{host}:{server.server_address[1]}/v1/chat/completions"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地 SSE 替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chunks", type=int, default=20, help="每个回复的数据块数量")
+    parser.add_argument("--chunk-size", type=int, default=8, help="每个数据块的字符数")
+    parser.add_argument("--total-chars", type=int, help="回复总字符数 (设置后覆盖 --chunks)")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个数据块之间的延迟 (秒)")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="首个数据块之前的延迟 (秒)")
+    parser.add_argument("--payload", choices=sorted(PAYLOADS), default="plain", help="回复内容类型")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接返回错误状态码的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="注入的错误状态码 (429 会附带 Retry-After)")
+    parser.add_argument("--abort-rate", type=float, default=0.0, help="流到一半时断开连接的请求比例")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="流到一半时停顿的请求比例")
+    parser.add_argument("--stall-seconds", type=float, default=5.0, help="停顿的秒数")
+    parser.add_argument("--seed", type=int, help="错误注入的随机种子")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    server, url = start_server(
+        args.host, args.port, args.certfile, args.keyfile,
+        chunks=args.chunks, chunk_size=args.chunk_size, total_chars=args.total_chars, delay=args.delay,
+        first_token_delay=args.first_token_delay, payload=args.payload, error_rate=args.error_rate,
+        error_status=args.error_status, abort_rate=args.abort_rate, stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds, seed=args.seed
+    )
+    print(f"SSE 替身服务器已启动: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
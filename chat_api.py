@@ -0,0 +1,115 @@
+import time
+
+import requests
+
+from api_transport import API_URL, get_transport
+from context_window import estimate_tokens, request_tokens
+from conversation import build_messages
+from rate_limiter import get_rate_limiter
+from retry_policy import RetryPolicy, StreamError, final_error, http_error
+from sse_parser import DeltaDecoder
+
+
+# --- API 调用函数 (新增 system_prompt 参数) ---
+
+def call_api_stream(prompt, api_key, model_name, system_prompt, history=None, policy=None, on_retry=None,
+                    metrics=None):
+    """
+    通过共享的长连接传输层调用流式 API，并将文本块通过 yield 返回。
+    新增 system_prompt 参数用于设置模型的行为，history 为此前的 user / assistant 消息列表。
+    失败时按 policy (默认读取 CHATBOT_RETRY_* 等环境变量) 重试；中途断开时从已输出的内容续写，
+    调用方收到的文本是连续的。每次重试前调用 on_retry(第几次失败, 等待秒数, 错误, 是否续写)。
+    metrics 为 turn_metrics.StreamMetrics 时记录连接、首字节和每个文本块的到达时间。
+    每次请求 (包括重试) 发出前先向共享的限流器申请额度，额度不足时在这里等待。
+    """
+    policy = policy or RetryPolicy.from_env()
+    limiter = get_rate_limiter()
+    partial_response = ""
+    attempt = 0
+    while True:
+        attempt += 1
+        prompt_tokens = request_tokens(build_messages(prompt, system_prompt, history, partial_response))
+        throttled = limiter.acquire(api_key, model_name, prompt_tokens)
+        if metrics is not None:
+            metrics.note_throttled(throttled)
+            metrics.start_attempt()
+        received_before = len(partial_response)
+        try:
+            for content in _stream_once(prompt, api_key, model_name, system_prompt, history, partial_response,
+                                        policy, metrics):
+                if metrics is not None:
+                    metrics.mark_content(content)
+                partial_response += content
+                yield content
+            return
+        except StreamError as e:
+            if not policy.should_retry(e, attempt, partial_response):
+                raise final_error(e, attempt)
+            delay = policy.backoff(attempt, e.retry_after)
+            if on_retry:
+                on_retry(attempt, delay, e, bool(partial_response))
+            time.sleep(delay)
+        finally:
+            # 输出的 tokens 在本次请求结束后补扣
+            limiter.settle(api_key, model_name, estimate_tokens(partial_response[received_before:]))
+
+
+def _stream_once(prompt, api_key, model_name, system_prompt, history, partial_response, policy, metrics=None):
+    """发送一次请求；所有失败都转换为 StreamError，由 call_api_stream 决定是否重试"""
+    url = API_URL
+
+    # 确保 API Key 包含 Bearer 前缀
+    auth_header = api_key
+
+    payload = {
+        "model": model_name,
+        "stream": True,
+        # System Prompt + 历史 + 本轮输入 (续写时再附上已收到的部分回复)
+        "messages": build_messages(prompt, system_prompt, history, partial_response)
+    }
+
+    headers = {
+        "Accept": "text/event-stream",
+        "Authorization": auth_header,
+        "Content-Type": "application/json"
+    }
+
+    first_token_deadline = time.monotonic() + policy.first_token_timeout
+    received = False
+    try:
+        # 复用进程内共享的 keep-alive 连接池，避免每轮对话重新握手
+        with get_transport().stream(url, headers=headers, json=payload,
+                                    timeout=(policy.connect_timeout, policy.read_timeout),
+                                    trace=metrics.trace if metrics is not None else None) as response:
+            if metrics is not None:
+                metrics.mark_headers()
+            # 按响应头中的限流信息和 429 调整共享限流器
+            get_rate_limiter().observe(auth_header, model_name, response.status_code, response.headers)
+
+            if response.status_code != 200:
+                raise http_error(response.status_code, response.headers, response.text)
+
+            # 直接把原始字节块交给增量 SSE 解析器，不再逐行解码
+            decoder = DeltaDecoder()
+            for chunk in response.iter_bytes():
+                # 服务端只发送心跳等注释行时，socket 读超时不会触发，这里按截止时间检查首字超时
+                if not received and time.monotonic() > first_token_deadline:
+                    raise StreamError(f"等待首字超时 ({policy.first_token_timeout:g} 秒)", retryable=True)
+                for content in decoder.feed(chunk):
+                    if not received:
+                        # 收到首字后改用数据流停顿超时
+                        received = True
+                        response.set_read_timeout(policy.stall_timeout)
+                    yield content
+                if decoder.done:
+                    break
+
+    except requests.exceptions.RequestException as e:
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            message = f"连接超时 ({policy.connect_timeout:g} 秒)"
+        elif isinstance(e, requests.exceptions.Timeout) or "timed out" in str(e):
+            message = (f"数据流停顿超过 {policy.stall_timeout:g} 秒" if received
+                       else f"等待首字超时 ({policy.first_token_timeout:g} 秒)")
+        else:
+            message = f"网络连接或请求错误: {e}"
+        raise StreamError(message, retryable=True)
@@ -0,0 +1,497 @@
+import argparse
+import os
+import threading
+import tkinter as tk
+from tkinter import messagebox, ttk, filedialog
+from pathlib import Path
+
+from chat_config import MODEL_LIST, SYSTEM_PROMPT_MAP
+from conversation_tab import ConversationTab
+from tk_bridge import TkEventBridge
+
+
+# --- 对话式 AI 助手 (三个入口脚本共用的界面) ---
+# main.py、main_zhuiwen_mode.py 和 chat-bot-clear.py 只是默认选项不同：是否默认开启连问模式、是否显示
+# "清除当前对话" 按钮，也可以用命令行参数 --continuous / --clear 覆盖。
+# 一个窗口可以打开多个对话标签页 (conversation_tab.ConversationTab)，共用 API Key、记录路径、缓存和记录库，
+# 以及同一个后台流式引擎；顶部的模型和场景下拉框显示的是当前标签页的选择。
+#
+# 启动时只导入 Tk 和几个纯 Python 的小模块，窗口可以尽快出现并响应输入。HTTP 客户端 (requests / asyncio)、
+# SQLite 记录库和响应缓存、延迟指标、多模型对比和搜索窗口都在第一次用到时才导入；
+# 窗口显示后再由后台线程提前导入发送消息要用的模块，第一次发送时不必再等待。
+# 启动耗时由 benchmarks/run_benchmarks.py --only startup 跟踪。
+# 设置 CHATBOT_SESSION_RESTORE=1 后，打开的标签页和各对话的问答记在会话日志中 (session_log.py)，
+# 下次启动时恢复上次的对话。
+
+# 窗口显示后在后台预先导入的模块
+_PRELOAD_MODULES = ("async_engine", "response_cache", "turn_metrics", "history_writer", "chat_store")
+
+
+class AIChatApp:
+    # --- 模型列表与 System Prompt 映射表 (与批处理入口共用 chat_config) ---
+    MODEL_LIST = MODEL_LIST
+    SYSTEM_PROMPT_MAP = SYSTEM_PROMPT_MAP
+
+    def __init__(self, master, continuous=False, clearable=False):
+        """continuous 为新标签页连问模式复选框的初始状态；clearable 为 True 时每个标签页显示 "清除当前对话" 按钮"""
+        self.master = master
+        master.title("对话式 AI 助手 (Tkinter)")
+        master.option_add('*Font', 'Arial 10')
+
+        self.continuous = continuous
+        self.clearable = clearable
+        self.api_key = tk.StringVar(value="Bearer YOUR_API_KEY_HERE")
+        self.save_directory = None
+        # 本地响应缓存 (保存在记录路径下，选择文件夹后由后台线程懒加载)
+        self.response_cache = None
+        self._response_cache_lock = threading.Lock()
+        # 点击 "停止" 后是否保留已经生成的部分回复 (CHATBOT_STOP_KEEP_PARTIAL=0 时丢弃)
+        self.keep_partial_on_stop = os.environ.get("CHATBOT_STOP_KEEP_PARTIAL", "1").lower() not in ("0", "false", "no")
+        # 后台聊天记录写入线程与可搜索的记录库 (选择文件夹后懒加载，所有标签页共用)
+        self.history_writer = None
+        self.chat_store = None
+        # 记录库在后台线程 (搜索窗口、停止时的长度估算) 中懒加载，打开和关闭都要持有这个锁
+        self._chat_store_lock = threading.Lock()
+        self.search_window = None
+        # 每轮延迟指标的后台写入线程 (选择文件夹后懒加载)
+        self.metrics_recorder = None
+        # 多模型对比窗口 (同一时间最多打开一个)
+        self.fanout_window = None
+
+        # 对话标签页 (按打开顺序) 与当前显示的标签页
+        self.tabs = []
+        self.current_tab = None
+        self._tab_count = 0
+        # 会话日志 (只有设置 CHATBOT_SESSION_RESTORE=1 时才记录和恢复，否则为 None)
+        self.session_log = None
+
+        # --- 1. Key & Model & Scenario & Save Path 输入模块 (头部) ---
+        self.config_frame = tk.Frame(master, padx=10, pady=5)
+        self.config_frame.pack(fill='x', padx=10, pady=(10, 5))
+
+        # 1.1 Key 输入部分
+        self.key_label = tk.Label(self.config_frame, text="🔑 API Key:")
+        self.key_label.pack(side='left', padx=(0, 5))
+
+        self.key_entry = tk.Entry(
+            self.config_frame,
+            textvariable=self.api_key,
+            width=20,
+            bd=1,
+            relief='groove',
+            fg='gray'
+        )
+        self.key_entry.pack(side='left', fill='x', expand=False, padx=(0, 10))
+
+        self.key_entry.bind('<FocusIn>', self.clear_placeholder)
+        self.key_entry.bind('<FocusOut>', self.add_placeholder)
+
+        # 1.2 模型选择下拉菜单部分 (绑定到当前标签页的选择)
+        self.model_label = tk.Label(self.config_frame, text="🤖 Model:")
+        self.model_label.pack(side='left', padx=(5, 5))
+
+        self.model_combobox = ttk.Combobox(
+            self.config_frame,
+            values=self.MODEL_LIST,
+            state="readonly",
+            width=12
+        )
+        self.model_combobox.pack(side='left', fill='x', expand=False)
+
+        # 1.3 System Prompt 场景选择下拉菜单部分 (绑定到当前标签页的选择)
+        self.scenario_label = tk.Label(self.config_frame, text="🎭 场景:")
+        self.scenario_label.pack(side='left', padx=(10, 5))
+
+        self.scenario_combobox = ttk.Combobox(
+            self.config_frame,
+            values=list(self.SYSTEM_PROMPT_MAP.keys()),
+            state="readonly",
+            width=12
+        )
+        self.scenario_combobox.pack(side='left', fill='x', expand=False)
+
+        # 1.4 文件夹选择部分
+        self.folder_label = tk.Label(self.config_frame, text="📁 记录路径:")
+        self.folder_label.pack(side='left', padx=(15, 5))
+
+        self.folder_path_display = tk.StringVar(value="未选择")
+        self.folder_display_entry = tk.Entry(
+            self.config_frame,
+            textvariable=self.folder_path_display,
+            width=8,
+            state='readonly'
+        )
+        self.folder_display_entry.pack(side='left', fill='x', expand=False, padx=(0, 5))
+
+        self.select_folder_button = tk.Button(
+            self.config_frame,
+            text="选择文件夹",
+            command=self.select_save_directory
+        )
+        self.select_folder_button.pack(side='left')
+
+        # 1.5 多模型对比：同一个问题同时发给多个模型，并排比较
+        self.fanout_button = tk.Button(
+            self.config_frame,
+            text="多模型对比",
+            command=self.open_fanout_window
+        )
+        self.fanout_button.pack(side='left', padx=(10, 0))
+
+        # 1.6 搜索本地记录库中的历史问答
+        self.search_button = tk.Button(
+            self.config_frame,
+            text="搜索记录",
+            command=self.open_search_window
+        )
+        self.search_button.pack(side='left', padx=(5, 0))
+
+        # 1.7 新建 / 关闭对话标签页 (Ctrl+T / Ctrl+W)
+        self.new_tab_button = tk.Button(
+            self.config_frame,
+            text="新对话",
+            command=self.new_tab
+        )
+        self.new_tab_button.pack(side='left', padx=(10, 0))
+
+        self.close_tab_button = tk.Button(
+            self.config_frame,
+            text="关闭对话",
+            command=self.close_tab
+        )
+        self.close_tab_button.pack(side='left', padx=(5, 0))
+
+        # --- 2. 状态栏：当前标签页最近一轮的连接、首字节、首字、文本块间隔、生成速度、总耗时和渲染延迟 ---
+        self.status_bar = tk.Label(master, anchor='w', fg='#555555', bd=1, relief='sunken', padx=5)
+        self.status_bar.pack(side='bottom', fill='x')
+
+        # --- 3. 对话标签页 (中间)：每页包含回复区、待发送队列和输入区 ---
+        self.notebook = ttk.Notebook(master)
+        self.notebook.pack(fill='both', expand=True, padx=10, pady=(5, 10))
+        self.notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
+
+        # 生成过程中按 Esc 与点击当前标签页的 "停止" 相同
+        master.bind("<Escape>", lambda event: self.current_tab.stop_generation())
+        master.bind("<Control-t>", lambda event: self.new_tab())
+        master.bind("<Control-w>", lambda event: self.close_tab())
+
+        # 后台事件循环 → Tk 主线程的事件桥接 (每帧合并一次文本增量再渲染)
+        self.bridge = TkEventBridge(master)
+
+        # 恢复上次打开的对话；没有可恢复的对话时新建一个空白对话
+        self._restore_session()
+
+        master.protocol("WM_DELETE_WINDOW", self.on_closing)
+        # 窗口显示并处理完首批事件后，再在后台导入发送消息要用的模块
+        master.after_idle(self._start_preload)
+
+    def _start_preload(self):
+        threading.Thread(target=_preload_modules, name="chatbot-preload", daemon=True).start()
+
+    # --- 对话标签页 ---
+    @property
+    def selected_model(self):
+        return self.current_tab.selected_model
+
+    @property
+    def system_scenario_name(self):
+        return self.current_tab.system_scenario_name
+
+    def new_tab(self):
+        """新建一个对话标签页并切换过去；模型和场景沿用当前标签页的选择"""
+        if self.current_tab is not None:
+            model_name = self.current_tab.selected_model.get()
+            scenario_name = self.current_tab.system_scenario_name.get()
+        else:
+            model_name = self.MODEL_LIST[0]
+            scenario_name = list(self.SYSTEM_PROMPT_MAP.keys())[0]
+        tab = self._open_tab(model_name, scenario_name, self.continuous,
+                             self.session_log.new_id() if self.session_log is not None else None)
+        self.notebook.select(tab.frame)
+        self._activate_tab(tab)
+        self._save_session()
+        return tab
+
+    def _open_tab(self, model_name, scenario_name, continuous, session_id):
+        self._tab_count += 1
+        tab = ConversationTab(self, self.notebook, self._tab_count, model_name, scenario_name,
+                              continuous=continuous, clearable=self.clearable, session_id=session_id)
+        self.tabs.append(tab)
+        return tab
+
+    def close_tab(self):
+        """关闭当前标签页 (正在生成时先确认)；关闭最后一个时自动新建一个空白对话"""
+        tab = self.current_tab
+        if tab.stream_future is not None and not messagebox.askyesno(
+                "关闭对话", "该对话正在生成回复，关闭后将停止生成。确定关闭吗？", parent=self.master):
+            return
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        self.current_tab = None
+        tab.close()
+        self._reset_session_log(tab)
+        if not self.tabs:
+            self.new_tab()
+            return
+        next_tab = self.tabs[min(index, len(self.tabs) - 1)]
+        self.notebook.select(next_tab.frame)
+        self._activate_tab(next_tab)
+        self._save_session()
+
+    def _on_tab_changed(self, event=None):
+        selected = self.notebook.select()
+        for tab in self.tabs:
+            if str(tab.frame) == selected:
+                self._activate_tab(tab)
+                return
+
+    def _activate_tab(self, tab):
+        """切换当前标签页：顶部下拉框和状态栏改为显示它的选择和指标，并渲染它在后台时收到的内容"""
+        if tab is self.current_tab:
+            return
+        if self.current_tab is not None:
+            self.current_tab.hide()
+        self.current_tab = tab
+        self.model_combobox.config(textvariable=tab.selected_model)
+        self.scenario_combobox.config(textvariable=tab.system_scenario_name)
+        self.status_bar.config(textvariable=tab.status_text)
+        tab.show()
+
+    # --- 会话日志 (重启后恢复对话) ---
+    def _restore_session(self):
+        """按会话日志重新打开上次的标签页 (连问历史完整恢复，每页只渲染最后几轮)"""
+        from session_log import SessionLog
+        self.session_log = SessionLog.from_env(on_error=lambda error: self.bridge.post(self._on_session_error, error))
+        saved_tabs, current = self.session_log.load() if self.session_log is not None else ([], 0)
+
+        default_model = self.MODEL_LIST[0]
+        default_scenario = list(self.SYSTEM_PROMPT_MAP.keys())[0]
+        restored = []
+        for saved in saved_tabs:
+            # 配置中已经没有的模型或场景换成默认值
+            model_name = saved.get("model") if saved.get("model") in self.MODEL_LIST else default_model
+            scenario_name = saved.get("scenario") if saved.get("scenario") in self.SYSTEM_PROMPT_MAP else default_scenario
+            tab = self._open_tab(model_name, scenario_name, bool(saved.get("continuous", self.continuous)), saved["id"])
+            if saved["turns"]:
+                tab.restore(saved["turns"], saved.get("summary"), bool(saved.get("auto_compact", True)))
+            restored.append(tab)
+        if not restored:
+            self.new_tab()
+            return
+        tab = restored[current]
+        self.notebook.select(tab.frame)
+        self._activate_tab(tab)
+
+    def _save_session(self):
+        """把打开的标签页写入 session.json (后台线程)"""
+        if self.session_log is not None and self.current_tab is not None:
+            self.session_log.save_tabs([tab.session_state() for tab in self.tabs], self.tabs.index(self.current_tab))
+
+    def _log_session_turn(self, tab, model_name, scenario_name, prompt, response):
+        if self.session_log is not None:
+            self.session_log.append(tab.session_id, model_name, scenario_name, prompt, response)
+
+    def _reset_session_log(self, tab):
+        if self.session_log is not None:
+            self.session_log.reset(tab.session_id)
+
+    def _close_session_log(self):
+        """保存各标签页当前的设置并等待写完"""
+        if self.session_log is not None:
+            self._save_session()
+            self.session_log.close()
+            self.session_log = None
+
+    def _on_session_error(self, error):
+        self._notify(f"\n[系统消息] 会话日志读写失败，重启后可能无法恢复对话：{error}\n", 'error')
+
+    def _notify(self, text, tag='ai_response'):
+        """在当前标签页显示系统消息"""
+        self.current_tab._append_simple_text(text, tag)
+
+    def on_closing(self):
+        if self.fanout_window is not None and not self.fanout_window.closed:
+            self.fanout_window.close()
+        if self.search_window is not None and not self.search_window.closed:
+            self.search_window.close()
+        # 取消各标签页进行中的流和压缩，之后到达的回调不再碰已关闭的记录库和已销毁的控件
+        for tab in self.tabs:
+            tab.close()
+        # 先写完队列中的聊天记录和会话日志再退出
+        self._close_history_writer()
+        self._close_session_log()
+        self._close_chat_store()
+        self._close_metrics_recorder()
+        self.bridge.close()
+        self._close_response_cache()
+        self.master.destroy()
+
+    def open_fanout_window(self):
+        if self.fanout_window is not None and not self.fanout_window.closed:
+            self.fanout_window.window.lift()
+            return
+        from fanout import FanoutWindow
+        self.fanout_window = FanoutWindow(self)
+
+    def open_search_window(self):
+        if self.search_window is not None and not self.search_window.closed:
+            self.search_window.window.lift()
+            return
+        if not self.save_directory or not self.save_directory.is_dir():
+            messagebox.showerror("错误", "请先通过 '选择文件夹' 按钮设置聊天记录保存路径。")
+            return
+        from search_panel import SearchWindow
+        self.search_window = SearchWindow(self)
+
+    # --- 文件夹选择逻辑 ---
+    def select_save_directory(self):
+        """打开文件夹选择对话框，并更新保存路径"""
+        directory = filedialog.askdirectory(
+            parent=self.master,
+            initialdir=Path.home(),
+            title="选择保存聊天记录的文件夹"
+        )
+        self._close_response_cache()
+        if self.search_window is not None and not self.search_window.closed:
+            self.search_window.close()
+        self._close_history_writer()
+        self._close_chat_store()
+        self._close_metrics_recorder()
+        if directory:
+            self.save_directory = Path(directory)
+            self.folder_path_display.set(self.save_directory.name)
+            self._notify(f"\n[系统消息] 聊天记录保存路径已设置为: {self.save_directory.name}\n")
+        else:
+            self.save_directory = None
+            self.folder_path_display.set("未选择")
+
+    def _get_response_cache(self):
+        """可以在任意线程中调用 (由流式协程在线程池中打开)；没有记录路径时返回 None"""
+        with self._response_cache_lock:
+            if self.response_cache is None and self.save_directory is not None:
+                from response_cache import ResponseCache
+                self.response_cache = ResponseCache.for_directory(self.save_directory)
+            return self.response_cache
+
+    def _close_response_cache(self):
+        with self._response_cache_lock:
+            if self.response_cache is not None:
+                self.response_cache.close()
+                self.response_cache = None
+
+    # --- Key 输入逻辑 ---
+    def clear_placeholder(self, event):
+        if self.api_key.get() == "Bearer YOUR_API_KEY_HERE":
+            self.api_key.set("")
+            self.key_entry.config(fg='black')
+
+    def add_placeholder(self, event):
+        if not self.api_key.get():
+            self.api_key.set("Bearer YOUR_API_KEY_HERE")
+            self.key_entry.config(fg='gray')
+
+    # --- 延迟指标 (后台写入指标文件) ---
+    def _get_metrics_recorder(self):
+        if self.metrics_recorder is None:
+            from turn_metrics import MetricsRecorder
+            self.metrics_recorder = MetricsRecorder.from_env(
+                self.save_directory,
+                on_error=lambda error: self.bridge.post(self._on_metrics_error, error)
+            )
+        return self.metrics_recorder
+
+    def _close_metrics_recorder(self):
+        if self.metrics_recorder is not None:
+            self.metrics_recorder.close()
+            self.metrics_recorder = None
+
+    def _on_metrics_error(self, error):
+        self._notify(f"\n[系统消息] 写入延迟指标失败：{error}\n", 'error')
+
+    # --- 文件保存逻辑 (后台线程批量写入) ---
+    def _save_chat_history(self, prompt, response, model_name, meta=None):
+        """把本轮对话交给后台写入线程，Tk 主线程不做磁盘 I/O (prompt 是原始的用户输入，不含连问上下文)"""
+        if self.save_directory is None:
+            return
+        self._get_history_writer().submit(prompt, response, model_name, meta)
+
+    def _get_history_writer(self):
+        if self.history_writer is None:
+            from history_writer import HistoryWriter
+            # 记录库由写入线程打开；写入线程的回调都转交给 Tk 主线程执行
+            self.history_writer = HistoryWriter.from_env(
+                self.save_directory,
+                store=self._get_chat_store,
+                on_saved=lambda filenames: self.bridge.post(self._on_history_saved, filenames),
+                on_archived=lambda archived: self.bridge.post(self._on_history_archived, archived),
+                on_error=lambda error: self.bridge.post(self._on_history_error, error)
+            )
+        return self.history_writer
+
+    def _close_history_writer(self):
+        """等待写入线程写完队列中的全部记录"""
+        if self.history_writer is not None:
+            self.history_writer.close()
+            self.history_writer = None
+
+    def _get_chat_store(self):
+        """可以在任意线程中调用；第一次调用时打开 (并按需升级) 记录库，没有记录路径时返回 None"""
+        with self._chat_store_lock:
+            if self.chat_store is None and self.save_directory is not None:
+                from chat_store import ChatStore
+                self.chat_store = ChatStore.for_directory(self.save_directory)
+            return self.chat_store
+
+    def _close_chat_store(self):
+        with self._chat_store_lock:
+            if self.chat_store is not None:
+                self.chat_store.close()
+                self.chat_store = None
+
+    def _on_history_saved(self, filenames):
+        for filename in filenames:
+            self._notify(f"\n[系统消息] 对话已保存至文件: {filename}\n")
+
+    def _on_history_archived(self, archived):
+        turns = sum(count for _day, count in archived)
+        self._notify(f"\n[系统消息] 已将 {len(archived)} 天的聊天记录 ({turns} 轮) 压缩归档\n")
+
+    def _on_history_error(self, error):
+        messagebox.showerror("保存错误", f"保存聊天记录失败：{error}。请检查文件夹权限。")
+
+
+def _preload_modules():
+    """在后台线程中导入发送消息要用的模块；导入失败留给第一次使用时在主线程中报告"""
+    import importlib
+    for name in _PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def main(argv=None, continuous=False, clearable=False):
+    """启动聊天窗口。continuous / clearable 是入口脚本的默认值，命令行参数可以覆盖"""
+    parser = argparse.ArgumentParser(description="对话式 AI 助手")
+    parser.add_argument("--continuous", action=argparse.BooleanOptionalAction, default=continuous,
+                        help="启动时勾选连问模式 (界面上可以随时切换)")
+    parser.add_argument("--clear", action=argparse.BooleanOptionalAction, default=clearable,
+                        help="显示 \"清除当前对话\" 按钮")
+    parser.add_argument("--profile", action="store_true",
+                        help="分析主循环和各个后台线程，退出时把报告写入记录路径 (也可设置 CHATBOT_PROFILE=1)")
+    args = parser.parse_args(argv)
+
+    from profiling import ProfileSession
+    profiler = ProfileSession.from_env(["--profile"] if args.profile else None)
+    profiler.start()
+    root = tk.Tk()
+    app = AIChatApp(root, continuous=args.continuous, clearable=args.clear)
+    root.geometry("800x1000")
+    profiler.run(root.mainloop)
+    report_dir = profiler.stop(app.save_directory)
+    if report_dir is not None:
+        print(f"性能分析报告已写入 {report_dir}")
+
+
+if __name__ == '__main__':
+    main()
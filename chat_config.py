@@ -0,0 +1,28 @@
+# --- 模型列表与 System Prompt 场景 ---
+# 三个前端和无界面的批处理入口共用同一份配置。
+
+MODEL_LIST = [
+    "gpt-5.1",
+    "gpt-5.1-codex",
+    "gemini-3-pro-preview",
+    "claude-opus-4-5-20251101-thinking",
+    "claude-opus-4-5-20251101",
+    "claude-haiku-4-5-20251001"
+]
+
+SYSTEM_PROMPT_MAP = {
+    "程序代码助手": (
+        "You are a professional senior programmer."
+        "- Only answer programming-related questions"
+        "- Code first, explanations concise"
+        "- Follow best practices and design patterns"
+        "- Consider edge cases and error handling"
+    ),
+    "通用Ai助手": (
+        "You are a helpful assistant."
+    ),
+    "中文/英文互译专家": (
+        "你是一位专业的中文和英文语言专家。"
+        "请给出中英文的双译结果，通过分段显示中文翻译和英文翻译结果。"
+    )
+}
@@ -0,0 +1,269 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from context_window import estimate_tokens
+from history_writer import format_record
+
+
+# --- 本地聊天记录库 ---
+# 每一轮问答连同模型、场景、时间、延迟和 token 数保存在 SQLite 中，并用 FTS5 建立全文索引。
+# 索引使用 trigram 分词：中文没有空格分词，trigram 可以匹配任意位置的子串。
+# trigram 需要 SQLite 3.34 及以上；更早的版本改用 unicode61 建索引，搜索全部退回 LIKE 扫描。
+# 每日 Markdown 文件照常写入，也可以随时从记录库按搜索结果导出为同样的 Markdown 格式。
+
+STORE_FILENAME = ".chatbot-history.sqlite3"
+
+# trigram 索引只能匹配不少于 3 个字符的词，更短的词退回 LIKE 扫描
+_MIN_INDEXED_TERM = 3
+
+_MARKDOWN_RECORD_RE = re.compile(
+    r"\n## 🤖 对话记录 \((\d{8})\)\n\n### \*\*\[(\d\d:\d\d:\d\d)\]\*\* 模型: (.*?)\n\n"
+    r"#### 用户:\n(.*?)\n\n#### AI 助手:\n(.*?)\n\n---\n(?=\n## 🤖 对话记录 \(|\Z)",
+    re.DOTALL
+)
+
+_COLUMNS = ("id", "created", "model", "scenario", "prompt", "response",
+            "ttft_ms", "duration_ms", "prompt_tokens", "response_tokens", "cached", "stopped")
+
+
+def _digest(created, model_name, prompt, response):
+    """按秒级时间戳计算，使同一轮问答无论来自界面还是从 Markdown 导入都只保存一次"""
+    stamp = datetime.fromtimestamp(created).strftime("%Y%m%d %H:%M:%S")
+    return hashlib.sha256("\x1f".join((stamp, model_name, prompt, response)).encode('utf-8')).hexdigest()
+
+
+def parse_markdown_history(text):
+    """解析每日 Markdown 记录文件，返回可以传给 ChatStore.add_turns 的记录列表"""
+    records = []
+    for day, clock, model_name, prompt, response in _MARKDOWN_RECORD_RE.findall(text):
+        records.append({
+            "created": datetime.strptime(f"{day} {clock}", "%Y%m%d %H:%M:%S").timestamp(),
+            "model": model_name,
+            "prompt": prompt,
+            "response": response
+        })
+    return records
+
+
+class ChatStore:
+    """聊天记录库，可以在任意线程中使用 (写入线程负责插入，搜索窗口的后台线程负责查询)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY,
+                digest TEXT NOT NULL UNIQUE,
+                created REAL NOT NULL,
+                model TEXT NOT NULL,
+                scenario TEXT,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                ttft_ms REAL,
+                duration_ms REAL,
+                prompt_tokens INTEGER,
+                response_tokens INTEGER,
+                cached INTEGER NOT NULL DEFAULT 0,
+                stopped INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS turns_created ON turns (created);
+            CREATE TABLE IF NOT EXISTS archived_days (
+                day TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL
+            );
+        """)
+        self.trigram = self._create_fts_table()
+        self._db.executescript("""
+            CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN
+                INSERT INTO turns_fts (rowid, prompt, response) VALUES (new.id, new.prompt, new.response);
+            END;
+            CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN
+                INSERT INTO turns_fts (turns_fts, rowid, prompt, response)
+                VALUES ('delete', old.id, old.prompt, old.response);
+            END;
+        """)
+        # 早期版本创建的记录库没有 stopped 列 (用户中途停止、保留了部分回复的轮次)
+        columns = [row["name"] for row in self._db.execute("PRAGMA table_info(turns)")]
+        if "stopped" not in columns:
+            self._db.execute("ALTER TABLE turns ADD COLUMN stopped INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+
+    def _create_fts_table(self, tokenizers=("trigram", "unicode61")):
+        """
+        创建全文索引表，当前 SQLite 不支持 trigram 分词时退回 unicode61；
+        返回已有或新建的索引是否使用 trigram (决定 search 能否用 MATCH)
+        """
+        for tokenizer in tokenizers:
+            try:
+                self._db.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5("
+                    f"prompt, response, content='turns', content_rowid='id', tokenize='{tokenizer}')"
+                )
+                break
+            except sqlite3.OperationalError:
+                if tokenizer == tokenizers[-1]:
+                    raise
+        row = self._db.execute("SELECT sql FROM sqlite_master WHERE name = 'turns_fts'").fetchone()
+        return "trigram" in row[0]
+
+    @classmethod
+    def for_directory(cls, directory):
+        return cls(directory / STORE_FILENAME)
+
+    # --- 写入 ---
+
+    def add_turns(self, records):
+        """
+        在一个事务中插入多轮问答，返回实际新增的条数 (已存在的轮次会被跳过)。
+        每条记录至少包含 created (时间戳)、model、prompt、response，
+        可选 scenario、ttft_ms、duration_ms、prompt_tokens、response_tokens、cached、stopped。
+        """
+        rows = []
+        for record in records:
+            rows.append((
+                _digest(record["created"], record["model"], record["prompt"], record["response"]),
+                record["created"],
+                record["model"],
+                record.get("scenario"),
+                record["prompt"],
+                record["response"],
+                record.get("ttft_ms"),
+                record.get("duration_ms"),
+                record.get("prompt_tokens"),
+                record.get("response_tokens", estimate_tokens(record["response"])),
+                int(bool(record.get("cached"))),
+                int(bool(record.get("stopped")))
+            ))
+        with self._lock:
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO turns (digest, created, model, scenario, prompt, response, ttft_ms,"
+                " duration_ms, prompt_tokens, response_tokens, cached, stopped)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def import_markdown(self, path):
+        """导入一个每日 Markdown 记录文件，返回新增的轮数"""
+        return self.add_turns(parse_markdown_history(path.read_text(encoding='utf-8')))
+
+    def import_archive(self, archive):
+        """
+        导入压缩归档 (history_archive.HistoryArchive) 中的记录，返回 (解压的天数, 新增的轮数)。
+        已经导入过的日期按索引跳过，只解压新归档或有新增条目的日期。
+        """
+        with self._lock:
+            imported = dict(self._db.execute("SELECT day, entries FROM archived_days").fetchall())
+        days = added = 0
+        for day, entries in archive.days().items():
+            if imported.get(day) == len(entries):
+                continue
+            added += self.add_turns(parse_markdown_history(archive.read_day(day)))
+            days += 1
+            with self._lock:
+                self._db.execute("INSERT OR REPLACE INTO archived_days (day, entries) VALUES (?, ?)",
+                                 (day, len(entries)))
+                self._db.commit()
+        return days, added
+
+    # --- 查询 ---
+
+    def search(self, query, model_name=None, limit=200):
+        """
+        按关键词搜索，空格分隔的多个词之间是 "且" 的关系；结果按写入顺序倒序 (最新的在前)。
+        返回的每一行包含 id、created、model、scenario、ttft_ms 和带 [] 高亮的 snippet。
+        按 rowid 倒序可以让 FTS5 边匹配边返回，取够 limit 条就停止，常见词在大量记录中也是毫秒级。
+        索引不是 trigram 分词 (旧版 SQLite) 时所有词都用 LIKE 扫描。
+        """
+        terms = query.split()
+        min_indexed = _MIN_INDEXED_TERM if self.trigram else float("inf")
+        indexed = [term for term in terms if len(term) >= min_indexed]
+        short = [term for term in terms if len(term) < min_indexed]
+
+        conditions = []
+        params = []
+        if indexed:
+            source = "turns_fts f JOIN turns t ON t.id = f.rowid"
+            conditions.append("turns_fts MATCH ?")
+            params.append(" AND ".join('"' + term.replace('"', '""') + '"' for term in indexed))
+            order = "f.rowid"
+        else:
+            source = "turns t"
+            order = "t.id"
+        for term in short:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(t.prompt LIKE ? ESCAPE '\\' OR t.response LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if model_name:
+            conditions.append("t.model = ?")
+            params.append(model_name)
+
+        where = " AND ".join(conditions) or "1"
+        sql = (f"SELECT t.id, t.created, t.model, t.scenario, t.ttft_ms, t.prompt, t.response FROM {source}"
+               f" WHERE {where} ORDER BY {order} DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit]).fetchall()
+
+        results = []
+        for row in rows:
+            result = {key: row[key] for key in ("id", "created", "model", "scenario", "ttft_ms")}
+            result["snippet"] = self._snippet(row["prompt"] + " ⏎ " + row["response"], terms)
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _snippet(text, terms, width=40):
+        """取第一个命中词附近的一小段文字，命中词用 [] 标出"""
+        lowered = text.lower()
+        hits = [(lowered.find(term.lower()), term) for term in terms]
+        hits = [(position, term) for position, term in hits if position >= 0]
+        if not hits:
+            return text[:width * 2].replace("\n", " ")
+        position, term = min(hits)
+        start = max(position - width, 0)
+        end = position + len(term)
+        snippet = text[start:position] + "[" + text[position:end] + "]" + text[end:end + width]
+        return ("…" if start else "") + snippet.replace("\n", " ") + ("…" if end + width < len(text) else "")
+
+    def get_turn(self, turn_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM turns WHERE id = ?", (turn_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+    def average_response_tokens(self, model_name, recent=50):
+        """某个模型最近 recent 轮完整回复的平均 tokens (不含缓存回放)；没有记录时返回 None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT AVG(response_tokens) FROM (SELECT response_tokens FROM turns"
+                " WHERE model = ? AND cached = 0 AND stopped = 0 ORDER BY id DESC LIMIT ?)",
+                (model_name, recent)
+            ).fetchone()
+        return round(row[0]) if row[0] is not None else None
+
+    # --- 导出 ---
+
+    def export_markdown(self, turn_ids, path):
+        """把指定的轮次按时间顺序导出为与每日记录文件相同的 Markdown 格式，返回导出的条数"""
+        turns = [turn for turn in (self.get_turn(turn_id) for turn_id in turn_ids) if turn]
+        turns.sort(key=lambda turn: turn["created"])
+        with path.open('w', encoding='utf-8') as f:
+            for turn in turns:
+                f.write(format_record(turn["prompt"], turn["response"], turn["model"],
+                                      datetime.fromtimestamp(turn["created"])))
+        return len(turns)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,165 @@
+import os
+import re
+
+
+# --- 连问模式的上下文窗口管理 ---
+# 每次发送前按模型预算裁剪历史：固定保留 system prompt 和最近几轮，
+# 更早的轮次按策略丢弃或截断，避免请求越来越慢、越来越贵，直到超出上下文长度。
+
+# 各模型的上下文长度 (tokens)，未列出的模型使用 DEFAULT_CONTEXT_LIMIT
+MODEL_CONTEXT_LIMITS = {
+    "gpt-5.1": 400000,
+    "gpt-5.1-codex": 400000,
+    "gemini-3-pro-preview": 1048576,
+    "claude-opus-4-5-20251101-thinking": 200000,
+    "claude-opus-4-5-20251101": 200000,
+    "claude-haiku-4-5-20251001": 200000
+}
+DEFAULT_CONTEXT_LIMIT = 128000
+
+# 为模型输出预留的 tokens
+OUTPUT_RESERVE_TOKENS = 16384
+
+# 每条消息的格式开销，以及回复起始的固定开销 (与 OpenAI 的计数方式一致)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+POLICY_DROP = "drop_oldest"
+POLICY_TRUNCATE = "truncate_oldest"
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_TRUNCATED_MARK = "\n...(更早的内容已截断)"
+
+
+def estimate_tokens(text):
+    """离线估算 token 数：中日韩字符约 1 token/字，其余字符约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def request_tokens(messages):
+    """估算一次请求的输入 tokens (所有消息加上回复起始开销)"""
+    return sum(message_tokens(message) for message in messages) + REPLY_PRIMING_TOKENS
+
+
+class ContextReport:
+    """一次裁剪的结果，用于在界面上显示实际发送了多少上下文"""
+
+    def __init__(self, budget, tokens_sent, turns_sent, dropped_turns, truncated_turns, over_budget=False):
+        self.budget = budget
+        self.tokens_sent = tokens_sent
+        self.turns_sent = turns_sent
+        self.dropped_turns = dropped_turns
+        self.truncated_turns = truncated_turns
+        # 固定保留的部分 (system prompt + 本轮输入 + 最近几轮) 本身就超出了预算
+        self.over_budget = over_budget
+
+    def summary(self):
+        text = f"附带了 {self.turns_sent} 轮历史对话，约 {self.tokens_sent} tokens (预算 {self.budget})"
+        if self.dropped_turns:
+            text += f"，丢弃最早的 {self.dropped_turns} 轮"
+        if self.truncated_turns:
+            text += f"，截断 {self.truncated_turns} 轮"
+        if self.over_budget:
+            text += "，最近几轮本身已超出预算"
+        return text
+
+
+class ContextWindowManager:
+    """
+    按模型预算裁剪历史消息。参数都可以通过环境变量覆盖：
+      CHATBOT_CONTEXT_POLICY       drop_oldest (整轮丢弃) 或 truncate_oldest (先截断再丢弃)
+      CHATBOT_CONTEXT_MAX_TOKENS   额外的上下文上限，用于控制成本和延迟 (默认只受模型上下文长度限制)
+      CHATBOT_KEEP_RECENT_TURNS    无论预算如何都保留的最近轮数
+    """
+
+    def __init__(self, policy=POLICY_DROP, max_tokens=None, keep_recent_turns=2, min_truncate_tokens=64):
+        if policy not in (POLICY_DROP, POLICY_TRUNCATE):
+            raise ValueError(f"未知的上下文裁剪策略: {policy}")
+        self.policy = policy
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.min_truncate_tokens = min_truncate_tokens
+
+    @classmethod
+    def from_env(cls):
+        max_tokens = os.environ.get("CHATBOT_CONTEXT_MAX_TOKENS")
+        return cls(
+            policy=os.environ.get("CHATBOT_CONTEXT_POLICY", POLICY_DROP),
+            max_tokens=int(max_tokens) if max_tokens else None,
+            keep_recent_turns=int(os.environ.get("CHATBOT_KEEP_RECENT_TURNS", 2))
+        )
+
+    def budget_for(self, model_name):
+        budget = MODEL_CONTEXT_LIMITS.get(model_name, DEFAULT_CONTEXT_LIMIT) - OUTPUT_RESERVE_TOKENS
+        if self.max_tokens:
+            budget = min(budget, self.max_tokens)
+        return budget
+
+    def fit(self, prompt, system_prompt, history, model_name):
+        """
+        返回 (裁剪后的 history, ContextReport)。
+        system prompt、本轮输入和最近 keep_recent_turns 轮始终保留，其余从最新往最旧依次装入预算。
+        """
+        budget = self.budget_for(model_name)
+        turns = [history[i:i + 2] for i in range(0, len(history or []), 2)]
+
+        split = max(len(turns) - self.keep_recent_turns, 0)
+        older, recent = turns[:split], turns[split:]
+
+        used = REPLY_PRIMING_TOKENS
+        used += estimate_tokens(system_prompt) + estimate_tokens(prompt) + 2 * MESSAGE_OVERHEAD_TOKENS
+        used += sum(message_tokens(message) for turn in recent for message in turn)
+        over_budget = used > budget
+
+        kept = []
+        truncated = 0
+        for turn in reversed(older):
+            cost = sum(message_tokens(message) for message in turn)
+            if used + cost <= budget:
+                kept.append(turn)
+                used += cost
+                continue
+
+            remaining = budget - used
+            if self.policy == POLICY_TRUNCATE and remaining >= self.min_truncate_tokens:
+                turn = self._truncate_turn(turn, remaining)
+                kept.append(turn)
+                used += sum(message_tokens(message) for message in turn)
+                truncated += 1
+            # 更早的轮次全部丢弃，保证发送的历史是连续的
+            break
+
+        kept.reverse()
+        fitted = [message for turn in kept + recent for message in turn]
+        report = ContextReport(
+            budget=budget,
+            tokens_sent=used,
+            turns_sent=len(kept) + len(recent),
+            dropped_turns=len(older) - len(kept),
+            truncated_turns=truncated,
+            over_budget=over_budget
+        )
+        return fitted, report
+
+    @staticmethod
+    def _truncate_turn(turn, token_budget):
+        """按比例截断一轮问答，保留每条消息的开头部分"""
+        total = sum(message_tokens(message) for message in turn)
+        truncated = []
+        for message in turn:
+            share = token_budget * message_tokens(message) // total
+            share = max(share - MESSAGE_OVERHEAD_TOKENS - estimate_tokens(_TRUNCATED_MARK), 0)
+            content = message["content"]
+            tokens = estimate_tokens(content)
+            if tokens > share:
+                keep_chars = max(len(content) * share // max(tokens, 1) - len(_TRUNCATED_MARK), 0)
+                content = content[:keep_chars] + _TRUNCATED_MARK
+            truncated.append({"role": message["role"], "content": content})
+        return truncated
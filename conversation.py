@@ -0,0 +1,76 @@
+# --- 结构化对话历史 ---
+# 连问模式的上下文由应用自己维护 (role/content 消息列表)，而不是从 output_text 控件里抓取文本，
+# 这样系统横幅、用户标题等界面文字不会被当作上下文发送。
+# 较早的轮次可以被压缩为一份摘要 (见 history_compactor.py)：发送时用摘要代替这些轮次，
+# 原始消息仍然全部保留，撤销摘要后恢复逐字发送。
+
+# 摘要作为一轮问答放在历史的最前面，保持 user / assistant 交替
+SUMMARY_PREFIX = "以下是我们此前对话的摘要，请把它当作已知的上下文：\n\n"
+SUMMARY_REPLY = "好的，我已了解此前的对话内容。"
+
+
+class Conversation:
+    """按顺序保存 user / assistant 消息，供下一轮请求作为 messages 数组发送"""
+
+    def __init__(self):
+        self.messages = []
+        # 代替最早 summary_turns 轮的摘要 (None 表示没有摘要，全部逐字发送)
+        self.summary = None
+        self.summary_turns = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def turn_count(self):
+        return sum(1 for message in self.messages if message["role"] == "user")
+
+    def add_turn(self, prompt, response):
+        """记录一轮完整的问答；没有拿到回复的轮次不记录，避免出现连续两条 user 消息"""
+        if not response:
+            return
+        self.messages.append({"role": "user", "content": prompt})
+        self.messages.append({"role": "assistant", "content": response})
+
+    def history(self):
+        """
+        返回发送用的历史副本 (有摘要时用摘要代替被压缩的轮次)，
+        避免后台线程与界面线程共享同一个列表
+        """
+        messages = self.messages
+        if self.summary:
+            messages = [{"role": "user", "content": SUMMARY_PREFIX + self.summary},
+                        {"role": "assistant", "content": SUMMARY_REPLY}] + messages[2 * self.summary_turns:]
+        return [dict(message) for message in messages]
+
+    def set_summary(self, summary, turns):
+        """用 summary 代替最早的 turns 轮"""
+        self.summary = summary
+        self.summary_turns = turns
+
+    def revert_summary(self):
+        self.summary = None
+        self.summary_turns = 0
+
+    def clear(self):
+        self.messages = []
+        self.revert_summary()
+
+
+# 数据流中途断开后续写时追加的指令
+RESUME_PROMPT = "你上一条回答在中途被截断了。请从截断处直接继续输出剩余内容，不要重复已经输出的部分，也不要添加任何说明。"
+
+
+def build_messages(prompt, system_prompt, history=None, partial_response=None):
+    """
+    组装发送给接口的 messages：system + 历史消息 + 本轮用户输入。
+    partial_response 为中途断开时已收到的回复，续写请求会把它和续写指令附在最后。
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    if history:
+        messages.extend(history)
+    messages.append({"role": "user", "content": prompt})
+    if partial_response:
+        messages.append({"role": "assistant", "content": partial_response})
+        messages.append({"role": "user", "content": RESUME_PROMPT})
+    return messages
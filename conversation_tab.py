@@ -0,0 +1,814 @@
+import tkinter as tk
+from tkinter import scrolledtext, messagebox
+
+from context_window import ContextWindowManager, estimate_tokens, request_tokens
+from conversation import Conversation, build_messages
+from history_compactor import HistoryCompactor
+from markdown_stream import StreamingMarkdownRenderer
+from prompt_queue import PromptQueue, QueuePanel
+from transcript import TranscriptView
+
+
+# --- 对话标签页 ---
+# 每个标签页是一个独立的对话：自己的模型、场景、连问历史、待发送队列和渲染状态 (Markdown 解析、折叠的轮次)。
+# API Key、记录路径、缓存和记录库由窗口 (chat_app.AIChatApp) 共享；所有标签页的流都交给同一个后台引擎，
+# 同时运行的数量由 CHATBOT_MAX_STREAMS 限制，超出时各标签页轮流开始。
+# 在后台的标签页照常接收回复、保存记录，但不更新文本控件：对控件的操作按顺序记下 (相邻的文本块合并)，
+# 切换到该标签页时一次渲染。
+# 每轮问答同时记入会话日志 (session_log.py)，重启后恢复连问历史；恢复时只渲染最后几轮，
+# 更早的轮次在滚动到顶部时逐批加载。
+# 连问历史变长后，在用户空闲时由后台请求把较早的轮次压缩为摘要 (history_compactor.py)，
+# 回复区中的提示可以查看或撤销摘要。
+
+# 标签标题显示的最大字符数 (取第一个问题的开头)
+TITLE_CHARS = 12
+
+# 恢复会话时完整显示的最近轮数，以及每次滚动到顶部时加载的轮数
+RESTORE_TURNS = 2
+REVEAL_TURNS = 3
+
+
+class ConversationTab:
+
+    def __init__(self, app, notebook, number, model_name, scenario_name, continuous=False, clearable=False,
+                 session_id=None):
+        self.app = app
+        self.number = number
+        # 会话日志中的对话 id (未启用会话恢复时为 None)
+        self.session_id = session_id
+        self.title = f"对话 {number}"
+        self.closed = False
+        # 是否是当前显示的标签页；不显示时对文本控件的操作先记在 _deferred 里
+        self.visible = False
+        self._deferred = []
+        # 在后台时收到了新内容，标题上加标记提示
+        self.unseen = False
+
+        self.selected_model = tk.StringVar(value=model_name)
+        self.system_scenario_name = tk.StringVar(value=scenario_name)
+        self.continuous_mode = tk.BooleanVar(value=continuous)
+        self.use_cache = tk.BooleanVar(value=True)
+        # 最近一轮的延迟指标 (切换到该标签页时显示在窗口的状态栏)
+        self.status_text = tk.StringVar(value="就绪")
+
+        # 进行中的流 (后台事件循环中的 Future) 及其延迟指标
+        self.stream_future = None
+        self.stream_metrics = None
+
+        self.current_user_prompt = ""
+        self.current_ai_response = ""
+        # 本轮写入记录库的附加信息 (场景、输入 tokens、首字延迟、总耗时)
+        self.current_turn_meta = {}
+        # 各模型最近的平均回复 tokens (每轮开始时在后台查询，停止生成时用来估算节省的 tokens)
+        self._typical_tokens = {}
+        # 连问模式的结构化上下文 (由应用维护，不再从 output_text 抓取)
+        self.conversation = Conversation()
+        # 发送前按模型预算裁剪历史 (策略和上限可通过 CHATBOT_CONTEXT_* 环境变量调整)
+        self.context_window = ContextWindowManager.from_env()
+        # 空闲时把较早的轮次压缩为摘要 (阈值、模型等可通过 CHATBOT_SUMMARY_* 环境变量调整)；
+        # 用户撤销摘要后本对话不再自动压缩，清空对话后恢复
+        self.compactor = HistoryCompactor.from_env()
+        self.auto_compact = True
+        self.compaction_future = None
+        self._compaction_timer = None
+        # 清空对话时加一，丢弃清空之前开始的压缩结果
+        self._conversation_generation = 0
+        self._summary_notices = 0
+        # 跨数据块保存 Markdown 解析状态 (代码块 / 粗体 / 行内代码 ...)
+        self.markdown = StreamingMarkdownRenderer()
+        # 生成回复时输入的后续问题，本轮结束后依次发送
+        self.prompt_queue = PromptQueue()
+
+        self.frame = tk.Frame(notebook)
+
+        # --- 1. 返回数据模块 (上方) ---
+        self.output_frame = tk.Frame(self.frame)
+        self.output_frame.pack(fill='both', expand=True, pady=5)
+
+        self.output_text = scrolledtext.ScrolledText(
+            self.output_frame,
+            wrap=tk.WORD,
+            state='disabled',
+            font=('Arial', 13),
+            bg='#f0f0f0',
+            fg='#333333',
+            padx=12,
+            pady=12
+        )
+        self.output_text.pack(fill='both', expand=True)
+
+        # 定义 Markdown 标签样式
+        self.output_text.tag_config('user', foreground='#000080', font=('Arial', 10, 'bold'))
+        self.output_text.tag_config('ai_response', foreground='#006400')
+        self.output_text.tag_config('error', foreground='#FF0000', font=('Arial', 10, 'bold'))
+        self.output_text.tag_config('bold', font=('Arial', 10, 'bold'), foreground='#2c3e50')
+        self.output_text.tag_config('code_block', background='#2d2d2d', foreground='#cccccc', font=('Courier', 10))
+        self.output_text.tag_config('code_lang', foreground='#9cdcfe', font=('Courier', 10, 'italic'))
+        self.output_text.tag_config('inline_code', background='#e1e4e8', foreground='#c7254e', font=('Courier', 10))
+        self.output_text.tag_config('heading1', font=('Arial', 15, 'bold'), foreground='#2c3e50')
+        self.output_text.tag_config('heading2', font=('Arial', 13, 'bold'), foreground='#2c3e50')
+        self.output_text.tag_config('heading3', font=('Arial', 11, 'bold'), foreground='#2c3e50')
+        self.output_text.tag_config('list_item', lmargin1=10, lmargin2=26)
+        self.output_text.tag_config('summary_link', foreground='#1a5fb4', underline=True)
+        self.output_text.tag_bind('summary_link', '<Enter>', lambda event: self.output_text.config(cursor='hand2'))
+        self.output_text.tag_bind('summary_link', '<Leave>', lambda event: self.output_text.config(cursor=''))
+
+        # 只完整保留最近几轮，更早的轮次折叠为可展开的占位符 (轮数可通过 CHATBOT_TRANSCRIPT_TURNS 调整)
+        self.transcript = TranscriptView.from_env(self.output_text)
+        # 滚动到顶部时加载隐藏的更早轮次
+        self._reveal_pending = None
+        self.output_text.config(yscrollcommand=self._on_output_scroll)
+
+        # --- 2. 输入窗口 (下方) ---
+        self.input_frame = tk.Frame(self.frame, pady=10)
+        self.input_frame.pack(fill='x', pady=(5, 0))
+
+        # 2.1 左侧：输入框
+        self.input_entry = tk.Text(
+            self.input_frame,
+            height=6,
+            wrap=tk.WORD,
+            font=('Arial', 10),
+            bd=1,
+            relief='groove'
+        )
+        self.input_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
+
+        self.input_entry.bind("<Shift-Return>", self.insert_newline)
+        self.input_entry.bind("<Return>", self.send_message_event)
+        # 正在输入时推迟后台压缩
+        self.input_entry.bind("<KeyPress>", self._schedule_compaction)
+
+        # 2.2 生成过程中按 Enter 加入队列的问题 (面板在输入区上方，队列为空时隐藏)
+        self.queue_panel = QueuePanel(self.frame, self.prompt_queue, before=self.input_frame)
+
+        # 2.3 右侧：控制和按钮 (使用 grid 布局实现垂直对齐)
+        self.control_frame = tk.Frame(self.input_frame)
+        self.control_frame.pack(side='right', fill='y')  # 使控制框占满父容器的高度
+
+        # 配置 control_frame 的行权重，确保发送按钮占据大部分空间
+        self.control_frame.grid_rowconfigure(0, weight=1)  # 第0行 (连问模式复选框)
+        self.control_frame.grid_rowconfigure(1, weight=1)  # 第1行 (缓存复选框)
+        self.control_frame.grid_rowconfigure(2, weight=1)  # 第2行 (清除按钮，可选)
+        self.control_frame.grid_rowconfigure(3, weight=10)  # 第3行 (发送按钮)
+
+        # 连问模式复选框
+        self.continuous_checkbox = tk.Checkbutton(
+            self.control_frame,
+            text="连问模式",
+            variable=self.continuous_mode,
+            onvalue=True,
+            offvalue=False,
+            anchor='w'  # 左对齐复选框文本
+        )
+        self.continuous_checkbox.grid(row=0, column=0, sticky='w', pady=(5, 2))
+
+        # 使用缓存复选框：取消勾选时本次请求跳过缓存 (新的回复仍会写入缓存)
+        self.cache_checkbox = tk.Checkbutton(
+            self.control_frame,
+            text="使用缓存",
+            variable=self.use_cache,
+            onvalue=True,
+            offvalue=False,
+            anchor='w'
+        )
+        self.cache_checkbox.grid(row=1, column=0, sticky='w', pady=(2, 2))
+
+        # 清除当前对话按钮
+        self.clear_button = None
+        if clearable:
+            self.clear_button = tk.Button(
+                self.control_frame,
+                text="清除当前对话",
+                command=self.clear_conversation,
+                width=10,
+                bg='#f4f4f4',
+                fg='#c0392b'  # 突出颜色
+            )
+            self.clear_button.grid(row=2, column=0, sticky='ew', pady=(2, 2))
+
+        # 2.4 发送按钮 (填充水平和垂直空间)
+        self.send_button = tk.Button(
+            self.control_frame,
+            text="发送",
+            command=self.send_message,
+            width=8
+        )
+        self.send_button.grid(row=3, column=0, sticky='nsew', pady=(2, 5))
+
+        notebook.add(self.frame, text=self.title)
+
+    # --- 标签页切换 ---
+    def show(self):
+        """切换到该标签页：按顺序执行在后台时记下的控件操作"""
+        self.visible = True
+        self.unseen = False
+        deferred, self._deferred = self._deferred, []
+        for func, args in deferred:
+            func(*args)
+        if deferred:
+            self.output_text.see(tk.END)
+        self._update_tab_label()
+        self.input_entry.focus_set()
+
+    def hide(self):
+        self.visible = False
+
+    def close(self):
+        """关闭标签页：取消进行中的流，之后到达的回调不再更新控件"""
+        self.closed = True
+        self.prompt_queue.clear()
+        if self.stream_future is not None:
+            self.stream_future.cancel()
+        self._cancel_compaction()
+        self.frame.destroy()
+
+    def _render(self, func, *args):
+        """对文本控件的操作：可见时立即执行，在后台时按顺序记下"""
+        if self.closed:
+            return
+        if self.visible:
+            func(*args)
+            return
+        self._deferred.append((func, args))
+        self._mark_unseen()
+
+    def _mark_unseen(self):
+        if not self.unseen:
+            self.unseen = True
+            self._update_tab_label()
+
+    def _update_tab_label(self):
+        """标题前的标记：⏳ 正在生成，• 在后台收到了还没看过的内容"""
+        if self.closed:
+            return
+        prefix = "⏳ " if self.stream_future is not None else ("• " if self.unseen else "")
+        self.app.notebook.tab(self.frame, text=prefix + self.title)
+
+    def restore(self, turns, summary=None, auto_compact=True):
+        """
+        恢复上次会话中的这个对话 (SessionLog.load 读出的轮次和 session.json 中保存的摘要)：连问历史全部恢复，
+        显示区只渲染最后 RESTORE_TURNS 轮，更早的在滚动到顶部时加载
+        """
+        for turn in turns:
+            self.conversation.add_turn(turn["prompt"], turn["response"])
+        if summary and 0 < summary.get("turns", 0) <= self.conversation.turn_count:
+            self.conversation.set_summary(summary["text"], summary["turns"])
+        self.auto_compact = auto_compact
+        if turns:
+            self.title = self._title_for(turns[0]["prompt"])
+        self._render(self.transcript.restore,
+                     [(turn["prompt"], turn["response"], turn["model"], turn["scenario"]) for turn in turns],
+                     RESTORE_TURNS)
+        self._append_simple_text(f"\n[系统消息] 已恢复上次的 {len(turns)} 轮对话，可以直接继续追问。\n", 'ai_response')
+        self._update_tab_label()
+
+    def session_state(self):
+        """保存到 session.json 的标签页设置"""
+        summary = None
+        if self.conversation.summary:
+            summary = {"text": self.conversation.summary, "turns": self.conversation.summary_turns}
+        return {"id": self.session_id, "model": self.selected_model.get(),
+                "scenario": self.system_scenario_name.get(), "continuous": bool(self.continuous_mode.get()),
+                "summary": summary, "auto_compact": self.auto_compact}
+
+    @staticmethod
+    def _title_for(prompt):
+        return prompt[:TITLE_CHARS] + ("…" if len(prompt) > TITLE_CHARS else "")
+
+    def _on_output_scroll(self, first, last):
+        """回复区的滚动条回调：滚动到顶部且还有隐藏的轮次时，空闲时加载更早的几轮"""
+        self.output_text.vbar.set(first, last)
+        if float(first) <= 0.0 and self.transcript.hidden_count and self._reveal_pending is None:
+            self._reveal_pending = self.output_text.after_idle(self._reveal_older_turns, float(last) >= 1.0)
+
+    def _reveal_older_turns(self, at_bottom):
+        """在顶部插入更早的几轮：内容还不满一屏时保持显示末尾，否则保持当前看到的位置不动"""
+        self._reveal_pending = None
+        if self.closed:
+            return
+        self.output_text.mark_set("reveal_anchor", "@0,0")
+        self.transcript.reveal(REVEAL_TURNS)
+        if at_bottom:
+            self.output_text.see(tk.END)
+        else:
+            self.output_text.yview("reveal_anchor")
+        self.output_text.mark_unset("reveal_anchor")
+
+    def clear_conversation(self):
+        """
+        清空对话窗口内容，保留配置区域不变，并重置缓存变量。
+        """
+        # 1. 禁用文本区，清空内容
+        self._deferred = []
+        self.output_text.config(state='normal')
+        self.output_text.delete('1.0', tk.END)
+        self.output_text.config(state='disabled')
+        self.transcript.clear()
+
+        # 2. 重置缓存变量，确保追问模式兼容性
+        self.current_user_prompt = ""
+        self.current_ai_response = ""
+        self.markdown.reset()
+        self.conversation.clear()
+        self._cancel_compaction()
+        self._conversation_generation += 1
+        self.auto_compact = True
+        self.app._reset_session_log(self)
+
+        # 3. 给出系统提示
+        self._append_simple_text("\n[系统消息] 对话窗口已清空。您可以开始新的对话了。\n", 'ai_response')
+        self.input_entry.focus_set()  # 焦点回到输入框
+
+    def _on_cache_hit(self):
+        self.current_turn_meta["cached"] = True
+        self._append_simple_text("\n[系统消息] 命中本地缓存，回放已保存的回复。\n", 'ai_response')
+
+    # --- 输入逻辑 ---
+    def insert_newline(self, event):
+        """处理 Shift+Enter 快捷键，插入一个换行符"""
+        if self.input_entry.cget('state') == 'normal':
+            self.input_entry.insert(tk.INSERT, "\n")
+            return "break"
+        return
+
+    def send_message_event(self, event):
+        """处理 Enter 快捷键，发送消息 (正在生成回复时加入队列)"""
+        if self.input_entry.cget('state') == 'normal':
+            self.send_message()
+        return "break"
+
+    def send_message(self):
+        """发送输入框中的问题；正在生成回复时加入队列，输入框为空时继续发送队列中的下一条"""
+        # 原始用户输入 (用于保存)
+        original_prompt = self.input_entry.get("1.0", tk.END).strip()
+
+        if not original_prompt:
+            if self.stream_future is None:
+                self._send_next_queued(resume=True)
+            return
+
+        selected_model_name = self.selected_model.get()
+        selected_scenario_name = self.system_scenario_name.get()
+        system_prompt_content = self._check_send_settings(selected_model_name, selected_scenario_name)
+        if system_prompt_content is None:
+            return
+
+        # 清空输入框
+        self.input_entry.delete("1.0", tk.END)
+
+        if self.stream_future is not None:
+            # 正在生成回复：记下当前选择的模型和场景，等本轮结束后再发送
+            self.prompt_queue.append(original_prompt, selected_model_name, selected_scenario_name)
+            self.queue_panel.refresh()
+            return
+
+        # 用户直接发送新问题时，之前暂停的队列在本轮结束后继续
+        self.prompt_queue.resume()
+        self.queue_panel.refresh()
+        self._start_turn(original_prompt, selected_model_name, selected_scenario_name, system_prompt_content)
+
+    def _check_send_settings(self, model_name, scenario_name):
+        """检查 Key、模型、场景和保存路径，返回场景的 System Prompt；有问题时提示并返回 None"""
+        current_key = self.app.api_key.get().strip()
+        if not current_key or current_key == "Bearer YOUR_API_KEY_HERE":
+            messagebox.showerror("错误", "请先在顶部输入您的 API Key。")
+            return None
+
+        if not model_name:
+            messagebox.showerror("错误", "请选择一个大模型。")
+            return None
+
+        system_prompt_content = self.app.SYSTEM_PROMPT_MAP.get(scenario_name)
+        if not system_prompt_content:
+            messagebox.showerror("错误", "选择的场景配置无效。")
+            return None
+
+        # 检查保存路径
+        save_directory = self.app.save_directory
+        if not save_directory or not save_directory.is_dir():
+            messagebox.showerror("错误", "请先通过 '选择文件夹' 按钮设置有效的聊天记录保存路径，才能发送对话。")
+            return None
+        return system_prompt_content
+
+    def _send_next_queued(self, resume=False):
+        """发送队列中的下一条 (本轮结束后调用；resume 为 True 时先解除暂停)"""
+        if resume:
+            self.prompt_queue.resume()
+        item = self.prompt_queue.peek_next()
+        if item is None:
+            self.queue_panel.refresh()
+            return
+        system_prompt_content = self._check_send_settings(item.model_name, item.scenario_name)
+        if system_prompt_content is None:
+            # 设置有问题时保留这条问题，修正后点击 "发送" 继续
+            self.prompt_queue.pause()
+            self.queue_panel.refresh()
+            return
+        self.prompt_queue.pop_next()
+        self.queue_panel.refresh()
+        self._start_turn(item.prompt, item.model_name, item.scenario_name, system_prompt_content)
+
+    def _start_turn(self, original_prompt, selected_model_name, selected_scenario_name, system_prompt_content):
+        """开始一轮问答：显示问题并把 API 调用交给后台事件循环"""
+        from async_engine import get_engine
+        from response_cache import cache_key
+        from turn_metrics import StreamMetrics
+
+        current_key = self.app.api_key.get().strip()
+
+        # 第一个问题作为标签标题
+        if not self.conversation and self.title == f"对话 {self.number}":
+            self.title = self._title_for(original_prompt)
+
+        # 本轮显示内容从这里开始，超出保留轮数时最早的一轮会被折叠
+        self._render(self.transcript.begin_turn, original_prompt, selected_model_name, selected_scenario_name)
+
+        # 1. 追问模式：把此前的问答 (包括队列中更早的问题) 按模型预算裁剪后作为 messages 数组一并发送
+        history = None
+        if self.continuous_mode.get() and self.conversation:
+            history, report = self.context_window.fit(
+                original_prompt, system_prompt_content, self.conversation.history(), selected_model_name)
+
+            # 在界面显示一个提示，但不保存到文件
+            summary_note = ""
+            if self.conversation.summary:
+                summary_note = f"，其中最早的 {self.conversation.summary_turns} 轮以摘要发送"
+            self._append_simple_text(f"\n[系统消息] 追问模式已启用，{report.summary()}{summary_note}。", 'ai_response')
+
+        # 2. 初始化并缓存用户输入 (注意：current_user_prompt 缓存的是原始输入，用于保存)
+        self._render(self.markdown.reset)
+        self.current_user_prompt = original_prompt
+        self.current_ai_response = ""
+
+        # 3. 更新 GUI 状态并显示用户输入 (输入框保持可用，生成过程中按 Enter 加入队列)
+        # 生成过程中发送按钮变为停止按钮
+        self.send_button.config(text="停止", command=self.stop_generation)
+        self.continuous_checkbox.config(state='disabled')
+        if self.clear_button is not None:
+            self.clear_button.config(state='disabled')
+
+        self._append_simple_text(
+            f"\n--- 用户 (模型: {selected_model_name}, 场景: {selected_scenario_name}): ---\n{original_prompt}\n",
+            'user')
+        self._append_simple_text("\n--- AI 助手: ---\n", 'ai_response')
+        # 停止并丢弃部分回复时从这里删除
+        self._render(self._mark_response_start)
+
+        # 4. 本地缓存的键包含实际发送的历史消息；查询和写入都在后台进行，命中时回放已保存的回复
+        messages = build_messages(original_prompt, system_prompt_content, history)
+        open_cache = request_key = None
+        if self.app.save_directory is not None:
+            open_cache = self.app._get_response_cache
+            request_key = cache_key(selected_model_name, system_prompt_content, messages)
+        self.current_turn_meta = {
+            "scenario": selected_scenario_name,
+            "prompt_tokens": request_tokens(messages),
+            "cached": False
+        }
+        self.stream_metrics = StreamMetrics(selected_model_name, selected_scenario_name)
+        # 同时运行的流达到上限时在引擎中排队，轮到时由 _run_api_stream 改为 "等待首字"
+        self.status_text.set(f"{selected_model_name} · 排队等待...")
+
+        # 5. 把 API 调用交给共享的后台事件循环，连问模式下附带历史消息
+        # 流结束、出错或被停止后 (此前投递的数据块都已渲染)，由 on_done 在 Tk 主线程中收尾并发送队列中的下一条
+        self.stream_future = get_engine().submit(
+            self._run_api_stream(original_prompt, current_key, selected_model_name, system_prompt_content,
+                                 history, open_cache, request_key, self.use_cache.get(), self.stream_metrics),
+            on_done=lambda cancelled: self.app.bridge.post(self._on_stream_done, cancelled, selected_model_name),
+            owner=self
+        )
+        self._update_tab_label()
+
+    async def _run_api_stream(self, prompt, key, model_name, system_prompt_content, history=None,
+                              open_cache=None, request_key=None, use_cache=False, metrics=None):
+        """
+        在后台事件循环中执行 API 调用 (或回放缓存)，通过 bridge 更新 UI，并在结束时保存历史记录。
+        open_cache 是返回响应缓存的函数 (没有记录路径时为 None)：use_cache 为 True 先按 request_key 查询缓存，
+        没有命中时把完整回复写入缓存；同时在后台查询该模型最近的平均回复长度 (停止生成时估算节省的 tokens)。
+        SQLite 读写 (包括打开缓存和记录库、命中时更新的访问时间) 都在线程池中进行，不占用 Tk 主线程。
+        metrics 记录本轮的延迟指标，结束后由 _on_stream_done 显示在状态栏并写入指标文件。
+        """
+        import asyncio
+        from async_engine import get_engine
+        from response_cache import replay_stream
+
+        bridge = self.app.bridge
+        loop = asyncio.get_running_loop()
+        bridge.post(self.status_text.set, f"{model_name} · 等待首字...")
+        loop.run_in_executor(None, self._query_typical_tokens, model_name)
+        try:
+            cache = cached_response = None
+            if open_cache is not None:
+                cache = await loop.run_in_executor(None, open_cache)
+            if cache is not None and use_cache:
+                cached_response = await loop.run_in_executor(None, cache.get, request_key)
+            if cached_response is not None:
+                metrics.cached = True
+                bridge.post(self._on_cache_hit)
+                stream = replay_stream(cached_response, metrics=metrics)
+            else:
+                stream = get_engine().astream_chat(prompt, key, model_name, system_prompt_content, history,
+                                                   on_retry=self._post_stream_retry, metrics=metrics)
+
+            parts = []
+            async for chunk in stream:
+                if metrics.chunks == 1:
+                    # 首字到达，状态栏先显示连接和首字延迟
+                    bridge.post(self._update_status_bar)
+                metrics.note_posted()
+                parts.append(chunk)
+                bridge.post_text(self._process_stream_chunk, chunk)
+            metrics.finish()
+
+            bridge.post(self._flush_markdown)
+            bridge.post(self._append_simple_text, "\n[对话结束]\n", 'ai_response')
+
+            # 成功结束后，记录并保存历史 (使用 self.current_user_prompt，等前面的数据块都渲染完再读取)
+            bridge.post(self._finish_turn, model_name, metrics.timing())
+            if cache is not None and cached_response is None and parts:
+                # 不等待写入完成：之后再取消本轮也不影响已经结束的回复
+                loop.run_in_executor(None, cache.put, request_key, model_name, "".join(parts))
+
+        except Exception as e:
+            metrics.finish("error", e)
+            bridge.post(self._flush_markdown)
+            # 失败结束后，保存历史记录 (已收到的部分回复也计入上下文)
+            bridge.post(self._finish_turn, model_name, metrics.timing())
+            bridge.post(self._append_simple_text, f"\n[错误信息] API 调用失败或网络错误: {e}\n", 'error')
+
+    def _finish_turn(self, model_name, timing=None):
+        """在 Tk 主线程中把本轮问答记入结构化历史并保存到文件 (timing 为首字延迟和总耗时)"""
+        self.conversation.add_turn(self.current_user_prompt, self.current_ai_response)
+        if self.current_ai_response:
+            self.app._log_session_turn(self, model_name, self.current_turn_meta.get("scenario", ""),
+                                       self.current_user_prompt, self.current_ai_response)
+        meta = dict(self.current_turn_meta, **(timing or {}))
+        self.app._save_chat_history(self.current_user_prompt, self.current_ai_response, model_name, meta)
+
+    def stop_generation(self):
+        """
+        取消后台事件循环中的流：协程在当前的 await 处收到 CancelledError，
+        退出时关闭 HTTP 响应 (连接不再复用，直接释放 socket)，不必等模型写完。
+        """
+        if self.stream_future is None or self.stream_future.done():
+            return
+        self.send_button.config(state='disabled')
+        self.stream_future.cancel()
+
+    def _on_stream_done(self, cancelled, model_name):
+        if cancelled:
+            self.stream_metrics.finish("stopped")
+            if not self.closed:
+                self._on_stream_stopped(model_name)
+        self._record_metrics()
+        self.stream_future = None
+        if self.closed:
+            return
+        self._end_transcript_turn()
+        self._enable_input()
+        self._update_tab_label()
+        # 停止或出错后队列暂停，避免剩下的问题接着失败或用户并不想再发送
+        self.prompt_queue.turn_finished(stopped=cancelled, failed=self.stream_metrics.status == "error")
+        self._send_next_queued()
+        self._schedule_compaction()
+
+    def _query_typical_tokens(self, model_name):
+        """
+        在线程池中执行：第一次发送时在这里打开 (并按需升级) 记录库，记录库的锁也可能正被聊天记录写入线程
+        占用 (批量写入全文索引)，不能让 Tk 主线程等待；没有记录路径或期间换了记录路径 (记录库已关闭) 时放弃这次查询
+        """
+        import sqlite3
+        try:
+            store = self.app._get_chat_store()
+            if store is None:
+                return
+            typical = store.average_response_tokens(model_name)
+        except sqlite3.Error:
+            return
+        self.app.bridge.post(self._set_typical_tokens, model_name, typical)
+
+    def _set_typical_tokens(self, model_name, typical):
+        self._typical_tokens[model_name] = typical
+
+    def _on_stream_stopped(self, model_name):
+        """
+        按设置保留或丢弃部分回复，并估算停止节省的输出 tokens (与该模型最近的平均回复长度相比；
+        没有记录路径或后台查询还没有结果时不估算)
+        """
+        self._flush_markdown()
+        received = estimate_tokens(self.current_ai_response)
+        typical = self._typical_tokens.get(model_name) if self.app.save_directory is not None else None
+
+        if self.app.keep_partial_on_stop and self.current_ai_response:
+            # 保留的部分回复照常写入记录 (不写入缓存)，并标记为中途停止
+            self._finish_turn(model_name, dict(self.stream_metrics.timing(), stopped=True))
+            action = "已保留部分回复"
+        else:
+            self._render(self._discard_response)
+            self.current_ai_response = ""
+            action = "已丢弃部分回复"
+
+        report = f"\n[系统消息] 已停止生成，{action} (已接收约 {received} tokens"
+        if typical is not None and typical > received:
+            report += f"，按该模型最近的平均回复长度估计节省约 {typical - received} tokens"
+        self._append_simple_text(report + ")。\n", 'error')
+
+    def _post_stream_retry(self, attempt, delay, error, resuming):
+        """由后台事件循环在每次重试前调用，把提示转交给 Tk 主线程显示"""
+        self.app.bridge.post(self._on_stream_retry, attempt, delay, error, resuming)
+
+    def _on_stream_retry(self, attempt, delay, error, resuming):
+        action = "从已收到的内容续写" if resuming else "重新发送"
+        self._append_simple_text(f"\n[系统消息] {error}，{delay:.1f} 秒后{action} (第 {attempt} 次重试)…\n", 'error')
+
+    # --- 连问历史的后台压缩 ---
+    def _schedule_compaction(self, event=None):
+        """用户空闲一段时间后检查是否需要压缩历史 (每次按键重新计时)"""
+        if self._compaction_timer is not None:
+            self.output_text.after_cancel(self._compaction_timer)
+            self._compaction_timer = None
+        if self.closed or not self.auto_compact or not self.compactor.enabled or self.compaction_future is not None:
+            return
+        if not self.continuous_mode.get() or not self.conversation:
+            return
+        self._compaction_timer = self.output_text.after(int(self.compactor.idle_seconds * 1000),
+                                                        self._start_compaction)
+
+    def _start_compaction(self):
+        """空闲时 (没有进行中的回复和排队的问题) 把较早的轮次交给摘要模型，结果由 _on_compaction_done 应用"""
+        from async_engine import get_engine
+
+        self._compaction_timer = None
+        if self.closed or self.stream_future is not None or self.prompt_queue or self.compaction_future is not None:
+            return
+        plan = self.compactor.plan(self.conversation)
+        if plan is None:
+            return
+        self.compaction_future = get_engine().submit(
+            self._run_compaction(plan, self.app.api_key.get().strip(), self._conversation_generation), owner=self)
+
+    async def _run_compaction(self, plan, key, generation):
+        try:
+            summary = await self.compactor.summarize(plan, key)
+        except Exception as e:
+            self.app.bridge.post(self._on_compaction_done, plan, generation, None, e)
+            return
+        self.app.bridge.post(self._on_compaction_done, plan, generation, summary, None)
+
+    def _on_compaction_done(self, plan, generation, summary, error):
+        self.compaction_future = None
+        # 期间对话被清空、摘要被撤销或标签页已关闭
+        if self.closed or generation != self._conversation_generation or not self.auto_compact:
+            return
+        if error is not None:
+            self._append_simple_text(f"\n[系统消息] 压缩较早的对话失败，追问时仍逐字发送：{error}\n", 'error')
+            return
+        summary_tokens = plan.apply(self.conversation, summary)
+        if summary_tokens is None:
+            return
+        self._render(self._write_summary_notice, plan.turns, plan.replaced_tokens, summary_tokens)
+        self.app._save_session()
+
+    def _write_summary_notice(self, turns, replaced_tokens, summary_tokens):
+        """回复区中的提示，带 "查看摘要" 和 "撤销" 两个链接"""
+        self._summary_notices += 1
+        view_tag = f"summary_view{self._summary_notices}"
+        revert_tag = f"summary_revert{self._summary_notices}"
+        self.output_text.config(state='normal')
+        self.output_text.insert(tk.END, f"\n[系统消息] 已在空闲时把最早的 {turns} 轮对话压缩为摘要 "
+                                        f"(约 {replaced_tokens} → {summary_tokens} tokens)，"
+                                        f"之后的追问发送摘要和最近几轮原文。", 'ai_response')
+        self.output_text.insert(tk.END, " [查看摘要]", ('summary_link', view_tag))
+        self.output_text.insert(tk.END, " [撤销]", ('summary_link', revert_tag))
+        self.output_text.insert(tk.END, "\n")
+        self.output_text.tag_bind(view_tag, '<Button-1>', lambda event: self.show_summary())
+        self.output_text.tag_bind(revert_tag, '<Button-1>', lambda event: self.revert_summary())
+        self.output_text.see(tk.END)
+        self.output_text.config(state='disabled')
+
+    def show_summary(self):
+        """在单独的窗口中显示当前摘要，可以从这里撤销"""
+        summary = self.conversation.summary
+        if not summary:
+            messagebox.showinfo("对话摘要", "当前对话没有摘要，追问时逐字发送全部历史。", parent=self.app.master)
+            return
+        window = tk.Toplevel(self.app.master)
+        window.title(f"{self.title} · 对话摘要")
+        window.geometry("640x480")
+        tk.Label(window, text=f"代替最早的 {self.conversation.summary_turns} 轮对话 (由 {self.compactor.model_name} 生成)",
+                 anchor='w', fg='#555555').pack(fill='x', padx=10, pady=(10, 5))
+        summary_text = scrolledtext.ScrolledText(window, wrap=tk.WORD, font=('Arial', 10), padx=10, pady=10)
+        summary_text.insert(tk.END, summary)
+        summary_text.config(state='disabled')
+        summary_text.pack(fill='both', expand=True, padx=10)
+
+        def revert():
+            self.revert_summary()
+            window.destroy()
+
+        tk.Button(window, text="撤销摘要，恢复逐字发送", command=revert).pack(pady=10)
+
+    def revert_summary(self):
+        """撤销摘要：之后的追问重新逐字发送全部历史，本对话不再自动压缩"""
+        if not self.conversation.summary:
+            return
+        turns = self.conversation.summary_turns
+        self.conversation.revert_summary()
+        self.auto_compact = False
+        self._cancel_compaction()
+        self._append_simple_text(f"\n[系统消息] 已撤销摘要，之后的追问逐字发送最早的 {turns} 轮，本对话不再自动压缩。\n",
+                                 'ai_response')
+        self.app._save_session()
+
+    def _cancel_compaction(self):
+        if self._compaction_timer is not None:
+            self.output_text.after_cancel(self._compaction_timer)
+            self._compaction_timer = None
+        if self.compaction_future is not None:
+            self.compaction_future.cancel()
+            self.compaction_future = None
+
+    # --- 延迟指标 (状态栏 + 后台写入指标文件) ---
+    def _update_status_bar(self):
+        metrics = self.stream_metrics
+        self.status_text.set(f"{metrics.model_name} · {metrics.summary()}")
+
+    def _record_metrics(self):
+        """本轮结束 (此前的数据块都已渲染)：状态栏显示完整指标，并交给后台线程写入指标文件"""
+        self.stream_metrics.finish()
+        self._update_status_bar()
+        self.app._get_metrics_recorder().record(self.stream_metrics)
+
+    # --- Markdown 渲染和辅助函数 (增量渲染) ---
+
+    def _process_stream_chunk(self, chunk):
+        """
+        一帧内合并后的文本：先记入本轮回复；可见时只对新追加的部分打标签，每段标签一次 insert，最后只滚动一次，
+        在后台时与相邻的文本块合并，等切换到该标签页时一起渲染
+        """
+        self.current_ai_response += chunk
+        self.stream_metrics.note_rendered()
+        if self.closed:
+            return
+        if self.visible:
+            self._render_chunks(chunk)
+            return
+        if self._deferred and self._deferred[-1][0] == self._render_chunks:
+            self._deferred[-1][1].append(chunk)
+        else:
+            self._deferred.append((self._render_chunks, [chunk]))
+            self._mark_unseen()
+
+    def _render_chunks(self, *chunks):
+        self.output_text.config(state='normal')
+        for text, tags in self.markdown.feed("".join(chunks)):
+            self._insert_text(text, tags)
+        self.output_text.see(tk.END)
+        self.output_text.config(state='disabled')
+
+    def _flush_markdown(self):
+        """回复结束时输出渲染器暂存的字符 (例如结尾处落单的 *)"""
+        self._render(self._render_markdown_tail)
+
+    def _render_markdown_tail(self):
+        segments = self.markdown.flush()
+        if segments:
+            self.output_text.config(state='normal')
+            for text, tags in segments:
+                self._insert_text(text, tags)
+            self.output_text.config(state='disabled')
+
+    def _mark_response_start(self):
+        self.output_text.mark_set("response_start", "end-1c")
+        self.output_text.mark_gravity("response_start", 'left')
+
+    def _discard_response(self):
+        self.output_text.config(state='normal')
+        self.output_text.delete("response_start", "end-1c")
+        self.output_text.config(state='disabled')
+
+    def _insert_text(self, text, tag=None):
+        self.output_text.insert(tk.END, text, tag)
+
+    def _append_simple_text(self, text, tag=None):
+        self._render(self._write_text, text, tag)
+
+    def _write_text(self, text, tag=None):
+        self.output_text.config(state='normal')
+        self.output_text.insert(tk.END, text, tag)
+        self.output_text.see(tk.END)
+        self.output_text.config(state='disabled')
+
+    def _end_transcript_turn(self):
+        """把本轮回复交给 TranscriptView 保存，折叠后可以重新展开"""
+        self._render(self.transcript.end_turn, self.current_ai_response)
+
+    def _enable_input(self):
+        self.input_entry.config(state='normal')
+        self.send_button.config(text="发送", command=self.send_message, state='normal')
+        self.continuous_checkbox.config(state='normal')
+        if self.clear_button is not None:
+            self.clear_button.config(state='normal')
+        if self.visible:
+            self.input_entry.focus_set()
@@ -0,0 +1,268 @@
+import tkinter as tk
+from tkinter import scrolledtext, messagebox
+
+from async_engine import get_engine
+from context_window import request_tokens
+from conversation import build_messages
+from markdown_stream import StreamingMarkdownRenderer
+from turn_metrics import StreamMetrics
+
+
+# --- 多模型对比 (fan-out) ---
+# 同一个问题同时发给多个模型，每个模型在独立的窗格中流式显示，并各自统计首字延迟和总耗时。
+# 每个模型是一个独立的协程，慢模型不会阻塞快模型；结束后各自带模型名写入聊天记录，延迟指标写入指标文件。
+# 对比模式不读取本地缓存，保证计时反映真实的网络与模型延迟。
+
+
+def configure_markdown_tags(text_widget):
+    """与主窗口一致的 Markdown 标签样式"""
+    text_widget.tag_config('ai_response', foreground='#006400')
+    text_widget.tag_config('error', foreground='#FF0000', font=('Arial', 10, 'bold'))
+    text_widget.tag_config('bold', font=('Arial', 10, 'bold'), foreground='#2c3e50')
+    text_widget.tag_config('code_block', background='#2d2d2d', foreground='#cccccc', font=('Courier', 10))
+    text_widget.tag_config('code_lang', foreground='#9cdcfe', font=('Courier', 10, 'italic'))
+    text_widget.tag_config('inline_code', background='#e1e4e8', foreground='#c7254e', font=('Courier', 10))
+    text_widget.tag_config('heading1', font=('Arial', 15, 'bold'), foreground='#2c3e50')
+    text_widget.tag_config('heading2', font=('Arial', 13, 'bold'), foreground='#2c3e50')
+    text_widget.tag_config('heading3', font=('Arial', 11, 'bold'), foreground='#2c3e50')
+    text_widget.tag_config('list_item', lmargin1=10, lmargin2=26)
+
+
+class ModelPane:
+    """一个模型的输出窗格：独立的 Markdown 解析状态、计时读数和回复缓冲"""
+
+    def __init__(self, parent, model_name):
+        self.model_name = model_name
+        self.markdown = StreamingMarkdownRenderer()
+        self.response = ""
+        self.future = None
+        # 本轮的延迟指标 (由协程创建)
+        self.metrics = None
+        # 窗口关闭后仍可能有已排队的回调，此时直接忽略
+        self.closed = False
+
+        self.frame = tk.Frame(parent, bd=1, relief='groove')
+        self.title_label = tk.Label(self.frame, text=model_name, font=('Arial', 10, 'bold'))
+        self.title_label.pack(fill='x')
+
+        self.timing = tk.StringVar(value="等待发送")
+        self.timing_label = tk.Label(self.frame, textvariable=self.timing, fg='#555555')
+        self.timing_label.pack(fill='x')
+
+        self.output_text = scrolledtext.ScrolledText(
+            self.frame,
+            wrap=tk.WORD,
+            state='disabled',
+            font=('Arial', 10),
+            bg='#f0f0f0',
+            fg='#333333',
+            width=40,
+            padx=8,
+            pady=8
+        )
+        self.output_text.pack(fill='both', expand=True)
+        configure_markdown_tags(self.output_text)
+
+    def reset(self):
+        self.markdown.reset()
+        self.response = ""
+        self.timing.set("等待首字...")
+        self.output_text.config(state='normal')
+        self.output_text.delete("1.0", tk.END)
+        self.output_text.config(state='disabled')
+
+    # --- 以下方法都通过 bridge 在 Tk 主线程中执行 ---
+
+    def process_chunk(self, chunk):
+        if self.closed:
+            return
+        self.response += chunk
+        self.output_text.config(state='normal')
+        for text, tags in self.markdown.feed(chunk):
+            self.output_text.insert(tk.END, text, tags)
+        self.output_text.see(tk.END)
+        self.output_text.config(state='disabled')
+        self.metrics.note_rendered()
+
+    def show_first_token(self, ttft):
+        if self.closed:
+            return
+        self.timing.set(f"首字 {ttft * 1000:.0f} ms · 生成中...")
+
+    def show_retry(self, attempt, delay):
+        if self.closed:
+            return
+        self.timing.set(f"第 {attempt} 次重试，{delay:.1f} 秒后重新请求...")
+
+    def finish(self, ttft, total, error=None):
+        if self.closed:
+            return
+        segments = self.markdown.flush()
+        self.output_text.config(state='normal')
+        for text, tags in segments:
+            self.output_text.insert(tk.END, text, tags)
+        if error:
+            self.output_text.insert(tk.END, f"\n[API 错误]：{error}\n", 'error')
+        self.output_text.see(tk.END)
+        self.output_text.config(state='disabled')
+
+        first = f"首字 {ttft * 1000:.0f} ms" if ttft is not None else "首字 -"
+        status = "失败" if error else f"{len(self.response)} 字"
+        self.timing.set(f"{first} · 总耗时 {total:.2f} s · {status}")
+
+
+class FanoutWindow:
+    """
+    多模型对比窗口。与主窗口共用 API Key、场景、记录路径和事件桥接，
+    每一轮只发送本轮输入 (不附带连问历史)，便于横向比较。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.panes = {}
+        self.pending = 0
+        self.closed = False
+
+        self.window = tk.Toplevel(app.master)
+        self.window.title("多模型对比")
+        self.window.geometry("1400x800")
+
+        # --- 1. 模型勾选 ---
+        self.select_frame = tk.Frame(self.window, padx=10, pady=5)
+        self.select_frame.pack(fill='x')
+        tk.Label(self.select_frame, text="🤖 对比模型:").pack(side='left', padx=(0, 5))
+
+        self.model_vars = {}
+        for index, model_name in enumerate(app.MODEL_LIST):
+            var = tk.BooleanVar(value=index < 3)
+            self.model_vars[model_name] = var
+            tk.Checkbutton(self.select_frame, text=model_name, variable=var).pack(side='left')
+
+        # --- 2. 并排的输出窗格 ---
+        self.pane_container = tk.PanedWindow(self.window, orient=tk.HORIZONTAL, sashrelief='raised')
+        self.pane_container.pack(fill='both', expand=True, padx=10, pady=5)
+
+        # --- 3. 输入 ---
+        self.input_frame = tk.Frame(self.window, pady=10)
+        self.input_frame.pack(fill='x', padx=10, pady=(5, 10))
+
+        self.input_entry = tk.Text(self.input_frame, height=3, wrap=tk.WORD, font=('Arial', 10), bd=1,
+                                   relief='groove')
+        self.input_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        self.input_entry.bind("<Return>", self.send_message_event)
+        self.input_entry.bind("<Shift-Return>", lambda event: None)
+
+        self.send_button = tk.Button(self.input_frame, text="同时发送", command=self.send_message, height=3)
+        self.send_button.pack(side='right')
+
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.input_entry.focus_set()
+
+    def send_message_event(self, event):
+        if self.input_entry.cget('state') == 'normal':
+            self.send_message()
+        return "break"
+
+    def send_message(self):
+        prompt = self.input_entry.get("1.0", tk.END).strip()
+        current_key = self.app.api_key.get().strip()
+        scenario_name = self.app.system_scenario_name.get()
+        system_prompt_content = self.app.SYSTEM_PROMPT_MAP.get(scenario_name)
+        models = [name for name, var in self.model_vars.items() if var.get()]
+
+        if not prompt:
+            return
+        if not current_key or current_key == "Bearer YOUR_API_KEY_HERE":
+            messagebox.showerror("错误", "请先在主窗口顶部输入您的 API Key。", parent=self.window)
+            return
+        if len(models) < 2:
+            messagebox.showerror("错误", "请至少勾选两个模型进行对比。", parent=self.window)
+            return
+        if not system_prompt_content:
+            messagebox.showerror("错误", "选择的场景配置无效。", parent=self.window)
+            return
+        if not self.app.save_directory or not self.app.save_directory.is_dir():
+            messagebox.showerror("错误", "请先在主窗口设置有效的聊天记录保存路径。", parent=self.window)
+            return
+
+        self._layout_panes(models)
+        self.input_entry.delete("1.0", tk.END)
+        self.input_entry.config(state='disabled')
+        self.send_button.config(state='disabled')
+
+        # 每个模型一个协程，同时提交给共享的事件循环
+        self.pending = len(models)
+        meta = {
+            "scenario": scenario_name,
+            "prompt_tokens": request_tokens(build_messages(prompt, system_prompt_content))
+        }
+        for model_name in models:
+            pane = self.panes[model_name]
+            pane.reset()
+            # 同一轮的多个模型算作一个 owner，排队时与各个标签页轮流开始
+            pane.future = get_engine().submit(
+                self._run_model_stream(pane, prompt, current_key, system_prompt_content, meta),
+                owner=self
+            )
+
+    def _layout_panes(self, models):
+        """按本轮勾选的模型排列窗格：复用已有窗格，销毁取消勾选的窗格"""
+        for model_name in list(self.panes):
+            if model_name not in models:
+                pane = self.panes.pop(model_name)
+                self.pane_container.forget(pane.frame)
+                pane.frame.destroy()
+        for model_name in models:
+            if model_name not in self.panes:
+                self.panes[model_name] = ModelPane(self.pane_container, model_name)
+        for pane in self.panes.values():
+            self.pane_container.forget(pane.frame)
+        for model_name in models:
+            self.pane_container.add(self.panes[model_name].frame, stretch='always', minsize=200)
+
+    async def _run_model_stream(self, pane, prompt, key, system_prompt_content, meta):
+        """在后台事件循环中读取一个模型的流，计时后通过 bridge 更新对应窗格"""
+        bridge = self.app.bridge
+        # 第一个协程负责创建 HTTP 客户端，不计入首字延迟，多个模型的计时起点才一致
+        get_engine().warm_up()
+        metrics = pane.metrics = StreamMetrics(pane.model_name, meta["scenario"])
+        error = None
+        try:
+            on_retry = lambda attempt, delay, e, resuming: bridge.post(pane.show_retry, attempt, delay)
+            async for chunk in get_engine().astream_chat(prompt, key, pane.model_name, system_prompt_content,
+                                                         on_retry=on_retry, metrics=metrics):
+                if metrics.chunks == 1:
+                    bridge.post(pane.show_first_token, metrics.ttft)
+                metrics.note_posted()
+                bridge.post_text(pane.process_chunk, chunk)
+            metrics.finish()
+        except Exception as e:
+            error = str(e)
+            metrics.finish("error", e)
+        finally:
+            # 关闭窗口时协程被取消
+            metrics.finish("stopped")
+            bridge.post(pane.finish, metrics.ttft, metrics.duration, error)
+            bridge.post(self._model_done, pane, prompt, error, dict(meta, **metrics.timing()))
+
+    def _model_done(self, pane, prompt, error, meta):
+        """某个模型结束：成功时带模型名写入聊天记录；全部结束后恢复输入"""
+        if self.closed:
+            # 关闭窗口会取消未完成的流，不完整的回复不写入记录
+            return
+        if not error and pane.response:
+            self.app._save_chat_history(prompt, pane.response, pane.model_name, meta)
+        self.app._get_metrics_recorder().record(pane.metrics)
+        self.pending -= 1
+        if self.pending == 0:
+            self.input_entry.config(state='normal')
+            self.send_button.config(state='normal')
+            self.input_entry.focus_set()
+
+    def close(self):
+        self.closed = True
+        for pane in self.panes.values():
+            pane.closed = True
+            if pane.future is not None:
+                pane.future.cancel()
+        self.window.destroy()
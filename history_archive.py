@@ -0,0 +1,188 @@
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+
+from history_writer import HISTORY_FILENAME_FORMAT
+
+
+# --- 聊天记录压缩归档 ---
+# 每日 Markdown 文件只会越积越多。已经结束的日期 (默认是今天以前的) 由写入线程压缩进按月轮换的归档：
+#   YYYYMM-chatbot-archive.md.gz   每一轮问答是一个独立的 gzip 成员，依次追加；
+#                                  整个文件仍然是合法的 gzip，zcat 的结果与原来的 Markdown 文件逐字相同
+#   YYYYMM-chatbot-archive.idx     每行一个 JSON：日期、时间、模型、成员在归档中的偏移和长度
+# 浏览和导入只按索引定位需要的轮次，跳到偏移处解压这一个成员，不需要解压整个归档。
+# 先写入并校验压缩数据，再追加索引，最后才删除 Markdown 文件；中途中断时下次会从索引记录的位置继续。
+
+ARCHIVE_FILENAME_FORMAT = "%Y%m-chatbot-archive.md.gz"
+INDEX_FILENAME_FORMAT = "%Y%m-chatbot-archive.idx"
+
+COMPRESS_LEVEL = 9
+
+# 每轮记录的开头 (见 history_writer.format_record)
+_RECORD_START_RE = re.compile(r"\n## 🤖 对话记录 \(\d{8}\)\n")
+_RECORD_HEADER_RE = re.compile(r"### \*\*\[(\d\d:\d\d:\d\d)\]\*\* 模型: (.*?)\n")
+_DAY_FILE_RE = re.compile(re.escape(HISTORY_FILENAME_FORMAT).replace("%Y%m%d", r"(\d{8})"))
+
+
+def split_records(text):
+    """把每日 Markdown 文本切成逐轮的片段 (开头不属于任何一轮的内容单独成段)，拼接起来等于原文"""
+    starts = [match.start() for match in _RECORD_START_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)]) if end > start]
+
+
+class HistoryArchive:
+    """
+    记录路径下的压缩归档。写入 (archive_closed_days) 只在聊天记录写入线程中进行，
+    读取可以在任意线程中进行：索引总是在压缩数据写完之后才追加，读到的条目都指向完整的成员。
+    """
+
+    def __init__(self, directory, compress_level=COMPRESS_LEVEL):
+        self.directory = directory
+        self.compress_level = compress_level
+        # 月份 -> (索引文件大小, 条目列表, 完整行的字节数)
+        self._index_cache = {}
+
+    # --- 索引 ---
+
+    def months(self):
+        """已有归档的月份 ("YYYYMM")，按时间顺序"""
+        pattern = INDEX_FILENAME_FORMAT.replace("%Y%m", "*")
+        return sorted(path.name[:6] for path in self.directory.glob(pattern))
+
+    def _index_path(self, month):
+        return self.directory / INDEX_FILENAME_FORMAT.replace("%Y%m", month)
+
+    def _archive_path(self, month):
+        return self.directory / ARCHIVE_FILENAME_FORMAT.replace("%Y%m", month)
+
+    def entries(self, month):
+        """某个月的索引条目：day、time、model (不是完整的一轮时为 None)、offset、size"""
+        return self._load_index(month)[1]
+
+    def _load_index(self, month):
+        path = self._index_path(month)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return 0, [], 0
+        cached = self._index_cache.get(month)
+        if cached is not None and cached[0] == size:
+            return cached
+        entries = []
+        valid = 0
+        with path.open('rb') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 写到一半的最后一行
+                    break
+                if not line.endswith(b"\n"):
+                    entries.pop()
+                    break
+                valid += len(line)
+        self._index_cache[month] = (size, entries, valid)
+        return self._index_cache[month]
+
+    def days(self):
+        """已归档的日期 -> 该日期的条目列表"""
+        days = {}
+        for month in self.months():
+            for entry in self.entries(month):
+                days.setdefault(entry["day"], []).append(entry)
+        return days
+
+    # --- 读取 ---
+
+    def read_entry(self, entry):
+        """只解压一个条目 (一轮问答) 对应的 gzip 成员"""
+        with self._archive_path(entry["day"][:6]).open('rb') as f:
+            f.seek(entry["offset"])
+            return gzip.decompress(f.read(entry["size"])).decode('utf-8')
+
+    def read_day(self, day):
+        """还原某一天的 Markdown 文本 (与归档前的文件内容相同)；只解压这一天的成员"""
+        entries = [entry for entry in self.entries(day[:6]) if entry["day"] == day]
+        if not entries:
+            return ""
+        # 同一天的成员通常是连续写入的，一次读出这一段再逐个解压
+        start = entries[0]["offset"]
+        end = entries[-1]["offset"] + entries[-1]["size"]
+        with self._archive_path(day[:6]).open('rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return "".join(gzip.decompress(data[entry["offset"] - start:entry["offset"] - start + entry["size"]])
+                       .decode('utf-8') for entry in entries)
+
+    # --- 归档 ---
+
+    def closed_day_files(self, before):
+        """记录路径下日期早于 before (date) 的每日 Markdown 文件，按日期排序"""
+        files = []
+        for path in self.directory.glob(HISTORY_FILENAME_FORMAT.replace("%Y%m%d", "*")):
+            match = _DAY_FILE_RE.fullmatch(path.name)
+            if match and datetime.strptime(match.group(1), "%Y%m%d").date() < before:
+                files.append((match.group(1), path))
+        return sorted(files)
+
+    def archive_closed_days(self, before):
+        """把日期早于 before 的每日 Markdown 文件压缩进归档并删除原文件，返回 [(日期, 轮数)]"""
+        archived = []
+        for day, path in self.closed_day_files(before):
+            text = path.read_text(encoding='utf-8')
+            # 上次归档后被中断 (索引已写、文件未删)，或者之后又有同一天的记录写入：只归档新增的部分
+            previous = self.read_day(day)
+            if previous and text.startswith(previous):
+                text = text[len(previous):]
+            count = self._append(day, split_records(text)) if text else 0
+            path.unlink()
+            archived.append((day, count))
+        return archived
+
+    def _append(self, day, records):
+        month = day[:6]
+        archive_path = self._archive_path(month)
+        _size, entries, index_end = self._load_index(month)
+        # 只信任索引：丢弃上次写入数据后、追加索引前中断留下的尾部
+        end = entries[-1]["offset"] + entries[-1]["size"] if entries else 0
+
+        new_entries = []
+        with archive_path.open('ab') as f:
+            f.truncate(end)
+            f.seek(end)
+            offset = end
+            for record in records:
+                data = gzip.compress(record.encode('utf-8'), compresslevel=self.compress_level, mtime=0)
+                f.write(data)
+                header = _RECORD_HEADER_RE.search(record)
+                new_entries.append({
+                    "day": day,
+                    "time": header.group(1) if header else None,
+                    "model": header.group(2) if header else None,
+                    "offset": offset,
+                    "size": len(data)
+                })
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # 删除原文件之前确认每一轮都能原样解压出来
+        for entry, record in zip(new_entries, records):
+            if self.read_entry(entry) != record:
+                raise OSError(f"归档 {archive_path.name} 校验失败 ({day} {entry['time']})")
+
+        with self._index_path(month).open('ab') as f:
+            f.truncate(index_end)
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in new_entries).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(new_entries)
+
+
+def archive_cutoff(keep_days, today=None):
+    """保留最近 keep_days 天 (含今天) 的 Markdown 文件，返回归档的截止日期"""
+    return (today or date.today()) - timedelta(days=max(keep_days, 1) - 1)
@@ -0,0 +1,107 @@
+import os
+
+from context_window import estimate_tokens, message_tokens
+
+
+# --- 连问历史的后台压缩 ---
+# 连问模式每次追问都会重新发送全部历史，对话一长首字延迟和费用都会明显上升。
+# 发送的历史超过阈值后，在用户空闲时 (回复结束、没有排队的问题、输入框停止输入一段时间) 用一个便宜的模型
+# 把较早的轮次连同此前的摘要合并成新的滚动摘要，之后的追问发送 "摘要 + 最近几轮原文"。
+# 摘要只影响发送的内容：原始问答仍然完整保存在 Conversation 中，用户可以查看摘要或撤销，恢复逐字发送。
+
+DEFAULT_SUMMARY_MODEL = "claude-haiku-4-5-20251001"
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责压缩一段对话的历史，供之后的对话作为上下文使用。"
+    "请把此前的摘要和新给出的对话合并成一份完整、简洁的摘要："
+    "保留用户的目标和偏好、已经确认的事实和结论、做出的约定、仍未解决的问题，"
+    "以及代码中关键的文件名、函数名、接口和数值；省略寒暄、重复和已被推翻的内容。"
+    "使用对话原本的语言，只输出摘要本身。"
+)
+
+
+class CompactionPlan:
+    """一次压缩：把此前的摘要和新并入的消息合并为覆盖最早 turns 轮的新摘要"""
+
+    def __init__(self, previous_summary, messages, turns, replaced_tokens):
+        self.previous_summary = previous_summary
+        self.messages = messages
+        self.turns = turns
+        # 新摘要代替的内容 (旧摘要 + 新并入的轮次) 的 tokens
+        self.replaced_tokens = replaced_tokens
+
+    def prompt(self):
+        parts = []
+        if self.previous_summary:
+            parts.append(f"此前的摘要：\n{self.previous_summary}")
+        lines = [f"【{'用户' if message['role'] == 'user' else '助手'}】\n{message['content']}"
+                 for message in self.messages]
+        parts.append("需要并入摘要的对话：\n\n" + "\n\n".join(lines))
+        parts.append("请输出更新后的完整摘要。")
+        return "\n\n".join(parts)
+
+    def apply(self, conversation, summary):
+        """
+        摘要比它代替的内容短时写入 conversation，返回摘要的 tokens；
+        摘要为空或没有变短 (压缩反而让发送的内容更长) 时丢弃，返回 None
+        """
+        summary_tokens = estimate_tokens(summary) if summary else 0
+        if not summary or summary_tokens >= self.replaced_tokens:
+            return None
+        conversation.set_summary(summary, self.turns)
+        return summary_tokens
+
+
+class HistoryCompactor:
+    """
+    决定何时压缩以及调用摘要模型。参数可通过环境变量覆盖：
+      CHATBOT_SUMMARY                0 表示不自动压缩
+      CHATBOT_SUMMARY_MODEL          生成摘要的模型
+      CHATBOT_SUMMARY_THRESHOLD      发送的历史超过这么多 tokens 时压缩
+      CHATBOT_SUMMARY_KEEP_TURNS     始终逐字发送的最近轮数
+      CHATBOT_SUMMARY_IDLE_SECONDS   用户空闲多久之后开始压缩
+    """
+
+    def __init__(self, enabled=True, model_name=DEFAULT_SUMMARY_MODEL, threshold_tokens=4000, keep_recent_turns=2,
+                 idle_seconds=3.0):
+        self.enabled = enabled
+        self.model_name = model_name
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.idle_seconds = idle_seconds
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get("CHATBOT_SUMMARY", "1").lower() not in ("0", "false", "no"),
+            model_name=os.environ.get("CHATBOT_SUMMARY_MODEL", DEFAULT_SUMMARY_MODEL),
+            threshold_tokens=int(os.environ.get("CHATBOT_SUMMARY_THRESHOLD", 4000)),
+            keep_recent_turns=int(os.environ.get("CHATBOT_SUMMARY_KEEP_TURNS", 2)),
+            idle_seconds=float(os.environ.get("CHATBOT_SUMMARY_IDLE_SECONDS", 3.0))
+        )
+
+    def plan(self, conversation):
+        """发送的历史超过阈值、且最近几轮之前还有没压缩的轮次时返回 CompactionPlan，否则返回 None"""
+        if not self.enabled:
+            return None
+        history = conversation.history()
+        if sum(message_tokens(message) for message in history) <= self.threshold_tokens:
+            return None
+        turns = conversation.turn_count - self.keep_recent_turns
+        if turns <= conversation.summary_turns:
+            return None
+        messages = [dict(message) for message in conversation.messages[2 * conversation.summary_turns:2 * turns]]
+        replaced_tokens = sum(message_tokens(message) for message in messages)
+        if conversation.summary:
+            # history 开头的两条是摘要
+            replaced_tokens += message_tokens(history[0]) + message_tokens(history[1])
+        return CompactionPlan(conversation.summary, messages, turns, replaced_tokens)
+
+    async def summarize(self, plan, api_key):
+        """在引擎的事件循环中调用摘要模型 (同样经过限流和重试)，返回摘要文本"""
+        from async_engine import get_engine
+
+        parts = []
+        async for chunk in get_engine().astream_chat(plan.prompt(), api_key, self.model_name, SUMMARY_SYSTEM_PROMPT):
+            parts.append(chunk)
+        return "".join(parts).strip()
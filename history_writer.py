@@ -0,0 +1,194 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+# --- 后台聊天记录写入 ---
+# 保存请求只是把一条记录放进内存队列，Tk 主线程不再做任何磁盘 I/O。
+# 写入线程一次取出队列中积压的全部记录批量写入，当天的文件句柄保持打开，跨过午夜时切换到新一天的文件。
+# 指定了 ChatStore 时，同一批记录 (连同场景、延迟等元数据) 在一个事务中写入记录库。
+# 写入线程启动时和每次切换到新一天的文件后，把已经结束的日期压缩进归档 (见 history_archive.py)。
+
+HISTORY_FILENAME_FORMAT = "%Y%m%d-chatbot-data.md"
+
+_CLOSE = object()
+
+
+def format_record(prompt, response, model_name, timestamp):
+    """一轮问答的 Markdown 记录 (格式与原来逐条追加写入时相同)"""
+    return f"""
+## 🤖 对话记录 ({timestamp.strftime("%Y%m%d")})
+
+### **[{timestamp.strftime("%H:%M:%S")}]** 模型: {model_name}
+
+#### 用户:
+{prompt}
+
+#### AI 助手:
+{response}
+
+---
+"""
+
+
+class HistoryWriter:
+    """
+    每个记录路径一个写入线程。刷新策略可通过环境变量覆盖：
+      CHATBOT_HISTORY_FLUSH_SECONDS   0 表示每批写完立即 flush，大于 0 时最多每隔这么多秒 flush 一次
+      CHATBOT_HISTORY_FSYNC           1 表示每次 flush 后再 fsync，断电也不丢已保存的记录
+      CHATBOT_HISTORY_KEEP_DAYS       最近几天 (含今天) 保留为 Markdown 文件，更早的压缩归档；0 表示不归档
+    store 可以是记录库，也可以是返回记录库的函数 (在写入线程中第一次写入时调用，打开 SQLite 不占用调用方线程)。
+    on_saved(文件名列表)、on_archived([(日期, 轮数)]) 和 on_error(异常) 在写入线程中调用，
+    界面需要自行转交给 Tk 主线程。
+    """
+
+    def __init__(self, directory, flush_seconds=0.0, fsync=False, store=None, keep_days=1,
+                 on_saved=None, on_archived=None, on_error=None):
+        self.directory = directory
+        self.store = store
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.keep_days = keep_days
+        self.on_saved = on_saved
+        self.on_archived = on_archived
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._file = None
+        self._file_date = None
+        # 已写入但尚未 flush 的文件名，flush 时一并通过 on_saved 报告
+        self._unflushed = []
+        self._last_flush = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="chatbot-history-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, directory, store=None, on_saved=None, on_archived=None, on_error=None):
+        return cls(
+            directory,
+            flush_seconds=float(os.environ.get("CHATBOT_HISTORY_FLUSH_SECONDS", 0)),
+            fsync=os.environ.get("CHATBOT_HISTORY_FSYNC", "0").lower() in ("1", "true", "yes"),
+            store=store,
+            keep_days=int(os.environ.get("CHATBOT_HISTORY_KEEP_DAYS", 1)),
+            on_saved=on_saved,
+            on_archived=on_archived,
+            on_error=on_error
+        )
+
+    def submit(self, prompt, response, model_name, meta=None):
+        """
+        记录本轮问答 (时间戳取提交时刻)，立即返回。
+        meta 是写入记录库的附加字段：scenario、ttft_ms、duration_ms、prompt_tokens、cached、stopped。
+        """
+        self._queue.put((prompt, response, model_name, datetime.now(), meta or {}))
+
+    def close(self, timeout=None):
+        """写完队列中剩余的记录并关闭文件；指定 timeout 时返回 False 表示在超时前没有写完"""
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    # --- 写入线程 ---
+
+    def _run(self):
+        self._archive_closed_days()
+        closing = False
+        while not closing:
+            wait = None
+            if self._unflushed:
+                wait = max(self.flush_seconds - (time.monotonic() - self._last_flush), 0)
+            try:
+                batch = [self._queue.get(timeout=wait)]
+            except queue.Empty:
+                batch = []
+            # 把积压的记录一次取完，合并成一次写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _CLOSE in batch:
+                closing = True
+                batch = [record for record in batch if record is not _CLOSE]
+
+            try:
+                self._write_batch(batch)
+                if closing or time.monotonic() - self._last_flush >= self.flush_seconds:
+                    self._flush()
+            except Exception as e:
+                # 出错后丢弃当前句柄，下一批记录重新打开文件 (例如网络盘重新挂载之后)
+                self._unflushed = []
+                self._discard_file()
+                if self.on_error:
+                    self.on_error(e)
+
+        self._discard_file()
+
+    def _write_batch(self, batch):
+        # 按日期分组连续写入；记录日期变化 (跨过午夜) 时先 flush 旧文件再切换
+        for prompt, response, model_name, timestamp, _meta in batch:
+            self._file_for(timestamp.date()).write(format_record(prompt, response, model_name, timestamp))
+            name = timestamp.strftime(HISTORY_FILENAME_FORMAT)
+            if name not in self._unflushed:
+                self._unflushed.append(name)
+
+        if batch and callable(self.store):
+            self.store = self.store()
+        if self.store is not None and batch:
+            self.store.add_turns([
+                dict(meta, created=timestamp.timestamp(), model=model_name, prompt=prompt, response=response)
+                for prompt, response, model_name, timestamp, meta in batch
+            ])
+
+    def _file_for(self, date):
+        if date != self._file_date:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+            self._file_date = None
+            path = self.directory / date.strftime(HISTORY_FILENAME_FORMAT)
+            self._file = path.open('a', encoding='utf-8')
+            self._file_date = date
+            self._archive_closed_days()
+        return self._file
+
+    def _archive_closed_days(self):
+        """压缩已经结束的日期；只归档早于当前文件的日期，不会碰到正在写入的文件"""
+        if self.keep_days <= 0:
+            return
+        from history_archive import HistoryArchive, archive_cutoff
+
+        cutoff = archive_cutoff(self.keep_days)
+        if self._file_date is not None:
+            cutoff = min(cutoff, self._file_date)
+        try:
+            archived = HistoryArchive(self.directory).archive_closed_days(cutoff)
+        except Exception as e:
+            # 归档失败不影响记录的写入，原文件保留到下次再试
+            if self.on_error:
+                self.on_error(e)
+            return
+        if archived and self.on_archived:
+            self.on_archived(archived)
+
+    def _discard_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        self._file = None
+        self._file_date = None
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._file is None or not self._unflushed:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        saved, self._unflushed = self._unflushed, []
+        if self.on_saved:
+            self.on_saved(saved)
@@ -0,0 +1,209 @@
+import re
+
+
+# --- 流式 Markdown 渲染 ---
+# 跨数据块保存解析状态，每次只对新追加的文本打标签，
+# 单块渲染开销只与数据块长度有关，与整段对话长度无关。
+
+_SPECIAL_RE = re.compile(r'[*`\n]')
+_FENCE_RE = re.compile(r' {0,3}```')
+_HEADING_RE = re.compile(r'(#{1,6})[ \t]')
+_LIST_RE = re.compile(r'[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]')
+
+# 行首还不足以判断类型的前缀 (例如数据块恰好停在 "#"、"``" 或 "12")，需要等下一块
+_PARTIAL_PREFIX_RE = re.compile(r' {0,3}`{1,2}|#{1,6}|[ \t]*(?:[-*+]|\d{1,9}[.)]?)|[ \t]+')
+_PARTIAL_FENCE_RE = re.compile(r' {0,3}`{0,2}')
+
+
+class StreamingMarkdownRenderer:
+    """
+    增量 Markdown 分词器，支持粗体、行内代码、带语言标记的代码块、标题和列表。
+    feed() 返回 [(文本, 标签元组), ...]，可以直接逐段 insert 到 Text 控件末尾。
+    标记符号本身 (** ` ``` # -) 原样保留在文本中，只对其中的内容打标签。
+    """
+
+    def __init__(self, base_tag='ai_response', code_tag='code_block'):
+        self.base_tag = base_tag
+        self.code_tag = code_tag
+        self.reset()
+
+    def reset(self):
+        """开始一条新的回复时调用"""
+        self._pending = ""
+        self._at_line_start = True
+        self._in_fence = False
+        self._in_fence_info = False
+        self._line_tags = ()
+        self._bold = False
+        self._inline_code = False
+
+    @property
+    def in_code_block(self):
+        return self._in_fence
+
+    def flush(self):
+        """回复结束时调用，输出所有暂存的字符"""
+        return self._render(final=True)
+
+    def feed(self, text):
+        self._pending += text
+        return self._render(final=False)
+
+    # --- 内部实现 ---
+
+    def _render(self, final):
+        buf = self._pending
+        self._pending = ""
+        segments = []
+        i = 0
+        n = len(buf)
+
+        while i < n:
+            if self._at_line_start:
+                consumed = self._start_line(buf, i, final, segments)
+                if consumed is None:
+                    self._pending = buf[i:]
+                    break
+                i = consumed
+                continue
+
+            if self._in_fence:
+                i = self._fence_line(buf, i, segments)
+            else:
+                i = self._inline(buf, i, final, segments)
+                if i is None:
+                    break
+
+        return self._merge(segments)
+
+    def _start_line(self, buf, i, final, segments):
+        """识别行首结构 (代码块围栏 / 标题 / 列表)，返回消耗到的位置；无法判断时返回 None"""
+        newline = buf.find('\n', i)
+        rest = buf[i:] if newline == -1 else buf[i:newline]
+
+        if newline == -1 and not final:
+            partial_re = _PARTIAL_FENCE_RE if self._in_fence else _PARTIAL_PREFIX_RE
+            if partial_re.fullmatch(rest):
+                return None
+
+        self._at_line_start = False
+        self._line_tags = ()
+        # 粗体可以跨行，遇到空行 (段落结束) 时才结束未闭合的 **
+        if newline != -1 and not rest.strip():
+            self._bold = False
+
+        fence = _FENCE_RE.match(buf, i)
+        if fence:
+            end = fence.end()
+            self._bold = False
+            if self._in_fence:
+                # 结束围栏：只有 ``` 标记属于代码块，同一行后面的内容 (包括换行) 按普通文本处理
+                self._in_fence = False
+                segments.append((buf[i:end], (self.code_tag,)))
+            else:
+                self._in_fence = True
+                self._in_fence_info = True
+                segments.append((buf[i:end], (self.code_tag,)))
+            return end
+
+        if self._in_fence:
+            return i
+
+        heading = _HEADING_RE.match(buf, i)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            self._line_tags = (f'heading{level}',)
+            return i
+
+        if _LIST_RE.match(buf, i):
+            self._line_tags = ('list_item',)
+        return i
+
+    def _fence_line(self, buf, i, segments):
+        """代码块内部：整行原样输出，不做行内解析"""
+        newline = buf.find('\n', i)
+        end = len(buf) if newline == -1 else newline + 1
+
+        if self._in_fence_info:
+            # ``` 后面到行尾是语言标记
+            info_end = end if newline == -1 else newline
+            if info_end > i:
+                segments.append((buf[i:info_end], (self.code_tag, 'code_lang')))
+            if newline != -1:
+                segments.append(('\n', (self.code_tag,)))
+                self._in_fence_info = False
+        else:
+            segments.append((buf[i:end], (self.code_tag,)))
+
+        if newline != -1:
+            self._at_line_start = True
+        return end
+
+    def _inline(self, buf, i, final, segments):
+        """普通文本：处理 ** 和 ` 标记直到行尾；数据块结尾的单个 * 需要等下一块才能判断"""
+        n = len(buf)
+        while i < n:
+            match = _SPECIAL_RE.search(buf, i)
+            if match is None:
+                segments.append((buf[i:], self._tags()))
+                return n
+
+            start = match.start()
+            if start > i:
+                segments.append((buf[i:start], self._tags()))
+
+            char = buf[start]
+            if char == '\n':
+                segments.append(('\n', self._tags()))
+                self._at_line_start = True
+                self._inline_code = False
+                return start + 1
+
+            if char == '`':
+                if self._inline_code:
+                    segments.append(('`', self._tags()))
+                    self._inline_code = False
+                else:
+                    self._inline_code = True
+                    segments.append(('`', self._tags()))
+                i = start + 1
+                continue
+
+            # char == '*'
+            if self._inline_code:
+                segments.append(('*', self._tags()))
+                i = start + 1
+                continue
+            if start + 1 >= n and not final:
+                self._pending = buf[start:]
+                return None
+            if buf.startswith('**', start):
+                if self._bold:
+                    self._bold = False
+                    segments.append(('**', self._tags()))
+                else:
+                    segments.append(('**', self._tags()))
+                    self._bold = True
+                i = start + 2
+            else:
+                segments.append(('*', self._tags()))
+                i = start + 1
+        return i
+
+    def _tags(self):
+        tags = (self.base_tag,) + self._line_tags
+        if self._bold:
+            tags += ('bold',)
+        if self._inline_code:
+            tags += ('inline_code',)
+        return tags
+
+    @staticmethod
+    def _merge(segments):
+        merged = []
+        for text, tags in segments:
+            if merged and merged[-1][1] == tags:
+                merged[-1] = (merged[-1][0] + text, tags)
+            else:
+                merged.append((text, tags))
+        return merged
@@ -0,0 +1,190 @@
+import io
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+# --- 性能分析模式 ---
+# 界面卡顿时用来定位时间花在哪里：Markdown 渲染、插入和滚动、SSE / JSON 解析还是写文件。
+# 启动时加 --profile 参数或设置 CHATBOT_PROFILE=1 开启：Tk 主循环和之后启动的每个线程
+# (事件循环、读取线程、记录写入线程...) 各自由一个 cProfile 记录，同时用 tracemalloc 跟踪内存分配。
+# Python 3.12 起 cProfile 基于 sys.monitoring，同一时间只能有一个分析器处于开启状态，
+# 但它本身就覆盖所有线程：这时整个进程只用一个分析器，报告中不再按线程拆分。
+# 退出时在记录路径 (未设置时为当前目录) 下生成 profile-<时间>/ 目录：
+#   report.txt        每个线程按自身耗时和累计耗时排序的热点函数，以及内存增长最多的代码行
+#   <线程>.pstats     原始数据，可以用 python -m pstats 或 snakeviz 等工具进一步查看
+# cProfile 是确定性分析，会让 Python 代码整体变慢 (约 1.5~3 倍)，只在排查问题时开启；
+# 未开启时不导入 cProfile / pstats / tracemalloc，不增加启动时间。
+
+
+# 3.12 起一个分析器即可覆盖所有线程，且不能再为每个线程单独开启
+PROCESS_WIDE = sys.version_info >= (3, 12)
+PROCESS_GROUP = "所有线程"
+
+
+def _thread_group(name):
+    """同类线程 (线程池的多个工作线程等) 合并统计：名字中的编号替换为 N"""
+    return re.sub(r"\d+", "N", name)
+
+
+class ProfileSession:
+    """
+    一次运行的性能分析。未开启时所有方法都不做任何事，入口代码不需要判断。
+    可通过环境变量设置：
+      CHATBOT_PROFILE                 设为 1 时开启 (与命令行参数 --profile 相同)
+      CHATBOT_PROFILE_TOP             报告中每个线程列出的函数数
+      CHATBOT_PROFILE_MEMORY_FRAMES   tracemalloc 为每次分配保存的调用栈深度
+    """
+
+    def __init__(self, enabled=False, top=40, memory_frames=10):
+        self.enabled = enabled
+        self.top = top
+        self.memory_frames = memory_frames
+        self._lock = threading.Lock()
+        # [(线程名, cProfile.Profile)]
+        self._profiles = []
+        self._original_run = None
+        self._start_snapshot = None
+        self._started = None
+        self._warned = False
+
+    @classmethod
+    def from_env(cls, argv=None):
+        enabled = "--profile" in (argv or []) or \
+            os.environ.get("CHATBOT_PROFILE", "0").lower() in ("1", "true", "yes")
+        return cls(
+            enabled=enabled,
+            top=int(os.environ.get("CHATBOT_PROFILE_TOP", 40)),
+            memory_frames=int(os.environ.get("CHATBOT_PROFILE_MEMORY_FRAMES", 10))
+        )
+
+    def start(self):
+        """
+        开始跟踪内存分配，并为之后启动的每个线程安装分析器 (须在创建界面和后台线程之前调用)；
+        3.12 起改为立即开启一个覆盖整个进程的分析器
+        """
+        if not self.enabled:
+            return
+        import tracemalloc
+        self._started = time.perf_counter()
+        tracemalloc.start(self.memory_frames)
+        self._start_snapshot = tracemalloc.take_snapshot()
+
+        if PROCESS_WIDE:
+            profile = self._enable(PROCESS_GROUP)
+            if profile is not None:
+                self._profiles.append((PROCESS_GROUP, profile))
+            return
+
+        session = self
+        original_run = self._original_run = threading.Thread.run
+
+        def profiled_run(thread):
+            profile = session._enable(thread.name)
+            if profile is None:
+                return original_run(thread)
+            with session._lock:
+                session._profiles.append((thread.name, profile))
+            try:
+                original_run(thread)
+            finally:
+                profile.disable()
+
+        threading.Thread.run = profiled_run
+
+    def _enable(self, name):
+        """
+        创建并开启一个分析器；已经有其他分析工具在运行 (ValueError) 时提示一次并返回 None，
+        调用方照常执行而不做分析，不能让异常结束线程
+        """
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            with self._lock:
+                warned, self._warned = self._warned, True
+            if not warned:
+                print(f"性能分析: 无法分析线程 {name} ({e})，跳过", file=sys.stderr)
+            return None
+        return profile
+
+    def run(self, func, *args):
+        """在当前线程的分析器下执行 func (例如 root.mainloop)"""
+        if not self.enabled or PROCESS_WIDE:
+            # 3.12 起 start() 开启的分析器已经覆盖当前线程
+            return func(*args)
+        profile = self._enable(threading.current_thread().name)
+        if profile is None:
+            return func(*args)
+        with self._lock:
+            self._profiles.append((threading.current_thread().name, profile))
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+
+    def stop(self, directory=None):
+        """停止分析并把报告写入 directory (为 None 时写入当前目录)，返回报告目录；未开启时返回 None"""
+        if not self.enabled:
+            return None
+        import pstats
+        import tracemalloc
+        if self._original_run is not None:
+            threading.Thread.run = self._original_run
+        end_snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        output = Path(directory or Path.cwd()) / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        output.mkdir(parents=True, exist_ok=True)
+
+        report = io.StringIO()
+        elapsed = time.perf_counter() - self._started
+        report.write(f"性能分析报告 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}，运行 {elapsed:.1f} 秒\n")
+        for group, stats in self._collect_stats().items():
+            filename = re.sub(r"[^\w.-]+", "_", group).strip("_") + ".pstats"
+            stats.dump_stats(str(output / filename))
+            stats.stream = report
+            report.write(f"\n{'=' * 30} 线程 {group} ({filename}) {'=' * 30}\n")
+            report.write(f"\n--- 按自身耗时排序 (前 {self.top} 个) ---\n")
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+            report.write(f"\n--- 按累计耗时排序 (前 {self.top} 个) ---\n")
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+
+        report.write(f"\n{'=' * 30} 内存 {'=' * 30}\n\n")
+        report.write(f"tracemalloc 跟踪到的内存：当前 {current / 1024 / 1024:.1f} MB，峰值 {peak / 1024 / 1024:.1f} MB\n")
+        report.write(f"\n--- 运行期间增长最多的代码行 (前 {self.top} 个) ---\n")
+        for stat in end_snapshot.compare_to(self._start_snapshot, 'lineno')[:self.top]:
+            report.write(f"{stat}\n")
+        report.write("\n--- 退出时占用最多的调用栈 (前 5 个) ---\n")
+        for stat in end_snapshot.statistics('traceback')[:5]:
+            report.write(f"\n{stat.count} 个内存块，{stat.size / 1024:.1f} KiB\n")
+            for line in stat.traceback.format():
+                report.write(f"{line}\n")
+
+        (output / "report.txt").write_text(report.getvalue(), encoding='utf-8')
+        return output
+
+    def _collect_stats(self):
+        """
+        按线程分组合并统计；仍在运行的后台线程 (例如事件循环) 取当前为止的数据。
+        create_stats() 会先停用分析器再取出数据，此时已经在退出，停用不影响结果
+        """
+        import pstats
+        groups = {}
+        with self._lock:
+            profiles = list(self._profiles)
+        for name, profile in profiles:
+            profile.create_stats()
+            stats = pstats.Stats(profile)
+            group = _thread_group(name)
+            if group in groups:
+                groups[group].add(stats)
+            else:
+                groups[group] = stats
+        return groups
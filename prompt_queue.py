@@ -0,0 +1,141 @@
+import tkinter as tk
+
+
+# --- 待发送问题队列 ---
+# 回复生成过程中输入框保持可用：按 Enter 把问题加入队列，当前回复结束后自动发送下一条。
+# 每条问题记下加入队列时选择的模型和场景；连问模式下按顺序逐条发送，
+# 每条都会带上前面几条 (包括队列中更早的问题) 产生的问答历史。
+# 点击 "停止" 或本轮出错后队列暂停，输入框为空时点击 "发送" 继续发送队列中的下一条。
+
+# 队列列表中每条问题显示的最大字符数
+PREVIEW_CHARS = 60
+
+
+class QueuedPrompt:
+
+    def __init__(self, prompt, model_name, scenario_name):
+        self.prompt = prompt
+        self.model_name = model_name
+        self.scenario_name = scenario_name
+
+    def label(self, number):
+        preview = " ".join(self.prompt.split())
+        if len(preview) > PREVIEW_CHARS:
+            preview = preview[:PREVIEW_CHARS] + "…"
+        return f"{number}. [{self.model_name} / {self.scenario_name}] {preview}"
+
+
+class PromptQueue:
+    """一个对话的待发送问题，按发送顺序排列"""
+
+    def __init__(self):
+        self.items = []
+        # 停止或出错后不再自动发送，直到用户再次点击 "发送"
+        self.paused = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, prompt, model_name, scenario_name):
+        self.items.append(QueuedPrompt(prompt, model_name, scenario_name))
+
+    def peek_next(self):
+        """下一条可以自动发送的问题；队列为空或已暂停时返回 None"""
+        if self.paused or not self.items:
+            return None
+        return self.items[0]
+
+    def pop_next(self):
+        return self.items.pop(0) if self.items else None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def turn_finished(self, stopped=False, failed=False):
+        """一轮回复结束：用户停止或出错时暂停，其余情况保持原状"""
+        if stopped or failed:
+            self.pause()
+
+    def move(self, index, offset):
+        """把第 index 条上移 (offset < 0) 或下移，返回新的位置；超出范围时不移动"""
+        target = index + offset
+        if not (0 <= index < len(self.items) and 0 <= target < len(self.items)):
+            return index
+        self.items.insert(target, self.items.pop(index))
+        return target
+
+    def remove(self, index):
+        """删除第 index 条，返回之后应选中的位置 (原位置的下一条，删除的是最后一条时为上一条)；队列为空时返回 None"""
+        if 0 <= index < len(self.items):
+            del self.items[index]
+        return min(index, len(self.items) - 1) if self.items else None
+
+    def clear(self):
+        self.items = []
+
+
+class QueuePanel:
+    """输入框上方的队列面板：队列为空时隐藏，可以调整顺序或删除问题"""
+
+    def __init__(self, master, queue, before):
+        self.queue = queue
+        # 面板显示时放在该控件 (输入区) 之前
+        self.before = before
+        self.visible = False
+
+        self.frame = tk.Frame(master, padx=10)
+
+        self.title = tk.StringVar()
+        tk.Label(self.frame, textvariable=self.title, anchor='w', fg='#555555').pack(fill='x')
+
+        self.listbox = tk.Listbox(self.frame, height=4, activestyle='none', bd=1, relief='groove')
+        self.listbox.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        self.listbox.bind('<Delete>', lambda event: self.remove_selected())
+
+        self.button_frame = tk.Frame(self.frame)
+        self.button_frame.pack(side='right', fill='y')
+        for text, command in (("上移", lambda: self.move_selected(-1)), ("下移", lambda: self.move_selected(1)),
+                              ("删除", self.remove_selected), ("清空", self.clear)):
+            tk.Button(self.button_frame, text=text, width=6, command=command).pack(fill='x')
+
+    def refresh(self, selected=None):
+        """按队列内容重绘列表；队列为空时隐藏面板"""
+        self.listbox.delete(0, tk.END)
+        for number, item in enumerate(self.queue, 1):
+            self.listbox.insert(tk.END, item.label(number))
+        if selected is not None and 0 <= selected < len(self.queue):
+            self.listbox.selection_set(selected)
+            self.listbox.see(selected)
+
+        state = "已暂停，输入框为空时点击 \"发送\" 继续" if self.queue.paused else "当前回复结束后依次发送"
+        self.title.set(f"📋 待发送 {len(self.queue)} 条 ({state})")
+        if self.queue and not self.visible:
+            self.frame.pack(fill='x', padx=10, before=self.before)
+            self.visible = True
+        elif not self.queue and self.visible:
+            self.frame.pack_forget()
+            self.visible = False
+
+    def _selected_index(self):
+        selection = self.listbox.curselection()
+        return selection[0] if selection else None
+
+    def move_selected(self, offset):
+        index = self._selected_index()
+        if index is not None:
+            self.refresh(self.queue.move(index, offset))
+
+    def remove_selected(self):
+        index = self._selected_index()
+        if index is not None:
+            self.refresh(self.queue.remove(index))
+
+    def clear(self):
+        self.queue.clear()
+        self.refresh()
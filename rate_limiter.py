@@ -0,0 +1,356 @@
+import email.utils
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from retry_policy import parse_retry_after
+
+
+# --- 客户端限流 ---
+# 批处理、多模型对比和多个标签页同时发请求时很容易触发服务端的 429。所有请求在发出前先向进程内共享的
+# RateLimiter 申请额度：按 API Key + 模型分别限制每分钟请求数 (RPM) 和 tokens 数 (TPM)，
+# 另外可以给每个 API Key 设置跨模型的总上限。额度不足时在客户端等待，而不是把请求浪费在被拒绝上。
+#
+# 限流器会根据服务端的反馈自动调整：
+#   - 响应头中的 x-ratelimit-*-requests / x-ratelimit-*-tokens / anthropic-ratelimit-* 给出了每分钟的上限、
+#     剩余额度和重置时间时，按服务端的数字校正 (剩余为 0 时暂停到重置时间)；
+#   - 通用的 ratelimit-* / x-ratelimit-limit 等响应头的时间窗口由服务端决定 (常见每秒或每小时)，
+#     只有 ratelimit-policy 给出窗口长度 (w=秒数) 时才换算为 RPM；剩余为 0 时同样暂停到重置时间；
+#   - 收到 429 时，同一 Key + 模型的所有请求暂停到 Retry-After 之后，速率降为原来的 3/4，
+#     之后每个成功的请求逐步恢复到配置的上限。
+# TPM 在发送前按估算的输入 tokens 预扣，回复结束后再补扣输出的 tokens。
+
+# 收到 429 但没有 Retry-After 时暂停的秒数
+DEFAULT_THROTTLE_SECONDS = 1.0
+# 每次 429 后速率乘以该系数；每个成功的请求恢复上限的 RECOVERY_STEP
+BACKOFF_FACTOR = 0.75
+RECOVERY_STEP = 0.05
+
+RPM = "requests"
+TPM = "tokens"
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_POLICY_WINDOW_RE = re.compile(r"(?:^|;)\s*w\s*=\s*(\d+(?:\.\d+)?)\s*(?:;|$)")
+
+
+def parse_limits(value):
+    """解析 "RPM/TPM" (例如 "500/200000"、"60/-")；- 或 0 表示不限制"""
+    rpm, _, tpm = value.partition("/")
+
+    def number(text):
+        text = text.strip()
+        return float(text) if text and text != "-" and float(text) > 0 else None
+
+    return number(rpm), number(tpm)
+
+
+def parse_model_limits(value):
+    """解析 "模型=RPM/TPM, ..." 形式的配置，返回 {模型: (RPM, TPM)}"""
+    model_limits = {}
+    for entry in value.split(","):
+        model_name, separator, limits = entry.partition("=")
+        if separator:
+            model_limits[model_name.strip()] = parse_limits(limits)
+    return model_limits
+
+
+def parse_reset(value):
+    """
+    解析限流重置时间，返回距现在的秒数：秒数 ("20")、时长 ("1m30s"、"250ms"，OpenAI 格式)
+    或时间点 (RFC 3339 / HTTP 日期，Anthropic 格式)；无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        # 有的接口给出的是重置时刻的 Unix 时间戳
+        return max(seconds - time.time() if seconds > 1e9 else seconds, 0.0)
+    parts = _DURATION_RE.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+    return max(when - time.time(), 0.0)
+
+
+def parse_policy_window(value, limit=None):
+    """
+    解析 ratelimit-policy (例如 "100;w=60" 或 "10;w=1, 1000;w=3600")，返回时间窗口的秒数；
+    有多条策略时取额度等于 limit 的一条 (limit 为 None 时取第一条)，无法解析时返回 None
+    """
+    if not value:
+        return None
+    windows = []
+    for policy in value.split(","):
+        quota, _, parameters = policy.strip().partition(";")
+        match = _POLICY_WINDOW_RE.search(parameters)
+        if match is None:
+            continue
+        try:
+            windows.append((float(quota), float(match.group(1))))
+        except ValueError:
+            continue
+    for quota, window in windows:
+        if limit is None or quota == limit:
+            return window if window > 0 else None
+    return None
+
+
+def _header_number(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+
+def _header_reset(headers, names):
+    for name in names:
+        seconds = parse_reset(headers.get(name))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+# 各家接口报告每分钟 RPM / TPM 额度的响应头 (按顺序取第一个存在的)
+_LIMIT_HEADERS = {
+    RPM: ("x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+    TPM: ("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit")
+}
+_REMAINING_HEADERS = {
+    RPM: ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"),
+    TPM: ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining")
+}
+_RESET_HEADERS = {
+    RPM: ("x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset"),
+    TPM: ("x-ratelimit-reset-tokens", "anthropic-ratelimit-tokens-reset")
+}
+# 通用的请求数额度 (IETF RateLimit 草案、GitHub 等)，时间窗口要从 ratelimit-policy 得知
+_GENERIC_LIMIT_HEADERS = ("ratelimit-limit", "x-ratelimit-limit")
+_GENERIC_REMAINING_HEADERS = ("ratelimit-remaining", "x-ratelimit-remaining")
+_GENERIC_RESET_HEADERS = ("ratelimit-reset", "x-ratelimit-reset")
+_POLICY_HEADERS = ("ratelimit-policy", "x-ratelimit-policy")
+
+
+def _server_limits(headers, kind):
+    """
+    从响应头取出服务端给出的 (每分钟上限, 剩余额度, 重置前的秒数)，都可能为 None。
+    请求数没有按分钟报告的响应头时读取通用的 ratelimit-*：知道窗口长度时把上限换算为每分钟，
+    剩余额度只在用完 (为 0) 时使用，因为不同窗口内剩余的数量与每分钟的桶无法比较
+    """
+    limit = _header_number(headers, _LIMIT_HEADERS[kind])
+    remaining = _header_number(headers, _REMAINING_HEADERS[kind])
+    reset = _header_reset(headers, _RESET_HEADERS[kind])
+    if kind != RPM or limit is not None or remaining is not None:
+        return limit, remaining, reset
+
+    generic_limit = _header_number(headers, _GENERIC_LIMIT_HEADERS)
+    window = None
+    for name in _POLICY_HEADERS:
+        window = parse_policy_window(headers.get(name), generic_limit)
+        if window is not None:
+            break
+    if generic_limit and window:
+        limit = generic_limit * 60 / window
+    generic_remaining = _header_number(headers, _GENERIC_REMAINING_HEADERS)
+    if generic_remaining is not None and generic_remaining <= 0:
+        remaining = 0.0
+    if reset is None:
+        reset = _header_reset(headers, _GENERIC_RESET_HEADERS)
+    return limit, remaining, reset
+
+
+class TokenBucket:
+    """
+    每分钟 per_minute 个额度的令牌桶 (容量也是 per_minute)。per_minute 为 None 时不限速，
+    但仍然会按服务端的要求暂停。额度允许透支：透支的部分让之后的请求按速率排队等待。
+    """
+
+    def __init__(self, per_minute=None):
+        # 配置的上限；从响应头得知服务端的上限更低时以服务端为准
+        self.ceiling = per_minute
+        self.per_minute = per_minute
+        self.tokens = float(per_minute or 0)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if self.per_minute:
+            elapsed = max(now - self.updated, 0.0)
+            self.tokens = min(self.per_minute, self.tokens + elapsed * self.per_minute / 60)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """预扣 amount 个额度，返回需要等待的秒数"""
+        self._refill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        if self.per_minute:
+            self.tokens -= amount
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens * 60 / self.per_minute)
+        return wait
+
+    def charge(self, amount, now):
+        """补扣额度 (不等待，透支部分由之后的请求承担)"""
+        self._refill(now)
+        if self.per_minute:
+            self.tokens -= amount
+
+    def refund(self, amount, now):
+        self._refill(now)
+        if self.per_minute:
+            self.tokens = min(self.per_minute, self.tokens + amount)
+
+    def learn(self, limit, remaining, reset, now):
+        """按响应头校正：上限、当前剩余额度和重置前的秒数 (都可能为 None)"""
+        self._refill(now)
+        if limit:
+            if self.ceiling is None or limit < self.ceiling:
+                if self.per_minute is None:
+                    self.tokens = limit
+                self.ceiling = limit
+            self.per_minute = min(self.per_minute or limit, self.ceiling)
+        if remaining is not None and self.per_minute:
+            self.tokens = min(self.tokens, remaining)
+        if remaining is not None and remaining <= 0 and reset:
+            self.blocked_until = max(self.blocked_until, now + reset)
+
+    def throttle(self, seconds, now):
+        """服务端返回 429：暂停 seconds 秒并降低速率"""
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        if self.per_minute:
+            self.per_minute = max(self.per_minute * BACKOFF_FACTOR, 1.0)
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        """请求成功：速率向上限恢复一步"""
+        if self.per_minute and self.ceiling and self.per_minute < self.ceiling:
+            self.per_minute = min(self.ceiling, self.per_minute + self.ceiling * RECOVERY_STEP)
+
+
+class RateLimiter:
+    """
+    进程内共享的 RPM / TPM 限流器，各方法可以从任意线程调用。可通过环境变量设置：
+      CHATBOT_RATE_LIMITS      每个模型的上限，例如 "gpt-5.1=500/200000, claude-opus-4-5-20251101=50/40000, *=60/-"
+                               (模型=RPM/TPM，- 表示不限制，* 为未列出的模型；每个 API Key 分别计算)
+      CHATBOT_KEY_RATE_LIMIT   每个 API Key 跨所有模型的总上限，格式同上，例如 "1000/-"
+    未配置时只按服务端的响应头和 429 自动限速。
+    """
+
+    def __init__(self, model_limits=None, key_limit=None):
+        # 模型 (或 "*") -> (RPM, TPM)
+        self.model_limits = model_limits or {}
+        self.key_limit = key_limit or (None, None)
+        self._lock = threading.Lock()
+        # (Key 摘要, 模型 或 None 表示整个 Key, RPM / TPM) -> TokenBucket
+        self._buckets = {}
+
+    @classmethod
+    def from_env(cls):
+        key_limit = os.environ.get("CHATBOT_KEY_RATE_LIMIT")
+        return cls(model_limits=parse_model_limits(os.environ.get("CHATBOT_RATE_LIMITS", "")),
+                   key_limit=parse_limits(key_limit) if key_limit else None)
+
+    @staticmethod
+    def _key_id(api_key):
+        """只保存 Key 的摘要"""
+        return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16]
+
+    def _bucket(self, key_id, model_name, kind):
+        bucket = self._buckets.get((key_id, model_name, kind))
+        if bucket is None:
+            if model_name is None:
+                limits = self.key_limit
+            else:
+                limits = self.model_limits.get(model_name, self.model_limits.get("*", (None, None)))
+            bucket = self._buckets[(key_id, model_name, kind)] = TokenBucket(limits[0 if kind == RPM else 1])
+        return bucket
+
+    def _buckets_for(self, api_key, model_name):
+        key_id = self._key_id(api_key)
+        return [(kind, self._bucket(key_id, scope, kind)) for scope in (model_name, None) for kind in (RPM, TPM)]
+
+    def reserve(self, api_key, model_name, tokens):
+        """为一次请求预扣 1 个请求额度和 tokens 个 token 额度，返回发送前需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            return max(bucket.reserve(1 if kind == RPM else tokens, now)
+                       for kind, bucket in self._buckets_for(api_key, model_name))
+
+    def acquire(self, api_key, model_name, tokens):
+        """同步版本：等待到可以发送为止，返回等待的秒数 (在读取线程或批处理线程中使用)"""
+        wait = self.reserve(api_key, model_name, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def cancel(self, api_key, model_name, tokens):
+        """预扣后没有发出请求 (例如等待期间被取消)：退回额度"""
+        now = time.monotonic()
+        with self._lock:
+            for kind, bucket in self._buckets_for(api_key, model_name):
+                bucket.refund(1 if kind == RPM else tokens, now)
+
+    def settle(self, api_key, model_name, output_tokens):
+        """回复结束后补扣输出的 tokens"""
+        if output_tokens <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for kind, bucket in self._buckets_for(api_key, model_name):
+                if kind == TPM:
+                    bucket.charge(output_tokens, now)
+
+    def observe(self, api_key, model_name, status_code, headers):
+        """根据响应状态和限流相关的响应头 (包括 429 的 Retry-After) 调整该 Key + 模型的额度"""
+        now = time.monotonic()
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        key_id = self._key_id(api_key)
+        with self._lock:
+            for kind in (RPM, TPM):
+                bucket = self._bucket(key_id, model_name, kind)
+                limit, remaining, reset = _server_limits(headers, kind)
+                bucket.learn(limit, remaining, reset, now)
+                if status_code == 429:
+                    seconds = retry_after if retry_after is not None else reset
+                    bucket.throttle(seconds if seconds is not None else DEFAULT_THROTTLE_SECONDS, now)
+                elif status_code == 200:
+                    bucket.recover()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """返回进程内共享的限流器 (首次调用时按环境变量创建)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter.from_env()
+        return _limiter
+
+
+def configure_rate_limiter(limiter):
+    """用新的限流器替换共享限流器 (例如批处理入口按命令行参数设置上限)"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+        return _limiter
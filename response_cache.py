@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# --- 本地响应缓存 ---
+# 以 (模型, system prompt, messages) 的哈希为键，把完整回复保存在 SQLite 文件中。
+# 超过容量上限时按最近访问时间 (LRU) 淘汰，超过有效期 (TTL) 的条目在读取或写入时清理。
+
+CACHE_FILENAME = ".chatbot-response-cache.sqlite3"
+
+
+def cache_key(model_name, system_prompt, messages):
+    """对请求内容做规范化 JSON 序列化后取 SHA-256"""
+    raw = json.dumps(
+        {"model": model_name, "system": system_prompt, "messages": messages},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    持久化的响应缓存，可以在任意线程中使用；关闭后 get 总是未命中、put 不做任何事
+    (流还在进行时用户可能已经换了记录路径)。参数可通过环境变量覆盖：
+      CHATBOT_CACHE_MAX_MB     缓存文件中回复内容的总大小上限
+      CHATBOT_CACHE_TTL_DAYS   条目的有效天数 (0 表示永不过期)
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl_seconds=30 * 24 * 3600, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # 返回当前时间戳的函数 (测试中可以替换)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+
+    @classmethod
+    def for_directory(cls, directory):
+        return cls(
+            directory / CACHE_FILENAME,
+            max_bytes=int(float(os.environ.get("CHATBOT_CACHE_MAX_MB", 64)) * 1024 * 1024),
+            ttl_seconds=float(os.environ.get("CHATBOT_CACHE_TTL_DAYS", 30)) * 24 * 3600
+        )
+
+    def get(self, key):
+        """返回缓存的完整回复文本；未命中或已过期时返回 None"""
+        now = self.clock()
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return response
+
+    def put(self, key, model_name, response):
+        now = self.clock()
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, size, now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 从最久未访问的条目开始淘汰，直到总大小回到上限以内
+        for key, size in self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+async def replay_stream(response, chunk_chars=24, metrics=None):
+    """把缓存的回复切成小块逐个 yield，与 astream_chat 的输出走完全相同的渲染路径 (metrics 同样记录每块的时间)"""
+    for start in range(0, len(response), chunk_chars):
+        chunk = response[start:start + chunk_chars]
+        if metrics is not None:
+            metrics.mark_content(chunk)
+        yield chunk
+        await asyncio.sleep(0)
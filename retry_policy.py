@@ -0,0 +1,113 @@
+import email.utils
+import os
+import random
+import time
+
+
+# --- 重试与超时策略 ---
+# 429 / 5xx、网络错误、首字超时和数据流停顿都按指数退避 + 随机抖动重试，服务端给出 Retry-After 时至少等待那么久。
+# 数据流中途断开时，已经输出的部分保留在界面上，下一次请求把它作为 assistant 消息发回并要求模型接着写，
+# 而不是从头重新生成。
+
+RETRYABLE_STATUS = (408, 409, 425, 429, 500, 502, 503, 504, 529)
+
+
+class StreamError(Exception):
+    """流式请求失败。retryable 表示可以重试，retry_after 为服务端要求等待的秒数"""
+
+    def __init__(self, message, retryable=False, retry_after=None, status=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status = status
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头 (秒数或 HTTP 日期)，返回需要等待的秒数；无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def http_error(status_code, headers, details):
+    """把非 200 响应转换为 StreamError (错误信息格式与原来一致)"""
+    return StreamError(
+        f"API HTTP 错误: {status_code}. 详情: {details[:200]}...",
+        retryable=status_code in RETRYABLE_STATUS,
+        retry_after=parse_retry_after(headers.get("Retry-After")),
+        status=status_code
+    )
+
+
+class RetryPolicy:
+    """
+    流式请求的重试与超时设置。所有参数都可以通过环境变量覆盖：
+      CHATBOT_RETRY_ATTEMPTS       每轮对话最多发送的请求次数 (1 表示不重试)
+      CHATBOT_RETRY_BASE_DELAY     第一次重试的退避上限 (秒)，之后每次翻倍
+      CHATBOT_RETRY_MAX_DELAY      单次退避的上限 (秒)
+      CHATBOT_RETRY_AFTER_MAX      Retry-After 超过这个秒数时不再重试，直接报错
+      CHATBOT_CONNECT_TIMEOUT      建立连接的超时 (秒)
+      CHATBOT_FIRST_TOKEN_TIMEOUT  从发出请求到收到第一个文本块的超时 (秒)
+      CHATBOT_STALL_TIMEOUT        收到第一个文本块之后，相邻两个数据块之间的最长间隔 (秒)
+      CHATBOT_RESUME_STREAMS       设为 0 时中途断开的流不再续写，直接报错
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, max_retry_after=120.0,
+                 connect_timeout=10.0, first_token_timeout=90.0, stall_timeout=30.0, resume=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.resume = resume
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_attempts=int(os.environ.get("CHATBOT_RETRY_ATTEMPTS", 4)),
+            base_delay=float(os.environ.get("CHATBOT_RETRY_BASE_DELAY", 1.0)),
+            max_delay=float(os.environ.get("CHATBOT_RETRY_MAX_DELAY", 30.0)),
+            max_retry_after=float(os.environ.get("CHATBOT_RETRY_AFTER_MAX", 120.0)),
+            connect_timeout=float(os.environ.get("CHATBOT_CONNECT_TIMEOUT", 10.0)),
+            first_token_timeout=float(os.environ.get("CHATBOT_FIRST_TOKEN_TIMEOUT", 90.0)),
+            stall_timeout=float(os.environ.get("CHATBOT_STALL_TIMEOUT", 30.0)),
+            resume=os.environ.get("CHATBOT_RESUME_STREAMS", "1").lower() not in ("0", "false", "no")
+        )
+
+    @property
+    def read_timeout(self):
+        """底层 socket 的读超时：覆盖首字等待和数据流停顿两种情况中较长的一个"""
+        return max(self.first_token_timeout, self.stall_timeout)
+
+    def should_retry(self, error, attempt, partial_response):
+        """第 attempt 次请求失败后是否重试；已经输出了部分内容时，只有允许续写才重试"""
+        if not error.retryable or attempt >= self.max_attempts:
+            return False
+        if error.retry_after is not None and error.retry_after > self.max_retry_after:
+            return False
+        return self.resume or not partial_response
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次失败后的等待秒数：full jitter 指数退避，但不少于服务端要求的 Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def final_error(error, attempt):
+    """重试用尽后抛出的错误，在信息中注明尝试次数"""
+    if attempt > 1:
+        error.args = (f"{error} (共尝试 {attempt} 次)",)
+    return error
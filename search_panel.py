@@ -0,0 +1,267 @@
+import time
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from tkinter import scrolledtext, messagebox, ttk, filedialog
+
+from history_writer import HISTORY_FILENAME_FORMAT
+
+
+# --- 聊天记录搜索面板 ---
+# 输入关键词即时搜索本地记录库 (FTS5 索引)，选中一条查看完整问答，
+# 可以把当前搜索结果导出为 Markdown，或把记录路径下已有的每日 Markdown 文件和压缩归档导入记录库。
+# 记录库的查询、导入和导出都在窗口自己的后台线程中依次执行，结果经 app.bridge 交回 Tk 主线程：
+# 聊天记录写入线程批量插入时会占用记录库的锁，大量记录上的 MATCH 本身也可能超过一帧，不能让界面等待。
+
+ALL_MODELS = "全部模型"
+
+# 输入停止这么久之后再搜索，避免每个按键都查询一次
+SEARCH_DEBOUNCE_MS = 150
+
+
+class SearchWindow:
+
+    def __init__(self, app):
+        self.app = app
+        self.results = []
+        self.closed = False
+        self._pending_search = None
+        # 单个后台线程按提交顺序执行；较早的搜索结果在更新的搜索提交后到达时丢弃
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chatbot-search")
+        self._search_generation = 0
+        self._search_note = None
+
+        self.window = tk.Toplevel(app.master)
+        self.window.title("搜索聊天记录")
+        self.window.geometry("1000x700")
+
+        # --- 1. 搜索条件 ---
+        self.query_frame = tk.Frame(self.window, padx=10, pady=5)
+        self.query_frame.pack(fill='x')
+
+        tk.Label(self.query_frame, text="🔍 关键词:").pack(side='left', padx=(0, 5))
+        self.query = tk.StringVar()
+        self.query_entry = tk.Entry(self.query_frame, textvariable=self.query, bd=1, relief='groove')
+        self.query_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        self.query_entry.bind('<KeyRelease>', self._schedule_search)
+        self.query_entry.bind('<Return>', lambda event: self.search())
+
+        self.model_filter = tk.StringVar(value=ALL_MODELS)
+        self.model_combobox = ttk.Combobox(
+            self.query_frame,
+            textvariable=self.model_filter,
+            values=[ALL_MODELS] + list(app.MODEL_LIST),
+            state="readonly",
+            width=18
+        )
+        self.model_combobox.pack(side='left', padx=(0, 10))
+        self.model_combobox.bind('<<ComboboxSelected>>', lambda event: self.search())
+
+        self.export_button = tk.Button(self.query_frame, text="导出 Markdown", command=self.export_results)
+        self.export_button.pack(side='left', padx=(0, 5))
+        self.import_button = tk.Button(self.query_frame, text="导入旧记录", command=self.import_markdown_files)
+        self.import_button.pack(side='left')
+
+        # --- 2. 结果列表与详情 ---
+        self.body = tk.PanedWindow(self.window, orient=tk.VERTICAL, sashrelief='raised')
+        self.body.pack(fill='both', expand=True, padx=10, pady=5)
+
+        self.result_tree = ttk.Treeview(
+            self.body,
+            columns=("time", "model", "scenario", "ttft", "snippet"),
+            show='headings',
+            selectmode='browse'
+        )
+        for column, title, width, stretch in (("time", "时间", 140, False), ("model", "模型", 170, False),
+                                              ("scenario", "场景", 110, False), ("ttft", "首字 ms", 70, False),
+                                              ("snippet", "匹配内容", 480, True)):
+            self.result_tree.heading(column, text=title)
+            self.result_tree.column(column, width=width, stretch=stretch)
+        self.result_tree.bind('<<TreeviewSelect>>', self._show_selected)
+        self.body.add(self.result_tree, minsize=120, height=260)
+
+        self.detail_text = scrolledtext.ScrolledText(
+            self.body,
+            wrap=tk.WORD,
+            state='disabled',
+            font=('Arial', 10),
+            bg='#f0f0f0',
+            fg='#333333',
+            padx=10,
+            pady=10
+        )
+        self.detail_text.tag_config('user', foreground='#000080', font=('Arial', 10, 'bold'))
+        self.detail_text.tag_config('ai_response', foreground='#006400')
+        self.body.add(self.detail_text, minsize=120)
+
+        # --- 3. 状态栏 ---
+        self.status = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status, anchor='w', fg='#555555').pack(fill='x', padx=10,
+                                                                                     pady=(0, 5))
+
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.query_entry.focus_set()
+        self.search()
+
+    def _schedule_search(self, event=None):
+        if self._pending_search is not None:
+            self.window.after_cancel(self._pending_search)
+        self._pending_search = self.window.after(SEARCH_DEBOUNCE_MS, self.search)
+
+    def _in_background(self, func, on_done, *args):
+        """
+        在后台线程中执行 func(store, *args)，完成后在 Tk 主线程调用 on_done(结果, 异常)；
+        窗口已关闭时不再回调。记录库在后台线程中第一次打开，Tk 主线程不做 SQLite 操作
+        """
+        def run():
+            if self.closed:
+                return
+            try:
+                store = self.app._get_chat_store()
+                if store is None:
+                    raise OSError("没有设置聊天记录保存路径")
+                result, error = func(store, *args), None
+            except Exception as e:
+                result, error = None, e
+            self.app.bridge.post(self._done, on_done, result, error)
+
+        self._executor.submit(run)
+
+    def _done(self, on_done, result, error):
+        if not self.closed:
+            on_done(result, error)
+
+    def search(self, note=None):
+        """在后台搜索，结果到达后更新列表；note 显示在结果统计之前 (例如导入的条数)"""
+        self._pending_search = None
+        self._search_generation += 1
+        self._search_note = note
+        model_name = self.model_filter.get()
+        self.status.set("搜索中...")
+        self._in_background(self._run_search, self._show_results, self._search_generation, self.query.get(),
+                            None if model_name == ALL_MODELS else model_name)
+
+    @staticmethod
+    def _run_search(store, generation, query, model_name):
+        start = time.perf_counter()
+        results = store.search(query, model_name)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return generation, results, store.count(), elapsed_ms
+
+    def _show_results(self, outcome, error):
+        if error is not None:
+            self.status.set(f"搜索失败：{error}")
+            return
+        generation, results, total, elapsed_ms = outcome
+        if generation != self._search_generation:
+            return
+        self.results = results
+        self.result_tree.delete(*self.result_tree.get_children())
+        for result in self.results:
+            self.result_tree.insert('', tk.END, iid=str(result["id"]), values=(
+                datetime.fromtimestamp(result["created"]).strftime("%Y-%m-%d %H:%M"),
+                result["model"],
+                result["scenario"] or "",
+                f"{result['ttft_ms']:.0f}" if result["ttft_ms"] is not None else "",
+                result["snippet"]
+            ))
+        summary = f"共 {total} 轮记录，显示 {len(self.results)} 条结果，用时 {elapsed_ms:.1f} ms"
+        self.status.set(f"{self._search_note}；{summary}" if self._search_note else summary)
+
+    def _show_selected(self, event=None):
+        selection = self.result_tree.selection()
+        if not selection:
+            return
+        self._in_background(lambda store, turn_id: store.get_turn(turn_id), self._show_turn, int(selection[0]))
+
+    def _show_turn(self, turn, error):
+        if error is not None:
+            self.status.set(f"读取记录失败：{error}")
+            return
+        if turn is None:
+            return
+
+        details = [f"模型: {turn['model']}"]
+        if turn["scenario"]:
+            details.append(f"场景: {turn['scenario']}")
+        if turn["ttft_ms"] is not None:
+            details.append(f"首字 {turn['ttft_ms']:.0f} ms")
+        if turn["duration_ms"] is not None:
+            details.append(f"总耗时 {turn['duration_ms'] / 1000:.2f} s")
+        if turn["prompt_tokens"] is not None:
+            details.append(f"输入约 {turn['prompt_tokens']} tokens")
+        if turn["response_tokens"] is not None:
+            details.append(f"输出约 {turn['response_tokens']} tokens")
+        if turn["cached"]:
+            details.append("来自缓存")
+        if turn["stopped"]:
+            details.append("中途停止")
+
+        self.detail_text.config(state='normal')
+        self.detail_text.delete("1.0", tk.END)
+        self.detail_text.insert(tk.END, datetime.fromtimestamp(turn["created"]).strftime("%Y-%m-%d %H:%M:%S")
+                                + " · " + " · ".join(details) + "\n\n")
+        self.detail_text.insert(tk.END, f"--- 用户: ---\n{turn['prompt']}\n\n", 'user')
+        self.detail_text.insert(tk.END, f"--- AI 助手: ---\n{turn['response']}\n", 'ai_response')
+        self.detail_text.config(state='disabled')
+
+    def export_results(self):
+        if not self.results:
+            messagebox.showinfo("导出", "当前没有可导出的搜索结果。", parent=self.window)
+            return
+        filename = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="导出搜索结果",
+            defaultextension=".md",
+            initialfile="chatbot-search-export.md",
+            filetypes=[("Markdown", "*.md")]
+        )
+        if not filename:
+            return
+        path = Path(filename)
+        self.status.set("正在导出...")
+        self._in_background(lambda store, turn_ids: store.export_markdown(turn_ids, path),
+                            lambda count, error: self._on_exported(path, count, error),
+                            [result["id"] for result in self.results])
+
+    def _on_exported(self, path, count, error):
+        if error is not None:
+            messagebox.showerror("导出错误", f"导出失败：{error}", parent=self.window)
+            return
+        self.status.set(f"已导出 {count} 轮记录到 {path.name}")
+
+    def import_markdown_files(self):
+        """把记录路径下已有的每日 Markdown 文件和压缩归档导入记录库 (重复的轮次会被跳过)"""
+        self.import_button.config(state='disabled')
+        self.status.set("正在导入旧记录...")
+        self._in_background(self._run_import, self._on_imported, self.app.save_directory)
+
+    @staticmethod
+    def _run_import(store, directory):
+        from history_archive import HistoryArchive
+
+        pattern = HISTORY_FILENAME_FORMAT.replace("%Y%m%d", "*")
+        files = sorted(directory.glob(pattern))
+        added = 0
+        for path in files:
+            added += store.import_markdown(path)
+        # 归档只解压还没有导入过的日期
+        days, archived = store.import_archive(HistoryArchive(directory))
+        return len(files), days, added + archived
+
+    def _on_imported(self, outcome, error):
+        self.import_button.config(state='normal')
+        if error is not None:
+            messagebox.showerror("导入错误", f"导入旧记录失败：{error}", parent=self.window)
+            return
+        files, days, added = outcome
+        self.search(f"扫描了 {files} 个 Markdown 文件和 {days} 天的归档，新增 {added} 轮记录")
+
+    def close(self):
+        """关闭窗口；后台线程不等待当前查询完成，之后的结果不再显示 (记录库由 app 统一关闭)"""
+        self.closed = True
+        if self._pending_search is not None:
+            self.window.after_cancel(self._pending_search)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.window.destroy()
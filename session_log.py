@@ -0,0 +1,229 @@
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from pathlib import Path
+
+
+# --- 会话日志 (重启后恢复对话) ---
+# 默认关闭 (问答内容会写到记录路径以外的目录)，设置 CHATBOT_SESSION_RESTORE=1 后才记录和恢复。
+# 每个对话标签页一份只追加的二进制日志，重启后按日志恢复上次打开的各个对话：
+#   <对话 id>.turns   逐轮记录：固定长度的头 (CRC32、时间戳、四个字段的字节数) + 模型、场景、问题、回复的 UTF-8
+#   <对话 id>.idx     每轮记录在 .turns 中的起始偏移 (uint64 数组)
+#   session.json      打开的标签页 (顺序、当前页、模型、场景、连问模式)
+# 启动时用 mmap 打开日志，按偏移直接切出每一轮，不需要逐行解析；写入都在后台线程中进行，
+# Tk 主线程不做磁盘 I/O。日志写到一半中断时，末尾不完整的记录在下次打开时被截掉。
+
+SESSION_FILENAME = "session.json"
+LOG_SUFFIX = ".turns"
+INDEX_SUFFIX = ".idx"
+
+# CRC32、时间戳、模型 / 场景 / 问题 / 回复的字节数
+_HEADER = struct.Struct("<IdIIII")
+
+_CLOSE = object()
+
+
+def encode_turn(created, model_name, scenario_name, prompt, response):
+    fields = [value.encode('utf-8') for value in (model_name, scenario_name, prompt, response)]
+    body = _HEADER.pack(0, created, *(len(field) for field in fields))[4:] + b"".join(fields)
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+def _decode_turn(view, offset):
+    """解码 offset 处的一轮；记录不完整或校验失败时返回 (None, offset)，否则返回 (记录, 下一条的偏移)"""
+    if offset + _HEADER.size > len(view):
+        return None, offset
+    crc, created, *lengths = _HEADER.unpack_from(view, offset)
+    end = offset + _HEADER.size + sum(lengths)
+    if end > len(view) or zlib.crc32(view[offset + 4:end]) != crc:
+        return None, offset
+    position = offset + _HEADER.size
+    values = []
+    for length in lengths:
+        values.append(str(view[position:position + length], 'utf-8'))
+        position += length
+    model_name, scenario_name, prompt, response = values
+    return {"created": created, "model": model_name, "scenario": scenario_name,
+            "prompt": prompt, "response": response}, end
+
+
+def read_turns(log_path, index_path):
+    """
+    用 mmap 读出一个对话的全部轮次。按索引中的偏移解码；索引之后还有完整记录时 (写完日志、写索引前中断)
+    继续向后扫描，返回 (轮次列表, 有效的日志长度, 偏移列表)
+    """
+    offsets = array('Q')
+    try:
+        data = index_path.read_bytes()
+    except FileNotFoundError:
+        data = b""
+    # 写到一半的最后一个偏移
+    offsets.frombytes(data[:len(data) - len(data) % 8])
+    try:
+        size = log_path.stat().st_size
+    except FileNotFoundError:
+        return [], 0, array('Q')
+    if size == 0:
+        return [], 0, array('Q')
+
+    turns = []
+    valid_offsets = array('Q')
+    with log_path.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            end = 0
+            for offset in offsets:
+                if offset != end:
+                    break
+                turn, next_offset = _decode_turn(view, offset)
+                if turn is None:
+                    break
+                turns.append(turn)
+                valid_offsets.append(offset)
+                end = next_offset
+            # 索引没有覆盖到的完整记录
+            while end < size:
+                turn, next_offset = _decode_turn(view, end)
+                if turn is None:
+                    break
+                turns.append(turn)
+                valid_offsets.append(end)
+                end = next_offset
+        finally:
+            view.release()
+    return turns, end, valid_offsets
+
+
+class SessionLog:
+    """
+    会话日志目录，可通过环境变量设置：
+      CHATBOT_SESSION_RESTORE   设为 1 时记录并在启动时恢复会话 (默认不记录)
+      CHATBOT_SESSION_DIR       日志目录 (默认 ~/.chatbot-sessions)
+    load 在 Tk 主线程中启动时调用一次；其余方法只是把操作放进队列，由写入线程按顺序执行。
+    on_error(异常) 在写入线程中调用，界面需要自行转交给 Tk 主线程。
+    """
+
+    def __init__(self, directory, on_error=None):
+        self.directory = Path(directory)
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="chatbot-session-log", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, on_error=None):
+        """未启用时返回 None"""
+        if os.environ.get("CHATBOT_SESSION_RESTORE", "0").lower() not in ("1", "true", "yes"):
+            return None
+        directory = os.environ.get("CHATBOT_SESSION_DIR") or Path.home() / ".chatbot-sessions"
+        return cls(directory, on_error=on_error)
+
+    @staticmethod
+    def new_id():
+        return time.strftime("%Y%m%d-%H%M%S-") + os.urandom(3).hex()
+
+    def _paths(self, conversation_id):
+        return self.directory / (conversation_id + LOG_SUFFIX), self.directory / (conversation_id + INDEX_SUFFIX)
+
+    # --- 恢复 (Tk 主线程，启动时) ---
+
+    def load(self):
+        """
+        读出上次的标签页：返回 (标签页列表, 当前页序号)，每个标签页是 session.json 中保存的设置
+        加上 "turns" (按顺序的轮次)；没有记录或记录损坏时返回 ([], 0)
+        """
+        try:
+            state = json.loads((self.directory / SESSION_FILENAME).read_text(encoding='utf-8'))
+            tabs = [dict(tab) for tab in state["tabs"] if isinstance(tab.get("id"), str)]
+            current = int(state.get("current", 0))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return [], 0
+        for tab in tabs:
+            log_path, index_path = self._paths(tab["id"])
+            try:
+                turns, end, offsets = read_turns(log_path, index_path)
+            except (OSError, ValueError) as e:
+                turns, end, offsets = [], None, None
+                if self.on_error:
+                    self.on_error(e)
+            tab["turns"] = turns
+            if end is not None:
+                # 截掉不完整的尾部、补齐索引 (在写入线程中进行)
+                self._queue.put((self._repair, (tab["id"], end, offsets)))
+        return tabs, min(max(current, 0), max(len(tabs) - 1, 0))
+
+    # --- 写入 (放进队列，由写入线程执行) ---
+
+    def append(self, conversation_id, model_name, scenario_name, prompt, response):
+        """记录一轮问答 (时间戳取提交时刻)"""
+        record = encode_turn(time.time(), model_name, scenario_name, prompt, response)
+        self._queue.put((self._append, (conversation_id, record)))
+
+    def reset(self, conversation_id):
+        """清空一个对话的日志 (清除当前对话、关闭标签页时使用)"""
+        self._queue.put((self._remove, (conversation_id,)))
+
+    def save_tabs(self, tabs, current):
+        """保存打开的标签页：tabs 为 [{"id", "model", "scenario", "continuous"}]，current 为当前页序号"""
+        self._queue.put((self._write_session, ({"tabs": tabs, "current": current},)))
+
+    def close(self, timeout=None):
+        """写完队列中剩余的操作；指定 timeout 时返回 False 表示在超时前没有写完"""
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    # --- 写入线程 ---
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+            func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+
+    def _append(self, conversation_id, record):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        log_path, index_path = self._paths(conversation_id)
+        # 先写记录再写索引：索引中的偏移总是指向完整的记录
+        with log_path.open('ab') as f:
+            offset = f.tell()
+            f.write(record)
+        with index_path.open('ab') as f:
+            f.write(struct.pack("<Q", offset))
+
+    def _repair(self, conversation_id, end, offsets):
+        log_path, index_path = self._paths(conversation_id)
+        if not log_path.exists():
+            self._remove(conversation_id)
+            return
+        if log_path.stat().st_size > end:
+            with log_path.open('r+b') as f:
+                f.truncate(end)
+        if not index_path.exists() or index_path.stat().st_size != len(offsets) * 8:
+            index_path.write_bytes(offsets.tobytes())
+
+    def _remove(self, conversation_id):
+        for path in self._paths(conversation_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _write_session(self, state):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / SESSION_FILENAME
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(state, ensure_ascii=False), encoding='utf-8')
+        os.replace(temp_path, path)
@@ -0,0 +1,130 @@
+import json
+import os
+
+
+# --- 增量 SSE 解析 ---
+# 直接处理网络层收到的原始字节块，不再经过 iter_lines() → decode → startswith → strip → json.loads 的逐行流程。
+# SSEParser 按规范 (https://html.spec.whatwg.org/multipage/server-sent-events.html) 切分事件：
+# 行结束符可以是 \r\n、\n 或 \r (包括跨数据块的 \r\n)，以 ":" 开头的是注释，
+# 支持 event / id / retry 字段，一个事件中的多行 data 用 \n 拼接。
+# DeltaDecoder 在其上取出 choices[0].delta.content；安装了 orjson 时用它解码 JSON。
+
+
+def _stdlib_loads(data):
+    # 标准库解析 bytes 时要先探测编码，先按 UTF-8 解码成 str 再解析更快
+    return json.loads(data.decode())
+
+
+def select_json_loads(backend="auto"):
+    """返回 (loads 函数, 后端名称)；backend 为 "json" 时强制使用标准库，否则优先使用 orjson"""
+    if backend != "json":
+        try:
+            import orjson
+            return orjson.loads, "orjson"
+        except ImportError:
+            pass
+    return _stdlib_loads, "json"
+
+
+# CHATBOT_JSON_BACKEND=json 可以在排查问题时强制使用标准库
+json_loads, JSON_BACKEND = select_json_loads(os.environ.get("CHATBOT_JSON_BACKEND", "auto"))
+
+# 不含这个键的事件 (只有 role 的首个增量、usage 统计等) 不需要解码
+_CONTENT_KEY = b'"content"'
+
+
+class SSEParser:
+    """
+    增量 SSE 解析器：feed(字节块) 返回本块中完整结束的事件列表 [(事件类型, data 字节串)]。
+    不完整的行和事件留在内部，等后续数据块到达后继续。
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._pending_cr = False
+        self._data = []
+        self._event = ""
+        self.last_event_id = ""
+        # 服务端通过 retry 字段建议的重连间隔 (毫秒)
+        self.retry = None
+
+    def feed(self, chunk):
+        # 最常见的情况：服务端每个事件 flush 一次，一个数据块恰好是一个完整的单行 data 事件，直接切出内容
+        if (chunk[:6] == b"data: " and not self._buffer and not self._data and not self._pending_cr
+                and chunk.find(b"\n") == len(chunk) - 2 and chunk[-1:] == b"\n" and b"\r" not in chunk):
+            event = self._event or "message"
+            self._event = ""
+            return [(event, chunk[6:-2])]
+
+        if self._pending_cr:
+            # 上一块以 \r 结尾，若这一块以 \n 开头，两者是同一个 \r\n
+            self._pending_cr = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+        if b"\r" in chunk:
+            self._pending_cr = chunk.endswith(b"\r")
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        lines = (self._buffer + chunk if self._buffer else chunk).split(b"\n")
+        self._buffer = lines.pop()
+
+        events = []
+        data = self._data
+        for line in lines:
+            # 绝大多数行是 "data: ..."，先走快速路径
+            if line[:6] == b"data: ":
+                data.append(line[6:])
+            elif not line:
+                if data:
+                    events.append((self._event or "message", b"\n".join(data) if len(data) > 1 else data[0]))
+                    data.clear()
+                self._event = ""
+            elif line[:1] != b":":
+                self._field(line)
+        return events
+
+    def _field(self, line):
+        name, colon, value = line.partition(b":")
+        if colon and value[:1] == b" ":
+            value = value[1:]
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event = value.decode('utf-8', errors='replace')
+        elif name == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode('utf-8', errors='replace')
+        elif name == b"retry":
+            if value.isdigit():
+                self.retry = int(value)
+        # 其他字段按规范忽略
+
+
+class DeltaDecoder:
+    """
+    把原始字节块转换为模型输出的文本增量。feed() 返回本块中的文本列表；
+    收到 data: [DONE] 后 done 为 True，之后的数据全部忽略。无法解析的 JSON 直接跳过。
+    """
+
+    def __init__(self, loads=None):
+        self.parser = SSEParser()
+        self.loads = loads or json_loads
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return []
+        contents = []
+        for _event, data in self.parser.feed(chunk):
+            if data[:6] == b"[DONE]":
+                self.done = True
+                break
+            if _CONTENT_KEY not in data:
+                continue
+            try:
+                content = self.loads(data)["choices"][0]["delta"].get("content")
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                continue
+            if content:
+                contents.append(content)
+        return contents
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 模块都在仓库根目录 (平铺)，替身服务器在 benchmarks/ 下
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter():
+    """每个用例使用不限速的新限流器，前一个用例注入的 429 不会让后面的请求暂停"""
+    from rate_limiter import RateLimiter, configure_rate_limiter
+    configure_rate_limiter(RateLimiter())
+    yield
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """
+    启动本地 SSE 替身服务器并把各个入口指向它：stand_in(**settings) 返回 server，
+    server.settings 可以在用例中途修改 (例如第一次失败后关闭错误注入)
+    """
+    import async_engine
+    import chat_api
+    from sse_server import start_server
+
+    servers = []
+
+    def start(**settings):
+        server, url = start_server(**settings)
+        servers.append(server)
+        monkeypatch.setattr(chat_api, "API_URL", url)
+        monkeypatch.setattr(async_engine, "API_URL", url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
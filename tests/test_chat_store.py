@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from chat_store import STORE_FILENAME, ChatStore
+
+
+TURNS = [
+    {"created": 1767225600 + number * 60, "model": f"model-{number % 2}", "prompt": prompt, "response": response}
+    for number, (prompt, response) in enumerate([
+        ("如何读取文件", "用 open() 打开文件"),
+        ("解释一下 asyncio", "asyncio 是事件循环"),
+        ("SQL 怎么写", "SELECT * FROM t"),
+        ("再问一次 asyncio", "前面已经解释过"),
+    ])
+]
+
+
+class FallbackStore(ChatStore):
+    """模拟不支持 trigram 分词的旧版 SQLite"""
+
+    def _create_fts_table(self, tokenizers=("no-such-tokenizer", "unicode61")):
+        return super()._create_fts_table(tokenizers)
+
+
+@pytest.fixture(params=[ChatStore, FallbackStore], ids=["trigram", "unicode61"])
+def store(request, tmp_path):
+    chat_store = request.param(tmp_path / STORE_FILENAME)
+    chat_store.add_turns(TURNS)
+    yield chat_store
+    chat_store.close()
+
+
+def test_fallback_tokenizer(store):
+    assert store.trigram is (type(store) is ChatStore)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("asyncio", [4, 2]),
+    ("文件", [1]),
+    ("asyncio 解释", [4, 2]),
+    ("解释一下 asyncio", [2]),
+    ("select", [3]),
+    ("没有的词", []),
+    ("", [4, 3, 2, 1]),
+])
+def test_search(store, query, expected):
+    assert [result["id"] for result in store.search(query)] == expected
+
+
+def test_search_by_model_and_snippet(store):
+    assert store.search("asyncio", model_name="model-0") == []
+    results = store.search("asyncio", model_name="model-1")
+    assert [result["id"] for result in results] == [4, 2]
+    assert "[asyncio]" in results[1]["snippet"]
+
+
+def test_duplicate_turns_are_skipped(store):
+    assert store.add_turns(TURNS[:2]) == 0
+    assert store.count() == 4
+
+
+def test_existing_index_keeps_its_tokenizer(tmp_path):
+    # 旧版 SQLite 建的 unicode61 索引在新版本中打开时仍按 LIKE 搜索
+    FallbackStore(tmp_path / STORE_FILENAME).close()
+    reopened = ChatStore(tmp_path / STORE_FILENAME)
+    try:
+        assert not reopened.trigram
+        reopened.add_turns(TURNS)
+        assert [result["id"] for result in reopened.search("asyncio")] == [4, 2]
+    finally:
+        reopened.close()
+
+
+def test_missing_fts5_raises(tmp_path):
+    class NoFts(ChatStore):
+        def _create_fts_table(self, tokenizers=("no-such-tokenizer",)):
+            return super()._create_fts_table(tokenizers)
+
+    with pytest.raises(sqlite3.OperationalError):
+        NoFts(tmp_path / STORE_FILENAME)
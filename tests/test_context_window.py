@@ -0,0 +1,163 @@
+import pytest
+
+from context_window import (DEFAULT_CONTEXT_LIMIT, MESSAGE_OVERHEAD_TOKENS, OUTPUT_RESERVE_TOKENS, POLICY_DROP,
+                            POLICY_TRUNCATE, REPLY_PRIMING_TOKENS, ContextWindowManager, estimate_tokens,
+                            message_tokens, request_tokens)
+
+
+def turn(number, user_chars=10, assistant_chars=30):
+    """一轮问答；每个汉字约 1 token，便于算出确切的预算"""
+    return [{"role": "user", "content": f"{number}" + "问" * user_chars},
+            {"role": "assistant", "content": f"{number}" + "答" * assistant_chars}]
+
+
+def history_of(*turns):
+    return [message for item in turns for message in item]
+
+
+def cost(*turns):
+    return sum(message_tokens(message) for item in turns for message in item)
+
+
+# system prompt 和本轮输入都为空时固定保留部分的开销
+BASE = REPLY_PRIMING_TOKENS + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def fit(manager, history):
+    return manager.fit("", "", history, "some-model")
+
+
+def numbers(history):
+    return [message["content"][0] for message in history if message["role"] == "user"]
+
+
+# --- 估算 ---
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0 and estimate_tokens(None) == 0
+    assert estimate_tokens("汉字五个字") == 5
+    assert estimate_tokens("abcd" * 3) == 3
+    assert estimate_tokens("ab") == 1
+    assert request_tokens([{"role": "user", "content": "汉字"}]) == 2 + MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+
+
+def test_budget_for():
+    assert ContextWindowManager().budget_for("unknown") == DEFAULT_CONTEXT_LIMIT - OUTPUT_RESERVE_TOKENS
+    assert ContextWindowManager().budget_for("gpt-5.1") == 400000 - OUTPUT_RESERVE_TOKENS
+    assert ContextWindowManager(max_tokens=1000).budget_for("gpt-5.1") == 1000
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ContextWindowManager(policy="newest_first")
+
+
+# --- 丢弃最早的轮次 ---
+
+def test_everything_fits():
+    turns = [turn(number) for number in range(4)]
+    fitted, report = fit(ContextWindowManager(max_tokens=10000), history_of(*turns))
+    assert fitted == history_of(*turns)
+    assert report.tokens_sent == BASE + cost(*turns)
+    assert (report.turns_sent, report.dropped_turns, report.truncated_turns, report.over_budget) == (4, 0, 0, False)
+
+
+def test_empty_history():
+    for history in (None, []):
+        fitted, report = fit(ContextWindowManager(max_tokens=100), history)
+        assert fitted == [] and report.tokens_sent == BASE and report.turns_sent == 0
+
+
+def test_drop_oldest_keeps_a_contiguous_tail():
+    turns = [turn(number) for number in range(5)]
+    # 预算刚好装下最近两轮 (固定保留) 和之前的两轮
+    budget = BASE + cost(*turns[1:])
+    fitted, report = fit(ContextWindowManager(max_tokens=budget), history_of(*turns))
+    assert numbers(fitted) == ["1", "2", "3", "4"]
+    assert report.tokens_sent == budget
+    assert (report.turns_sent, report.dropped_turns, report.truncated_turns) == (4, 1, 0)
+
+    fitted, report = fit(ContextWindowManager(max_tokens=budget - 1), history_of(*turns))
+    assert numbers(fitted) == ["2", "3", "4"]
+    assert report.dropped_turns == 2 and report.tokens_sent <= budget - 1
+
+
+def test_large_older_turn_also_drops_everything_before_it():
+    turns = [turn(0), turn(1, user_chars=500), turn(2), turn(3)]
+    # 第 0 轮单独装得下，但第 1 轮装不下：为保证历史连续，第 0 轮也丢弃
+    budget = BASE + cost(turns[2], turns[3], turns[0])
+    fitted, report = fit(ContextWindowManager(max_tokens=budget), history_of(*turns))
+    assert numbers(fitted) == ["2", "3"]
+    assert report.dropped_turns == 2 and not report.over_budget
+
+
+def test_recent_turns_are_kept_even_over_budget():
+    turns = [turn(0), turn(1), turn(2, assistant_chars=1000)]
+    fitted, report = fit(ContextWindowManager(max_tokens=200), history_of(*turns))
+    assert numbers(fitted) == ["1", "2"]
+    assert report.over_budget and report.tokens_sent > 200
+    assert report.dropped_turns == 1
+    assert "最近几轮本身已超出预算" in report.summary()
+
+
+def test_keep_recent_turns_zero():
+    turns = [turn(0), turn(1)]
+    fitted, report = fit(ContextWindowManager(max_tokens=BASE + cost(turns[1]), keep_recent_turns=0),
+                         history_of(*turns))
+    assert numbers(fitted) == ["1"]
+    fitted, report = fit(ContextWindowManager(max_tokens=BASE, keep_recent_turns=0), history_of(*turns))
+    assert fitted == [] and report.dropped_turns == 2 and not report.over_budget
+
+
+# --- 先截断再丢弃 ---
+
+def test_truncate_oldest_fills_the_remaining_budget():
+    turns = [turn(number, user_chars=100, assistant_chars=300) for number in range(5)]
+    remaining = 200
+    budget = BASE + cost(*turns[2:]) + remaining
+    manager = ContextWindowManager(policy=POLICY_TRUNCATE, max_tokens=budget)
+    fitted, report = fit(manager, history_of(*turns))
+
+    assert numbers(fitted) == ["1", "2", "3", "4"]
+    assert (report.turns_sent, report.dropped_turns, report.truncated_turns) == (4, 1, 1)
+    assert report.tokens_sent == BASE + sum(message_tokens(message) for message in fitted) <= budget
+    # 被截断的轮次保留每条消息的开头，之后的轮次原样发送
+    for original, truncated in zip(turns[1], fitted[:2]):
+        assert truncated["role"] == original["role"]
+        assert truncated["content"].endswith("(更早的内容已截断)")
+        kept = truncated["content"][:-len("\n...(更早的内容已截断)")]
+        assert kept and original["content"].startswith(kept)
+    assert fitted[2:] == history_of(*turns[2:])
+    assert "截断 1 轮" in report.summary() and "丢弃最早的 1 轮" in report.summary()
+
+
+def test_truncate_needs_a_minimum_budget():
+    turns = [turn(number, user_chars=100, assistant_chars=300) for number in range(4)]
+    budget = BASE + cost(*turns[2:]) + 63
+    fitted, report = fit(ContextWindowManager(policy=POLICY_TRUNCATE, max_tokens=budget), history_of(*turns))
+    assert numbers(fitted) == ["2", "3"]
+    assert report.truncated_turns == 0 and report.dropped_turns == 2
+
+
+def test_single_turn_larger_than_budget_is_truncated_to_fit():
+    turns = [turn(0, user_chars=2000, assistant_chars=6000)]
+    budget = 500
+    for keep_recent_turns in (0, 1):
+        manager = ContextWindowManager(policy=POLICY_TRUNCATE, max_tokens=budget, keep_recent_turns=keep_recent_turns)
+        fitted, report = fit(manager, history_of(*turns))
+        if keep_recent_turns:
+            # 固定保留的最近一轮不截断，只报告超出预算
+            assert fitted == history_of(*turns) and report.over_budget and report.truncated_turns == 0
+        else:
+            assert len(fitted) == 2 and report.truncated_turns == 1 and not report.over_budget
+            assert report.tokens_sent <= budget
+            # 按原来的比例分配：回复保留的部分比问题多
+            assert estimate_tokens(fitted[1]["content"]) > estimate_tokens(fitted[0]["content"])
+
+
+@pytest.mark.parametrize("policy", [POLICY_DROP, POLICY_TRUNCATE])
+def test_fit_does_not_modify_history(policy):
+    history = history_of(*[turn(number, user_chars=100, assistant_chars=300) for number in range(5)])
+    snapshot = [dict(message) for message in history]
+    fit(ContextWindowManager(policy=policy, max_tokens=BASE + 1000), history)
+    assert history == snapshot
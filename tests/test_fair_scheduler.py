@@ -0,0 +1,152 @@
+import asyncio
+import random
+
+from async_engine import FairScheduler
+
+
+async def settle():
+    """让被唤醒的任务运行到下一个等待点"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def start(scheduler, owner, name, order):
+    async def acquire():
+        await scheduler.acquire(owner)
+        order.append(name)
+
+    return asyncio.ensure_future(acquire())
+
+
+def test_immediate_grant_under_cap():
+    async def run():
+        scheduler = FairScheduler(2)
+        await scheduler.acquire("a")
+        await scheduler.acquire("b")
+        assert scheduler.active == 2 and scheduler.waiting == 0
+        scheduler.release("a")
+        scheduler.release("b")
+        assert scheduler.active == 0 and not scheduler._running and not scheduler._last_served
+
+    asyncio.run(run())
+
+
+def test_least_recently_served_owner_goes_first():
+    async def run():
+        scheduler = FairScheduler(2)
+        order = []
+        await scheduler.acquire("a")
+        await scheduler.acquire("a")
+        # a 先排了两个，b 后排两个
+        tasks = [start(scheduler, "a", "a3", order), start(scheduler, "a", "a4", order),
+                 start(scheduler, "b", "b1", order), start(scheduler, "b", "b2", order)]
+        await settle()
+        assert order == [] and scheduler.waiting == 4
+
+        # b 从未轮到过，先于更早排队的 a3
+        scheduler.release("a")
+        await settle()
+        assert order == ["b1"]
+        # 之后两个 owner 交替
+        scheduler.release("a")
+        await settle()
+        assert order == ["b1", "a3"]
+        scheduler.release("b")
+        await settle()
+        assert order == ["b1", "a3", "b2"]
+        scheduler.release("a")
+        await settle()
+        assert order == ["b1", "a3", "b2", "a4"]
+        assert scheduler.active == 2
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_same_owner_is_served_in_arrival_order():
+    async def run():
+        scheduler = FairScheduler(1)
+        order = []
+        await scheduler.acquire("a")
+        tasks = [start(scheduler, "a", name, order) for name in ("first", "second", "third")]
+        await settle()
+        for _ in tasks:
+            scheduler.release("a")
+            await settle()
+        assert order == ["first", "second", "third"]
+        scheduler.release("a")
+        assert scheduler.active == 0
+
+    asyncio.run(run())
+
+
+def test_cancel_while_waiting_leaves_no_trace():
+    async def run():
+        scheduler = FairScheduler(1)
+        order = []
+        await scheduler.acquire("a")
+        waiting = start(scheduler, "b", "b", order)
+        await settle()
+        assert scheduler.waiting == 1
+
+        waiting.cancel()
+        await settle()
+        assert waiting.cancelled()
+        assert scheduler.waiting == 0 and "b" not in scheduler._waiting and "b" not in scheduler._last_served
+
+        scheduler.release("a")
+        assert scheduler.active == 0
+        await scheduler.acquire("c")
+        assert order == [] and scheduler.active == 1
+
+    asyncio.run(run())
+
+
+def test_cancel_after_grant_releases_the_slot():
+    async def run():
+        scheduler = FairScheduler(1)
+        order = []
+        await scheduler.acquire("a")
+        granted = start(scheduler, "b", "b", order)
+        after = start(scheduler, "c", "c", order)
+        await settle()
+
+        # 放行 b (名额已经记到 b 名下)，但 b 的任务还没来得及运行就被取消
+        scheduler.release("a")
+        assert scheduler.active == 1 and scheduler._running["b"] == 1
+        granted.cancel()
+        await settle()
+
+        # b 把名额让给了下一个等待者，没有永久占用上限
+        assert granted.cancelled()
+        assert order == ["c"]
+        assert scheduler.active == 1 and "b" not in scheduler._running and "b" not in scheduler._last_served
+        scheduler.release("c")
+        assert scheduler.active == 0 and scheduler.waiting == 0
+        await after
+
+    asyncio.run(run())
+
+
+def test_random_cancellations_never_leak_slots():
+    async def run():
+        rng = random.Random(7)
+        scheduler = FairScheduler(3)
+
+        async def stream(owner):
+            await scheduler.acquire(owner)
+            try:
+                assert scheduler.active <= scheduler.limit
+                await asyncio.sleep(rng.random() * 0.002)
+            finally:
+                scheduler.release(owner)
+
+        tasks = [asyncio.ensure_future(stream(rng.choice("abcd"))) for _ in range(200)]
+        for _ in range(60):
+            await asyncio.sleep(rng.random() * 0.001)
+            rng.choice(tasks).cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert scheduler.active == 0 and scheduler.waiting == 0
+        assert not scheduler._running and not scheduler._last_served
+
+    asyncio.run(run())
@@ -0,0 +1,139 @@
+import gzip
+import json
+from datetime import date, datetime
+
+import pytest
+
+from history_archive import HistoryArchive, archive_cutoff, split_records
+from history_writer import HISTORY_FILENAME_FORMAT, format_record
+
+
+def day_text(day, turns, start=0):
+    """某一天的 Markdown 文件内容：turns 轮问答，包含代码块和中文"""
+    return "".join(
+        format_record(f"问题 {number} **粗体**", f"回答 {number}\n```py\nprint({number})\n```", f"model-{number % 3}",
+                      datetime.combine(day, datetime.min.time()).replace(hour=9, minute=number % 60))
+        for number in range(start, start + turns)
+    )
+
+
+def write_day(directory, day, text):
+    path = directory / day.strftime(HISTORY_FILENAME_FORMAT)
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return HistoryArchive(tmp_path)
+
+
+def test_split_records_round_trip():
+    text = "文件开头的说明\n" + day_text(date(2026, 3, 1), 4)
+    records = split_records(text)
+    assert "".join(records) == text
+    assert len(records) == 5
+    assert split_records("") == []
+
+
+def test_archive_cutoff():
+    today = date(2026, 3, 10)
+    assert archive_cutoff(1, today) == today
+    assert archive_cutoff(3, today) == date(2026, 3, 8)
+    assert archive_cutoff(0, today) == today
+
+
+def test_read_entry_round_trips_each_turn(tmp_path, archive):
+    day = date(2026, 3, 1)
+    text = day_text(day, 6)
+    write_day(tmp_path, day, text)
+
+    assert archive.archive_closed_days(date(2026, 3, 2)) == [("20260301", 6)]
+    assert not (tmp_path / day.strftime(HISTORY_FILENAME_FORMAT)).exists()
+
+    entries = archive.entries("202603")
+    assert [archive.read_entry(entry) for entry in entries] == split_records(text)
+    assert [entry["model"] for entry in entries] == [f"model-{number % 3}" for number in range(6)]
+    assert entries[2]["time"] == "09:02:00"
+    assert archive.read_day("20260301") == text
+
+
+def test_archive_is_plain_gzip(tmp_path, archive):
+    # 整个归档仍然是合法的多成员 gzip，直接解压得到按日期顺序拼接的原文
+    texts = []
+    for number in (1, 2, 3):
+        day = date(2026, 3, number)
+        texts.append(day_text(day, number + 1))
+        write_day(tmp_path, day, texts[-1])
+    archive.archive_closed_days(date(2026, 3, 4))
+
+    data = (tmp_path / "202603-chatbot-archive.md.gz").read_bytes()
+    assert gzip.decompress(data).decode('utf-8') == "".join(texts)
+    assert sorted(archive.days()) == ["20260301", "20260302", "20260303"]
+
+
+def test_keeps_open_days_and_rotates_months(tmp_path, archive):
+    for day in (date(2026, 2, 28), date(2026, 3, 1), date(2026, 3, 2)):
+        write_day(tmp_path, day, day_text(day, 2))
+    archived = archive.archive_closed_days(date(2026, 3, 2))
+    assert [day for day, _count in archived] == ["20260228", "20260301"]
+    assert archive.months() == ["202602", "202603"]
+    # 截止日期当天及以后的文件保留
+    assert (tmp_path / date(2026, 3, 2).strftime(HISTORY_FILENAME_FORMAT)).exists()
+
+
+def test_only_new_content_is_archived_again(tmp_path, archive):
+    day = date(2026, 3, 1)
+    text = day_text(day, 3)
+    write_day(tmp_path, day, text)
+    archive.archive_closed_days(date(2026, 3, 2))
+
+    # 归档之后同一天又写入了记录 (或者上次索引已写、文件未删)：只追加新增的轮次
+    more = text + day_text(day, 2, start=3)
+    write_day(tmp_path, day, more)
+    assert archive.archive_closed_days(date(2026, 3, 2)) == [("20260301", 2)]
+    assert archive.read_day("20260301") == more
+    assert len(archive.entries("202603")) == 5
+
+
+def test_recovers_from_torn_data_and_index_tails(tmp_path, archive):
+    first = date(2026, 3, 1)
+    write_day(tmp_path, first, day_text(first, 3))
+    archive.archive_closed_days(date(2026, 3, 2))
+
+    archive_path = tmp_path / "202603-chatbot-archive.md.gz"
+    index_path = tmp_path / "202603-chatbot-archive.idx"
+    # 模拟上次写入中断：压缩数据写了一半，索引最后一行也不完整
+    with archive_path.open('ab') as f:
+        f.write(gzip.compress(b"half written")[:10])
+    with index_path.open('ab') as f:
+        f.write(b'{"day": "20260302", "off')
+
+    reopened = HistoryArchive(tmp_path)
+    assert len(reopened.entries("202603")) == 3
+
+    second = date(2026, 3, 2)
+    text = day_text(second, 2)
+    write_day(tmp_path, second, text)
+    assert reopened.archive_closed_days(date(2026, 3, 3)) == [("20260302", 2)]
+
+    # 残留的尾部被截掉，之后的条目和整个文件都能正常解压
+    assert reopened.read_day("20260302") == text
+    lines = index_path.read_bytes().splitlines()
+    assert len(lines) == 5 and all(json.loads(line) for line in lines)
+    assert gzip.decompress(archive_path.read_bytes()).decode('utf-8') == day_text(first, 3) + text
+
+
+def test_index_cache_follows_appends(tmp_path, archive):
+    day = date(2026, 3, 1)
+    write_day(tmp_path, day, day_text(day, 1))
+    archive.archive_closed_days(date(2026, 3, 2))
+    reader = HistoryArchive(tmp_path)
+    assert len(reader.entries("202603")) == 1
+
+    later = date(2026, 3, 2)
+    write_day(tmp_path, later, day_text(later, 2))
+    archive.archive_closed_days(date(2026, 3, 3))
+    # 另一个实例追加之后，按文件大小重新读取索引
+    assert len(reader.entries("202603")) == 3
+    assert reader.read_day("20260302") == day_text(later, 2)
@@ -0,0 +1,158 @@
+import pytest
+
+from context_window import estimate_tokens, message_tokens
+from conversation import SUMMARY_PREFIX, SUMMARY_REPLY, Conversation
+from history_compactor import CompactionPlan, HistoryCompactor
+
+
+def conversation_with(turns, start=0):
+    conversation = Conversation()
+    add_turns(conversation, turns, start)
+    return conversation
+
+
+def add_turns(conversation, turns, start=0):
+    for number in range(start, start + turns):
+        conversation.add_turn(f"问题 {number} " + "内容" * 20, f"回答 {number} " + "细节" * 40)
+
+
+def prompts(messages):
+    return [message["content"].split()[1] for message in messages if message["role"] == "user"
+            and not message["content"].startswith(SUMMARY_PREFIX)]
+
+
+@pytest.fixture
+def compactor():
+    # 阈值为 0：任何历史都超过阈值
+    return HistoryCompactor(threshold_tokens=0, keep_recent_turns=2)
+
+
+# --- Conversation ---
+
+def test_turns_without_response_are_not_recorded():
+    conversation = Conversation()
+    conversation.add_turn("问题", "")
+    conversation.add_turn("问题", "回答")
+    assert conversation.turn_count == 1 and len(conversation) == 2
+    assert [message["role"] for message in conversation.history()] == ["user", "assistant"]
+
+
+def test_history_is_a_copy():
+    conversation = conversation_with(2)
+    history = conversation.history()
+    history[0]["content"] = "改掉"
+    history.append({"role": "user", "content": "多一条"})
+    assert conversation.messages[0]["content"].startswith("问题 0")
+    assert len(conversation.messages) == 4
+
+
+def test_summary_replaces_covered_turns():
+    conversation = conversation_with(5)
+    conversation.set_summary("摘要", 3)
+    history = conversation.history()
+    assert history[0] == {"role": "user", "content": SUMMARY_PREFIX + "摘要"}
+    assert history[1] == {"role": "assistant", "content": SUMMARY_REPLY}
+    # 被摘要覆盖的 3 轮不再发送，之后的轮次不重复也不遗漏
+    assert history[2:] == conversation.messages[6:]
+    assert prompts(history) == ["3", "4"]
+    # 原始消息仍然完整保存
+    assert conversation.turn_count == 5
+
+
+def test_revert_and_clear():
+    conversation = conversation_with(4)
+    conversation.set_summary("摘要", 2)
+    conversation.revert_summary()
+    assert conversation.history() == conversation.messages
+    conversation.set_summary("摘要", 2)
+    conversation.clear()
+    assert conversation.history() == [] and conversation.summary is None and conversation.summary_turns == 0
+
+
+# --- HistoryCompactor.plan ---
+
+def test_no_plan_when_disabled_or_under_threshold():
+    conversation = conversation_with(6)
+    assert HistoryCompactor(enabled=False, threshold_tokens=0).plan(conversation) is None
+    tokens = sum(message_tokens(message) for message in conversation.history())
+    assert HistoryCompactor(threshold_tokens=tokens).plan(conversation) is None
+    assert HistoryCompactor(threshold_tokens=tokens - 1).plan(conversation) is not None
+
+
+def test_no_plan_without_turns_older_than_the_recent_ones(compactor):
+    assert compactor.plan(conversation_with(2)) is None
+    assert compactor.plan(conversation_with(3)).turns == 1
+
+
+def test_first_plan_covers_all_but_the_recent_turns(compactor):
+    conversation = conversation_with(5)
+    plan = compactor.plan(conversation)
+    assert plan.previous_summary is None
+    assert plan.turns == 3
+    assert plan.messages == conversation.messages[:6]
+    assert plan.replaced_tokens == sum(message_tokens(message) for message in conversation.messages[:6])
+    # 计划中的消息是副本
+    plan.messages[0]["content"] = "改掉"
+    assert conversation.messages[0]["content"].startswith("问题 0")
+
+
+def test_rolling_summary_only_merges_new_turns(compactor):
+    conversation = conversation_with(5)
+    conversation.set_summary("旧摘要", 3)
+    # 已经压缩到最近两轮之前，没有新的内容可以并入
+    assert compactor.plan(conversation) is None
+
+    add_turns(conversation, 2, start=5)
+    plan = compactor.plan(conversation)
+    assert plan.previous_summary == "旧摘要"
+    assert plan.turns == 5
+    # 只并入第 3、4 轮 (第 0~2 轮已经在旧摘要里)
+    assert prompts(plan.messages) == ["3", "4"]
+    history = conversation.history()
+    assert plan.replaced_tokens == (message_tokens(history[0]) + message_tokens(history[1])
+                                    + sum(message_tokens(message) for message in conversation.messages[6:10]))
+    assert "此前的摘要：\n旧摘要" in plan.prompt()
+    assert "【用户】\n问题 3" in plan.prompt() and "【助手】\n回答 4" in plan.prompt()
+
+
+def test_keep_recent_turns_setting():
+    conversation = conversation_with(6)
+    assert HistoryCompactor(threshold_tokens=0, keep_recent_turns=0).plan(conversation).turns == 6
+    assert HistoryCompactor(threshold_tokens=0, keep_recent_turns=5).plan(conversation).turns == 1
+    assert HistoryCompactor(threshold_tokens=0, keep_recent_turns=6).plan(conversation) is None
+
+
+# --- CompactionPlan.apply ---
+
+def test_apply_shorter_summary(compactor):
+    conversation = conversation_with(5)
+    plan = compactor.plan(conversation)
+    assert plan.apply(conversation, "简短的摘要") == estimate_tokens("简短的摘要")
+    assert (conversation.summary, conversation.summary_turns) == ("简短的摘要", 3)
+    history = conversation.history()
+    assert len(history) == 2 + 2 * 2
+    assert prompts(history) == ["3", "4"]
+
+
+def test_apply_discards_empty_or_not_shorter_summary():
+    conversation = conversation_with(4)
+    plan = CompactionPlan(None, conversation.messages[:2], 1, replaced_tokens=estimate_tokens("四个汉字"))
+    assert plan.apply(conversation, "") is None
+    assert plan.apply(conversation, None) is None
+    # 与被代替的内容一样长或更长时丢弃
+    assert plan.apply(conversation, "四个汉字") is None
+    assert plan.apply(conversation, "比四个汉字还长的摘要") is None
+    assert conversation.summary is None and conversation.history() == conversation.messages
+
+
+def test_rolling_compaction_end_to_end(compactor):
+    conversation = conversation_with(4)
+    for round_number in range(3):
+        plan = compactor.plan(conversation)
+        assert plan.apply(conversation, f"摘要 {round_number}") is not None
+        add_turns(conversation, 3, start=conversation.turn_count)
+    # 每一轮都恰好出现一次：要么在摘要覆盖的范围内，要么逐字发送
+    history = conversation.history()
+    sent = prompts(history)
+    assert sent == [str(number) for number in range(conversation.summary_turns, conversation.turn_count)]
+    assert history[0]["content"] == SUMMARY_PREFIX + "摘要 2"
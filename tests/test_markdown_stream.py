@@ -0,0 +1,171 @@
+import random
+
+import pytest
+
+from markdown_stream import StreamingMarkdownRenderer
+
+
+BASE = 'ai_response'
+CODE = 'code_block'
+
+
+def render(chunks):
+    """逐块 feed 再 flush，把各次返回的片段合并 (相邻的同标签片段拼在一起)"""
+    renderer = StreamingMarkdownRenderer()
+    segments = []
+    for chunk in chunks:
+        segments.extend(renderer.feed(chunk))
+    segments.extend(renderer.flush())
+    return StreamingMarkdownRenderer._merge(segments)
+
+
+def tagged(segments, tag):
+    """带有 tag 的文本，按片段列出"""
+    return [text for text, tags in segments if tag in tags]
+
+
+def random_splits(text, rng, max_size=6):
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_size)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+DOCUMENT = (
+    "# 标题 **一**\n"
+    "普通文字 **粗体\n跨行** 结束，`代码 ** 不是粗体` 和 *单星号*。\n"
+    "\n"
+    "- 列表项 **未闭合\n"
+    "\n"
+    "12. 编号项\n"
+    "  ```python\n"
+    "def f(x):\n"
+    "    return x ** 2  # `不解析`\n"
+    "```\n"
+    "**粗体遇到代码块\n"
+    "```\n"
+    "plain\n"
+    "```尾部\n"
+    "### 三级 ** 标题\n"
+    "最后一行 *"
+)
+
+
+# --- 分块方式不影响结果 ---
+
+def test_random_chunk_splits_match_single_feed():
+    expected = render([DOCUMENT])
+    assert "".join(text for text, _tags in expected) == DOCUMENT
+    rng = random.Random(2024)
+    for _ in range(300):
+        assert render(random_splits(DOCUMENT, rng)) == expected
+
+
+def test_one_character_at_a_time():
+    assert render(list(DOCUMENT)) == render([DOCUMENT])
+
+
+# --- 粗体 ---
+
+def test_bold_spans_line_break():
+    segments = render(["a **bold\nline** b"])
+    assert tagged(segments, 'bold') == ["bold\nline"]
+    assert segments[-1] == ("** b", (BASE,))
+
+
+def test_unclosed_bold_ends_at_blank_line():
+    segments = render(["**open\n\nnext"])
+    assert tagged(segments, 'bold') == ["open\n"]
+    assert segments[-1] == ("\nnext", (BASE,))
+
+
+def test_whitespace_only_line_also_ends_bold():
+    assert tagged(render(["**open\n  \nnext"]), 'bold') == ["open\n"]
+
+
+def test_unclosed_bold_ends_at_fence():
+    segments = render(["**open\n```\ncode\n```\nafter"])
+    assert tagged(segments, 'bold') == ["open\n"]
+    assert ("```\ncode\n```", (CODE,)) in segments
+    assert segments[-1] == ("\nafter", (BASE,))
+
+
+def test_stars_inside_inline_code_are_literal():
+    segments = render(["`a ** b` **c**"])
+    # 反引号本身也带行内代码的标签
+    assert tagged(segments, 'inline_code') == ["`a ** b`"]
+    assert tagged(segments, 'bold') == ["c"]
+
+
+# --- 代码块 ---
+
+def test_fence_language_tag():
+    segments = render(["```python\nx = 1\n```\n"])
+    assert segments[0] == ("```", (CODE,))
+    assert tagged(segments, 'code_lang') == ["python"]
+    assert ("\nx = 1\n```", (CODE,)) in segments
+
+
+def test_fence_without_language_and_indented_fence():
+    segments = render(["   ```\ny\n```"])
+    assert tagged(segments, 'code_lang') == []
+    assert segments == [("   ```\ny\n```", (CODE,))]
+
+
+def test_text_after_closing_fence_is_plain():
+    segments = render(["```\nx\n``` tail\n"])
+    assert segments[-1] == (" tail\n", (BASE,))
+    renderer = StreamingMarkdownRenderer()
+    renderer.feed("```\nx\n")
+    assert renderer.in_code_block
+    renderer.feed("```\n")
+    assert not renderer.in_code_block
+
+
+# --- 数据块末尾的不完整前缀 ---
+
+@pytest.mark.parametrize("first, rest", [
+    ("a *", "*b**"),
+    ("a **b*", "*"),
+    ("x\n`", "``py\ny\n```"),
+    ("x\n``", "`\ny\n```"),
+    ("x\n#", "## 标题\n"),
+    ("x\n12", ". 项\n"),
+    ("x\n  ", "- 项\n"),
+])
+def test_partial_prefix_is_held_back(first, rest):
+    renderer = StreamingMarkdownRenderer()
+    emitted = "".join(text for text, _tags in renderer.feed(first))
+    # 末尾无法判断的字符暂存，等下一块到达再决定标签
+    held = first[len(emitted):]
+    assert held and first.startswith(emitted)
+    assert held.strip("`#*0123456789 ") == ""
+    assert render([first, rest]) == render([first + rest])
+
+
+def test_flush_emits_held_characters():
+    renderer = StreamingMarkdownRenderer()
+    assert renderer.feed("a *") == [("a ", (BASE,))]
+    assert renderer.flush() == [("*", (BASE,))]
+    renderer.reset()
+    assert renderer.feed("``") == []
+    assert renderer.flush() == [("``", (BASE, 'inline_code'))]
+
+
+# --- 行首结构 ---
+
+def test_heading_and_list_tags():
+    segments = render(["#### 四级\n- 项 **粗**\n普通"])
+    assert segments[0] == ("#### 四级\n", (BASE, 'heading3'))
+    assert ("粗", (BASE, 'list_item', 'bold')) in segments
+    assert segments[-1] == ("普通", (BASE,))
+
+
+def test_reset_clears_state():
+    renderer = StreamingMarkdownRenderer()
+    renderer.feed("```py\n**x")
+    renderer.reset()
+    assert renderer.feed("plain") == [("plain", (BASE,))]
@@ -0,0 +1,71 @@
+import cProfile
+import threading
+
+import pytest
+
+import profiling
+from profiling import ProfileSession
+
+
+def busy(count):
+    return sum(index * index for index in range(count))
+
+
+def run_session(tmp_path):
+    session = ProfileSession(enabled=True, top=5)
+    session.start()
+    results = []
+    try:
+        worker = threading.Thread(target=lambda: results.append(busy(20000)), name="worker-1")
+        worker.start()
+        worker.join(5)
+        session.run(busy, 20000)
+    finally:
+        report_dir = session.stop(tmp_path)
+    return results, report_dir
+
+
+@pytest.fixture(params=[False, True], ids=["per-thread", "process-wide"])
+def mode(request, monkeypatch):
+    # 3.12 之前也能走一遍整个进程共用一个分析器的路径 (此时它只覆盖主线程)
+    if request.param and not profiling.PROCESS_WIDE:
+        monkeypatch.setattr(profiling, "PROCESS_WIDE", True)
+    elif not request.param and profiling.PROCESS_WIDE:
+        pytest.skip("3.12 起不能为每个线程单独开启分析器")
+    return request.param
+
+
+def test_report_is_written(tmp_path, mode):
+    results, report_dir = run_session(tmp_path)
+    assert results == [busy(20000)]
+    report = (report_dir / "report.txt").read_text(encoding='utf-8')
+    assert "busy" in report
+    expected = ["所有线程"] if profiling.PROCESS_WIDE else ["MainThread", "worker-N"]
+    assert sorted(path.stem for path in report_dir.glob("*.pstats")) == expected
+
+
+def test_threads_still_run_when_profiler_is_taken(tmp_path, monkeypatch, capsys):
+    # 已经有其他分析工具 (3.12 起同一时间只能有一个) 时跳过分析，线程照常执行
+    def taken(self):
+        raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(cProfile.Profile, "enable", taken)
+    results, report_dir = run_session(tmp_path)
+    assert results == [busy(20000)]
+    assert (report_dir / "report.txt").exists()
+    assert capsys.readouterr().err.count("跳过") == 1
+
+
+def test_disabled_session_does_nothing(tmp_path):
+    original_run = threading.Thread.run
+    session = ProfileSession()
+    session.start()
+    assert threading.Thread.run is original_run
+    assert session.run(busy, 10) == busy(10)
+    assert session.stop(tmp_path) is None
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("name, group", [("ThreadPoolExecutor-0_3", "ThreadPoolExecutor-N_N"), ("MainThread", "MainThread")])
+def test_thread_group(name, group):
+    assert profiling._thread_group(name) == group
@@ -0,0 +1,131 @@
+from prompt_queue import PREVIEW_CHARS, PromptQueue, QueuedPrompt
+
+
+def make_queue(*prompts):
+    queue = PromptQueue()
+    for prompt in prompts:
+        queue.append(prompt, "model-a", "场景")
+    return queue
+
+
+def prompts(queue):
+    return [item.prompt for item in queue]
+
+
+# --- 入队与出队 ---
+
+def test_append_and_pop_in_order():
+    queue = make_queue("一", "二", "三")
+    assert len(queue) == 3 and queue
+    assert queue.pop_next().prompt == "一"
+    assert prompts(queue) == ["二", "三"]
+    assert queue.pop_next().prompt == "二"
+    assert queue.pop_next().prompt == "三"
+    assert queue.pop_next() is None
+    assert not queue
+
+
+def test_items_keep_model_and_scenario():
+    queue = PromptQueue()
+    queue.append("q", "model-b", "翻译")
+    item = queue.pop_next()
+    assert (item.prompt, item.model_name, item.scenario_name) == ("q", "model-b", "翻译")
+
+
+def test_label_collapses_whitespace_and_truncates():
+    assert QueuedPrompt("  多行\n问题\t内容 ", "m", "s").label(2) == "2. [m / s] 多行 问题 内容"
+    label = QueuedPrompt("字" * (PREVIEW_CHARS + 10), "m", "s").label(1)
+    assert label == "1. [m / s] " + "字" * PREVIEW_CHARS + "…"
+    assert QueuedPrompt("字" * PREVIEW_CHARS, "m", "s").label(1).endswith("字")
+
+
+# --- 调整顺序 ---
+
+def test_move_up_and_down():
+    queue = make_queue("a", "b", "c")
+    assert queue.move(2, -1) == 1
+    assert prompts(queue) == ["a", "c", "b"]
+    assert queue.move(0, 1) == 1
+    assert prompts(queue) == ["c", "a", "b"]
+    assert queue.move(1, -1) == 0
+    assert prompts(queue) == ["a", "c", "b"]
+
+
+def test_move_out_of_range_is_ignored():
+    queue = make_queue("a", "b", "c")
+    assert queue.move(0, -1) == 0
+    assert queue.move(2, 1) == 2
+    assert queue.move(5, -1) == 5
+    assert queue.move(-1, 1) == -1
+    assert prompts(queue) == ["a", "b", "c"]
+
+
+def test_remove_returns_next_selection():
+    queue = make_queue("a", "b", "c")
+    assert queue.remove(1) == 1
+    assert prompts(queue) == ["a", "c"]
+    # 删除最后一条时选中新的最后一条
+    assert queue.remove(1) == 0
+    assert prompts(queue) == ["a"]
+    assert queue.remove(0) is None
+    assert not queue
+
+
+def test_remove_out_of_range_keeps_items():
+    queue = make_queue("a", "b")
+    assert queue.remove(5) == 1
+    assert queue.remove(-1) == -1
+    assert prompts(queue) == ["a", "b"]
+    assert make_queue().remove(0) is None
+
+
+def test_clear():
+    queue = make_queue("a", "b")
+    queue.pause()
+    queue.clear()
+    assert not queue and queue.pop_next() is None
+    # 清空只影响内容，暂停状态由下一次发送解除
+    assert queue.paused
+
+
+# --- 暂停与继续 ---
+
+def test_peek_next_respects_pause():
+    queue = make_queue("a", "b")
+    assert queue.peek_next().prompt == "a"
+    assert len(queue) == 2
+    queue.pause()
+    assert queue.peek_next() is None
+    queue.resume()
+    assert queue.peek_next().prompt == "a"
+    assert make_queue().peek_next() is None
+
+
+def test_completed_turn_keeps_sending():
+    queue = make_queue("a", "b")
+    queue.turn_finished()
+    assert not queue.paused
+    assert queue.peek_next().prompt == "a"
+
+
+def test_stopped_turn_pauses_queue():
+    queue = make_queue("a", "b")
+    queue.turn_finished(stopped=True)
+    assert queue.paused and queue.peek_next() is None
+    # 暂停时内容保持不变，用户再次点击 "发送" 后从第一条继续
+    assert prompts(queue) == ["a", "b"]
+    queue.resume()
+    assert queue.peek_next().prompt == "a"
+
+
+def test_failed_turn_pauses_queue():
+    queue = make_queue("a")
+    queue.turn_finished(failed=True)
+    assert queue.paused and queue.peek_next() is None
+
+
+def test_successful_turn_does_not_resume_paused_queue():
+    queue = make_queue("a")
+    queue.pause()
+    queue.turn_finished()
+    assert queue.paused
@@ -0,0 +1,281 @@
+import time
+
+import pytest
+
+from rate_limiter import (BACKOFF_FACTOR, DEFAULT_THROTTLE_SECONDS, RECOVERY_STEP, RPM, TPM, RateLimiter,
+                          TokenBucket, parse_limits, parse_model_limits, parse_policy_window, parse_reset)
+
+
+# --- 配置与响应头解析 ---
+
+def test_parse_limits():
+    assert parse_limits("500/200000") == (500.0, 200000.0)
+    assert parse_limits("60/-") == (60.0, None)
+    assert parse_limits("0/100") == (None, 100.0)
+    assert parse_limits("30") == (30.0, None)
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("a=10/1000, *=5/-, broken") == {"a": (10.0, 1000.0), "*": (5.0, None)}
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20", 20.0),
+    ("0.5", 0.5),
+    ("1m30s", 90.0),
+    ("250ms", 0.25),
+    ("2h", 7200.0),
+    ("1m0.5s", 60.5),
+])
+def test_parse_reset_durations(value, seconds):
+    assert parse_reset(value) == pytest.approx(seconds)
+
+
+def test_parse_reset_points_in_time():
+    assert parse_reset(str(time.time() + 30)) == pytest.approx(30, abs=1)
+    iso = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 45))
+    assert parse_reset(iso) == pytest.approx(45, abs=1.5)
+    http_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert parse_reset(http_date) == pytest.approx(60, abs=1.5)
+    # 已经过去的时间点不会变成负数
+    assert parse_reset(str(time.time() - 30)) == 0.0
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "1x", "5m later"])
+def test_parse_reset_invalid(value):
+    assert parse_reset(value) is None
+
+
+@pytest.mark.parametrize("value, limit, window", [
+    ("100;w=60", None, 60.0),
+    ("10;w=1, 1000;w=3600", None, 1.0),
+    ("10;w=1, 1000;w=3600", 1000, 3600.0),
+    ("10;w=1;burst=20", 10, 1.0),
+    ("100", None, None),
+    ("100;w=0", None, None),
+    ("100;window=60", None, None),
+    (None, None, None),
+])
+def test_parse_policy_window(value, limit, window):
+    assert parse_policy_window(value, limit) == window
+
+
+# --- TokenBucket (显式传入 now，不依赖真实时间) ---
+
+def test_bucket_refills_at_configured_rate():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.reserve(60, now) == 0.0
+    assert bucket.tokens == 0
+    # 每分钟 60 个，即每秒恢复 1 个
+    bucket._refill(now + 10)
+    assert bucket.tokens == pytest.approx(10)
+    # 不超过容量
+    bucket._refill(now + 1000)
+    assert bucket.tokens == pytest.approx(60)
+
+
+def test_bucket_overdraft_makes_later_requests_wait():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.reserve(60, now) == 0.0
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    assert bucket.reserve(1, now) == pytest.approx(2.0)
+    # 补扣不等待，但之后的请求要多等
+    bucket.charge(30, now)
+    assert bucket.reserve(1, now) == pytest.approx(33.0)
+    bucket.refund(3, now)
+    assert bucket.tokens == pytest.approx(-30)
+
+
+def test_unlimited_bucket_only_pauses_on_request():
+    bucket = TokenBucket(None)
+    now = bucket.updated
+    assert bucket.reserve(10 ** 9, now) == 0.0
+    bucket.throttle(5, now)
+    assert bucket.reserve(1, now + 2) == pytest.approx(3.0)
+    assert bucket.reserve(1, now + 6) == 0.0
+
+
+def test_bucket_throttle_and_recover():
+    bucket = TokenBucket(100)
+    now = bucket.updated
+    bucket.throttle(2, now)
+    assert bucket.per_minute == pytest.approx(100 * BACKOFF_FACTOR)
+    assert bucket.tokens <= 0
+    assert bucket.reserve(0, now + 1) == pytest.approx(1.0)
+    # 再次 429 继续降速，之后每个成功的请求恢复一步
+    bucket.throttle(0, now + 2)
+    assert bucket.per_minute == pytest.approx(100 * BACKOFF_FACTOR ** 2)
+    steps = 0
+    while bucket.per_minute < bucket.ceiling:
+        bucket.recover()
+        steps += 1
+    assert bucket.per_minute == 100
+    assert steps == pytest.approx((1 - BACKOFF_FACTOR ** 2) / RECOVERY_STEP, abs=1)
+
+
+def test_bucket_learns_lower_server_limit_and_reset():
+    bucket = TokenBucket(1000)
+    now = bucket.updated
+    bucket.learn(limit=100, remaining=0, reset=12, now=now)
+    assert bucket.ceiling == 100 and bucket.per_minute == 100
+    assert bucket.tokens == 0
+    assert bucket.reserve(0, now) == pytest.approx(12)
+    # 服务端的上限更高时仍以配置为准
+    bucket.learn(limit=5000, remaining=None, reset=None, now=now + 20)
+    assert bucket.ceiling == 100
+
+
+def test_unconfigured_bucket_adopts_server_limit():
+    bucket = TokenBucket(None)
+    bucket.learn(limit=30, remaining=29, reset=None, now=bucket.updated)
+    assert bucket.per_minute == 30 and bucket.tokens == 29
+
+
+# --- RateLimiter ---
+
+def test_limiter_per_model_and_per_key_scopes():
+    limiter = RateLimiter(model_limits={"a": (2, None), "*": (None, 100)}, key_limit=(3, None))
+    assert limiter.reserve("k", "a", 10) == 0.0
+    assert limiter.reserve("k", "a", 10) == 0.0
+    # 模型 a 的 RPM 用完
+    assert limiter.reserve("k", "a", 10) > 0
+    # 其他模型的 TPM 单独计算，但共用 Key 的 RPM 总上限 (已用 3 个)
+    assert limiter.reserve("k", "b", 50) > 0
+    # 不同的 Key 互不影响
+    assert limiter.reserve("other", "a", 10) == 0.0
+
+
+def test_limiter_cancel_returns_reservation():
+    limiter = RateLimiter(model_limits={"a": (1, None)})
+    assert limiter.reserve("k", "a", 1) == 0.0
+    limiter.cancel("k", "a", 1)
+    assert limiter.reserve("k", "a", 1) == 0.0
+
+
+def test_limiter_settle_charges_output_tokens():
+    limiter = RateLimiter(model_limits={"a": (None, 600)})
+    assert limiter.reserve("k", "a", 100) == 0.0
+    limiter.settle("k", "a", 500)
+    # 600 个已经用完，再要 60 个需要等约 6 秒
+    assert limiter.reserve("k", "a", 60) == pytest.approx(6.0, abs=0.1)
+
+
+def test_limiter_observe_429_throttles_then_recovers():
+    limiter = RateLimiter(model_limits={"a": (60, None)})
+    limiter.observe("k", "a", 429, {"Retry-After": "3"})
+    assert limiter.reserve("k", "a", 1) == pytest.approx(3.0, abs=0.1)
+    bucket = limiter._bucket(limiter._key_id("k"), "a", "requests")
+    assert bucket.per_minute == pytest.approx(60 * BACKOFF_FACTOR)
+    for _ in range(10):
+        limiter.observe("k", "a", 200, {})
+    assert bucket.per_minute == 60
+
+
+def test_limiter_observe_429_without_retry_after():
+    limiter = RateLimiter()
+    limiter.observe("k", "a", 429, {})
+    assert limiter.reserve("k", "a", 1) == pytest.approx(DEFAULT_THROTTLE_SECONDS, abs=0.1)
+    # 没有 Retry-After 时按各自的重置时间暂停
+    limiter.observe("k", "b", 429, {"x-ratelimit-reset-requests": "250ms", "x-ratelimit-reset-tokens": "2s"})
+    assert limiter.reserve("k", "b", 1) == pytest.approx(2.0, abs=0.05)
+    requests = limiter._bucket(limiter._key_id("k"), "b", "requests")
+    assert requests.blocked_until - time.monotonic() == pytest.approx(0.25, abs=0.05)
+
+
+def test_limiter_observe_remaining_headers():
+    limiter = RateLimiter()
+    limiter.observe("k", "a", 200, {"anthropic-ratelimit-requests-limit": "50",
+                                    "anthropic-ratelimit-requests-remaining": "0",
+                                    "anthropic-ratelimit-requests-reset": "4"})
+    assert limiter.reserve("k", "a", 1) == pytest.approx(4.0, abs=0.1)
+
+
+# --- 各家的限流响应头 ---
+
+def buckets(limiter, model_name="a"):
+    key_id = limiter._key_id("k")
+    return limiter._bucket(key_id, model_name, RPM), limiter._bucket(key_id, model_name, TPM)
+
+
+def test_openai_headers_are_per_minute():
+    limiter = RateLimiter()
+    limiter.observe("k", "a", 200, {"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "499",
+                                    "x-ratelimit-reset-requests": "120ms",
+                                    "x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "0",
+                                    "x-ratelimit-reset-tokens": "1m0.5s"})
+    requests, tokens = buckets(limiter)
+    assert (requests.ceiling, requests.per_minute, requests.tokens) == (500, 500, 499)
+    assert tokens.ceiling == 30000 and tokens.tokens == 0
+    assert tokens.blocked_until - time.monotonic() == pytest.approx(60.5, abs=0.1)
+
+
+def test_anthropic_headers_are_per_minute():
+    limiter = RateLimiter()
+    reset = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 30))
+    limiter.observe("k", "a", 200, {"anthropic-ratelimit-requests-limit": "50",
+                                    "anthropic-ratelimit-requests-remaining": "10",
+                                    "anthropic-ratelimit-requests-reset": reset,
+                                    "anthropic-ratelimit-tokens-limit": "40000",
+                                    "anthropic-ratelimit-tokens-remaining": "0",
+                                    "anthropic-ratelimit-tokens-reset": reset})
+    requests, tokens = buckets(limiter)
+    assert (requests.ceiling, requests.tokens, requests.blocked_until) == (50, 10, 0.0)
+    assert tokens.ceiling == 40000
+    assert tokens.blocked_until - time.monotonic() == pytest.approx(30, abs=1.5)
+
+
+def test_generic_headers_without_window_are_not_rpm():
+    # 每小时 5000 次的 GitHub 风格响应头不能当作每分钟 5000 次 (也不能当作每分钟只剩 4000 次)
+    limiter = RateLimiter(model_limits={"a": (100, None)})
+    limiter.observe("k", "a", 200, {"x-ratelimit-limit": "5000", "x-ratelimit-remaining": "40",
+                                    "x-ratelimit-reset": str(time.time() + 1800)})
+    limiter.observe("k", "b", 200, {"ratelimit-limit": "10", "ratelimit-remaining": "3", "ratelimit-reset": "1"})
+    requests, _tokens = buckets(limiter)
+    assert (requests.ceiling, requests.per_minute, requests.tokens) == (100, 100, 100)
+    requests, _tokens = buckets(limiter, "b")
+    assert requests.ceiling is None and requests.per_minute is None
+    assert limiter.reserve("k", "b", 1) == 0.0
+
+
+def test_generic_headers_pause_when_exhausted():
+    limiter = RateLimiter()
+    limiter.observe("k", "a", 200, {"x-ratelimit-limit": "5000", "x-ratelimit-remaining": "0",
+                                    "x-ratelimit-reset": str(time.time() + 20)})
+    assert limiter.reserve("k", "a", 1) == pytest.approx(20, abs=1)
+    limiter.observe("k", "b", 200, {"ratelimit-limit": "10", "ratelimit-remaining": "0", "ratelimit-reset": "3"})
+    assert limiter.reserve("k", "b", 1) == pytest.approx(3, abs=0.1)
+
+
+@pytest.mark.parametrize("policy, per_minute", [
+    ("10;w=1", 600),
+    ("3600;w=3600", 60),
+    ("100;w=60", 100),
+    ("10;w=1, 3600;w=3600", 600),
+])
+def test_generic_headers_with_policy_window(policy, per_minute):
+    limiter = RateLimiter()
+    limit = policy.partition(";")[0]
+    limiter.observe("k", "a", 200, {"ratelimit-limit": limit, "ratelimit-remaining": "5", "ratelimit-reset": "1",
+                                    "ratelimit-policy": policy})
+    requests, tokens = buckets(limiter)
+    assert requests.ceiling == pytest.approx(per_minute) and requests.per_minute == pytest.approx(per_minute)
+    # 其他窗口内的剩余额度不用来校正每分钟的桶
+    assert requests.tokens == pytest.approx(per_minute)
+    assert tokens.ceiling is None
+
+
+def test_per_minute_headers_take_precedence_over_generic():
+    limiter = RateLimiter()
+    limiter.observe("k", "a", 200, {"x-ratelimit-limit-requests": "60", "x-ratelimit-limit": "5000",
+                                    "ratelimit-policy": "5000;w=60", "x-ratelimit-remaining": "0",
+                                    "x-ratelimit-reset": "30"})
+    requests, _tokens = buckets(limiter)
+    assert requests.ceiling == 60 and requests.blocked_until == 0.0
+
+
+def test_limiter_key_ids_are_digests():
+    limiter = RateLimiter()
+    limiter.reserve("Bearer secret", "a", 1)
+    assert all("secret" not in key_id for key_id, _model, _kind in limiter._buckets)
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from response_cache import CACHE_FILENAME, ResponseCache, cache_key, replay_stream
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def open_cache(tmp_path, clock):
+    caches = []
+
+    def create(**settings):
+        cache = ResponseCache(tmp_path / CACHE_FILENAME, clock=clock, **settings)
+        caches.append(cache)
+        return cache
+
+    yield create
+    for cache in caches:
+        cache.close()
+
+
+MESSAGES = [{"role": "system", "content": "你是助手"}, {"role": "user", "content": "你好"}]
+
+
+# --- 缓存键 ---
+
+def test_cache_key_ignores_dict_order():
+    reordered = [{"content": message["content"], "role": message["role"]} for message in MESSAGES]
+    assert cache_key("m", "sys", MESSAGES) == cache_key("m", "sys", reordered)
+
+
+@pytest.mark.parametrize("model_name, system_prompt, messages", [
+    ("other-model", "sys", MESSAGES),
+    ("m", "另一个场景", MESSAGES),
+    ("m", "sys", MESSAGES[:1]),
+    ("m", "sys", list(reversed(MESSAGES))),
+    ("m", "sys", [MESSAGES[0], {"role": "user", "content": "你好 "}]),
+    ("m", "sys", [MESSAGES[0], {"role": "assistant", "content": "你好"}]),
+])
+def test_cache_key_covers_model_system_prompt_and_messages(model_name, system_prompt, messages):
+    assert cache_key(model_name, system_prompt, messages) != cache_key("m", "sys", MESSAGES)
+
+
+def test_cache_key_is_stable():
+    key = cache_key("m", "sys", MESSAGES)
+    assert len(key) == 64 and key == cache_key("m", "sys", [dict(message) for message in MESSAGES])
+
+
+# --- 读写与淘汰 ---
+
+def test_round_trip_and_persistence(open_cache):
+    cache = open_cache()
+    assert cache.get("a") is None
+    cache.put("a", "m", "回答 **粗体**")
+    assert cache.get("a") == "回答 **粗体**"
+    cache.put("a", "m", "新的回答")
+    assert cache.get("a") == "新的回答"
+    cache.close()
+    assert open_cache().get("a") == "新的回答"
+
+
+def test_lru_eviction_uses_last_access(open_cache, clock):
+    cache = open_cache(max_bytes=30)
+    for key in ("a", "b", "c"):
+        cache.put(key, "m", key * 10)
+        clock.advance(1)
+    # 读取 a 使它变成最近访问的，超出容量时先淘汰 b
+    assert cache.get("a") == "a" * 10
+    clock.advance(1)
+    cache.put("d", "m", "d" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a" * 10, "c" * 10, "d" * 10]
+
+
+def test_eviction_removes_as_many_entries_as_needed(open_cache, clock):
+    cache = open_cache(max_bytes=30)
+    for key in ("a", "b", "c"):
+        cache.put(key, "m", key * 10)
+        clock.advance(1)
+    cache.put("big", "m", "x" * 25)
+    assert [cache.get(key) for key in ("a", "b", "c")] == [None, None, None]
+    assert cache.get("big") == "x" * 25
+
+
+def test_oversized_response_is_not_stored(open_cache):
+    cache = open_cache(max_bytes=10)
+    cache.put("a", "m", "汉字" * 2)
+    # 按 UTF-8 字节计算大小：4 个汉字是 12 字节
+    assert cache.get("a") is None
+    cache.put("b", "m", "ok")
+    assert cache.get("b") == "ok"
+
+
+def test_ttl_expiry_on_read(open_cache, clock):
+    cache = open_cache(ttl_seconds=100)
+    cache.put("a", "m", "回答")
+    clock.advance(100)
+    assert cache.get("a") == "回答"
+    # 读取会更新访问时间，但有效期从写入时算起
+    clock.advance(1)
+    assert cache.get("a") is None
+    clock.advance(-101)
+    assert cache.get("a") is None
+
+
+def test_ttl_expiry_on_write(open_cache, clock):
+    cache = open_cache(ttl_seconds=100)
+    cache.put("old", "m", "旧")
+    clock.advance(150)
+    cache.put("new", "m", "新")
+    clock.advance(-150)
+    # 写入时已经清理了过期条目，即使时间回到过去也读不到
+    assert cache.get("old") is None
+    assert cache.get("new") == "新"
+
+
+def test_zero_ttl_never_expires(open_cache, clock):
+    cache = open_cache(ttl_seconds=0)
+    cache.put("a", "m", "回答")
+    clock.advance(10 ** 9)
+    cache.put("b", "m", "回答")
+    assert cache.get("a") == "回答"
+
+
+def test_closed_cache_misses_and_ignores_writes(open_cache):
+    cache = open_cache()
+    cache.put("a", "m", "回答")
+    cache.close()
+    cache.close()
+    assert cache.get("a") is None
+    cache.put("b", "m", "回答")
+
+
+def test_for_directory_reads_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHATBOT_CACHE_MAX_MB", "0.5")
+    monkeypatch.setenv("CHATBOT_CACHE_TTL_DAYS", "2")
+    cache = ResponseCache.for_directory(tmp_path)
+    try:
+        assert cache.path == tmp_path / CACHE_FILENAME
+        assert cache.max_bytes == 512 * 1024 and cache.ttl_seconds == 2 * 24 * 3600
+    finally:
+        cache.close()
+
+
+# --- 回放 ---
+
+def test_replay_stream_reassembles_response():
+    async def collect():
+        return [chunk async for chunk in replay_stream("回答" * 30, chunk_chars=7)]
+
+    chunks = asyncio.run(collect())
+    assert "".join(chunks) == "回答" * 30
+    assert all(len(chunk) <= 7 for chunk in chunks)
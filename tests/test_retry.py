@@ -0,0 +1,229 @@
+import asyncio
+import time
+
+import pytest
+
+import async_engine
+import chat_api
+from retry_policy import RetryPolicy, StreamError, final_error, http_error, parse_retry_after
+from sse_server import StandInSettings
+
+
+def quick_policy(**overrides):
+    """退避很短的策略，用例不必真的等待几秒"""
+    settings = dict(max_attempts=3, base_delay=0.01, max_delay=0.02, connect_timeout=2.0,
+                    first_token_timeout=2.0, stall_timeout=2.0)
+    settings.update(overrides)
+    return RetryPolicy(**settings)
+
+
+def expected_text(chunks):
+    return "".join(StandInSettings(chunks=chunks).iter_deltas())
+
+
+# --- RetryPolicy ---
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-4") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    future = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 < parse_retry_after(future) <= 30
+    past = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() - 30))
+    assert parse_retry_after(past) == 0.0
+
+
+def test_http_error_marks_retryable_status():
+    error = http_error(429, {"Retry-After": "2"}, "slow down")
+    assert error.retryable and error.retry_after == 2.0 and error.status == 429
+    assert not http_error(401, {}, "bad key").retryable
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_attempts=3, max_retry_after=10)
+    retryable = StreamError("x", retryable=True)
+    assert policy.should_retry(retryable, 1, "")
+    assert not policy.should_retry(retryable, 3, "")
+    assert not policy.should_retry(StreamError("x"), 1, "")
+    assert not policy.should_retry(StreamError("x", retryable=True, retry_after=60), 1, "")
+    # 已经输出了部分内容：只有允许续写时才重试
+    assert policy.should_retry(retryable, 1, "partial")
+    assert not RetryPolicy(resume=False).should_retry(retryable, 1, "partial")
+
+
+def test_backoff_is_bounded_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    for attempt in range(1, 8):
+        delay = policy.backoff(attempt)
+        assert 0 <= delay <= min(4.0, 2 ** (attempt - 1))
+    assert policy.backoff(1, retry_after=7.5) >= 7.5
+
+
+def test_final_error_mentions_attempts():
+    assert str(final_error(StreamError("boom"), 1)) == "boom"
+    assert "共尝试 3 次" in str(final_error(StreamError("boom"), 3))
+
+
+# --- 同步入口 (chat_api.call_api_stream) 对替身服务器 ---
+
+def collect_sync(policy, retries):
+    on_retry = lambda attempt, delay, error, resuming: retries.append((attempt, delay, str(error), resuming))
+    return "".join(chat_api.call_api_stream("q", "Bearer test", "m", "sys", policy=policy, on_retry=on_retry))
+
+
+def test_sync_retries_server_error(stand_in):
+    server = stand_in(chunks=6, error_rate=1.0, error_status=500)
+    retries = []
+
+    def on_retry(*args):
+        retries.append(args)
+        server.settings.error_rate = 0.0
+
+    text = "".join(chat_api.call_api_stream("q", "Bearer test", "m", "sys", policy=quick_policy(), on_retry=on_retry))
+    assert text == expected_text(6)
+    assert len(retries) == 1 and retries[0][3] is False
+
+
+def test_sync_gives_up_after_max_attempts(stand_in):
+    stand_in(error_rate=1.0, error_status=503)
+    retries = []
+    with pytest.raises(StreamError) as raised:
+        collect_sync(quick_policy(max_attempts=2), retries)
+    assert raised.value.status == 503
+    assert "共尝试 2 次" in str(raised.value)
+    assert len(retries) == 1
+
+
+def test_sync_does_not_retry_client_error(stand_in):
+    stand_in(error_rate=1.0, error_status=401)
+    retries = []
+    with pytest.raises(StreamError):
+        collect_sync(quick_policy(), retries)
+    assert retries == []
+
+
+def test_sync_waits_for_retry_after(stand_in):
+    server = stand_in(chunks=4, error_rate=1.0, error_status=429)
+    retries = []
+
+    def on_retry(attempt, delay, error, resuming):
+        retries.append(delay)
+        server.settings.error_rate = 0.0
+
+    start = time.monotonic()
+    text = "".join(chat_api.call_api_stream("q", "Bearer test", "m", "sys", policy=quick_policy(), on_retry=on_retry))
+    assert text == expected_text(4)
+    # 替身服务器的 429 带 Retry-After: 1
+    assert retries[0] >= 1.0
+    assert time.monotonic() - start >= 1.0
+
+
+def test_sync_resumes_broken_stream(stand_in, monkeypatch):
+    server = stand_in(chunks=10, abort_rate=1.0)
+    partials = []
+    original = chat_api.build_messages
+
+    def spy(prompt, system_prompt, history=None, partial_response=None):
+        partials.append(partial_response)
+        return original(prompt, system_prompt, history, partial_response)
+
+    monkeypatch.setattr(chat_api, "build_messages", spy)
+    retries = []
+
+    def on_retry(attempt, delay, error, resuming):
+        retries.append(resuming)
+        server.settings.abort_rate = 0.0
+
+    text = "".join(chat_api.call_api_stream("q", "Bearer test", "m", "sys", policy=quick_policy(), on_retry=on_retry))
+    first_half = "".join(list(StandInSettings(chunks=10).iter_deltas())[:5])
+    # 调用方收到的是连续的文本：断开前的部分 + 续写请求的输出
+    assert text == first_half + expected_text(10)
+    assert retries == [True]
+    # 续写请求把已经收到的部分作为 assistant 消息发回
+    assert first_half in partials
+
+
+def test_sync_stall_timeout(stand_in):
+    stand_in(chunks=10, stall_rate=1.0, stall_seconds=3.0)
+    retries = []
+    start = time.monotonic()
+    with pytest.raises(StreamError) as raised:
+        collect_sync(quick_policy(max_attempts=1, stall_timeout=0.3), retries)
+    assert "停顿" in str(raised.value)
+    assert time.monotonic() - start < 2.5
+
+
+# --- 异步引擎 (httpx 与线程读取两种方式) ---
+
+@pytest.fixture(params=["httpx", "thread"])
+def engine(request, monkeypatch):
+    if request.param == "httpx":
+        pytest.importorskip("httpx")
+    engines = []
+
+    def create(policy):
+        engine = async_engine.AsyncStreamEngine(retry_policy=policy)
+        if request.param == "thread":
+            monkeypatch.setattr(engine, "_get_client", lambda: None)
+        engines.append(engine)
+        return engine
+
+    yield create
+    for engine in engines:
+        # 先让被中止的生成器在事件循环中收尾，避免退出时出现 "Task was destroyed" 警告
+        asyncio.run_coroutine_threadsafe(engine._loop.shutdown_asyncgens(), engine._loop).result(5)
+        engine.close()
+
+
+def collect_async(engine, on_retry=None, timeout=15):
+    async def run():
+        parts = []
+        async for content in engine.astream_chat("q", "Bearer test", "m", "sys", on_retry=on_retry):
+            parts.append(content)
+        return "".join(parts)
+
+    return engine.submit(run()).result(timeout)
+
+
+def test_async_retries_and_resumes(stand_in, engine):
+    server = stand_in(chunks=10, error_rate=1.0, error_status=502)
+    retries = []
+
+    def on_retry(attempt, delay, error, resuming):
+        retries.append((attempt, resuming))
+        # 第一次返回 502，第二次流到一半断开，第三次正常
+        if attempt == 1:
+            server.settings.error_rate = 0.0
+            server.settings.abort_rate = 1.0
+        else:
+            server.settings.abort_rate = 0.0
+
+    text = collect_async(engine(quick_policy()), on_retry)
+    first_half = "".join(list(StandInSettings(chunks=10).iter_deltas())[:5])
+    assert text == first_half + expected_text(10)
+    assert retries == [(1, False), (2, True)]
+
+
+def test_async_first_token_timeout(stand_in, engine):
+    stand_in(chunks=4, first_token_delay=3.0)
+    start = time.monotonic()
+    with pytest.raises(StreamError) as raised:
+        collect_async(engine(quick_policy(max_attempts=1, first_token_timeout=0.3)))
+    assert "首字超时" in str(raised.value)
+    assert time.monotonic() - start < 2.5
+
+
+def test_async_stall_timeout_then_recovers(stand_in, engine):
+    server = stand_in(chunks=6, stall_rate=1.0, stall_seconds=3.0)
+    retries = []
+
+    def on_retry(attempt, delay, error, resuming):
+        retries.append((str(error), resuming))
+        server.settings.stall_rate = 0.0
+
+    text = collect_async(engine(quick_policy(stall_timeout=0.3)), on_retry)
+    assert len(retries) == 1
+    assert "停顿" in retries[0][0] and retries[0][1] is True
+    assert text.endswith(expected_text(6))
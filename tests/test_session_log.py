@@ -0,0 +1,127 @@
+import json
+import struct
+
+import pytest
+
+from session_log import INDEX_SUFFIX, LOG_SUFFIX, SESSION_FILENAME, SessionLog, encode_turn, read_turns
+
+
+def turn(number):
+    return ("model", "场景", f"问题 {number}", f"回答 {number} " + "内容" * number)
+
+
+@pytest.fixture
+def log(tmp_path):
+    session_log = SessionLog(tmp_path)
+    yield session_log
+    session_log.close()
+
+
+def write_session(log, conversation_id, turns):
+    for values in turns:
+        log.append(conversation_id, *values)
+    log.save_tabs([{"id": conversation_id, "model": "model", "scenario": "场景", "continuous": True}], 0)
+    log.close()
+
+
+def paths(tmp_path, conversation_id):
+    return tmp_path / (conversation_id + LOG_SUFFIX), tmp_path / (conversation_id + INDEX_SUFFIX)
+
+
+def load(tmp_path):
+    """重新打开并读出；等写入线程做完修复后返回 (标签页, 当前页)"""
+    reopened = SessionLog(tmp_path)
+    try:
+        return reopened.load()
+    finally:
+        reopened.close()
+
+
+def test_round_trip(tmp_path, log):
+    write_session(log, "a", [turn(number) for number in range(5)])
+    tabs, current = load(tmp_path)
+    assert current == 0
+    assert [(t["model"], t["scenario"], t["prompt"], t["response"]) for t in tabs[0]["turns"]] == \
+        [turn(number) for number in range(5)]
+    assert tabs[0]["continuous"] is True
+
+
+def test_torn_tail_is_repaired(tmp_path, log):
+    write_session(log, "a", [turn(number) for number in range(3)])
+    log_path, index_path = paths(tmp_path, "a")
+    complete_size = log_path.stat().st_size
+    # 模拟写到一半中断：最后一条记录只写了一部分，索引多了半个偏移
+    with log_path.open('ab') as f:
+        f.write(encode_turn(0.0, *turn(3))[:20])
+    with index_path.open('ab') as f:
+        f.write(struct.pack("<Q", complete_size)[:5])
+
+    tabs, _current = load(tmp_path)
+    assert len(tabs[0]["turns"]) == 3
+    # 修复后日志截到最后一条完整记录，索引与之一致
+    assert log_path.stat().st_size == complete_size
+    assert index_path.stat().st_size == 3 * 8
+
+    # 修复后可以继续追加
+    reopened = SessionLog(tmp_path)
+    reopened.append("a", *turn(3))
+    reopened.close()
+    tabs, _current = load(tmp_path)
+    assert [t["prompt"] for t in tabs[0]["turns"]] == [f"问题 {number}" for number in range(4)]
+
+
+def test_records_missing_from_index_are_recovered(tmp_path, log):
+    write_session(log, "a", [turn(number) for number in range(4)])
+    log_path, index_path = paths(tmp_path, "a")
+    # 写完日志、写索引之前中断：索引缺少最后两条
+    index_path.write_bytes(index_path.read_bytes()[:16])
+    tabs, _current = load(tmp_path)
+    assert len(tabs[0]["turns"]) == 4
+    assert index_path.stat().st_size == 4 * 8
+
+    index_path.unlink()
+    tabs, _current = load(tmp_path)
+    assert len(tabs[0]["turns"]) == 4
+
+
+def test_corrupted_record_truncates_from_there(tmp_path, log):
+    write_session(log, "a", [turn(number) for number in range(3)])
+    log_path, _index_path = paths(tmp_path, "a")
+    _turns, _end, offsets = read_turns(*paths(tmp_path, "a"))
+    data = bytearray(log_path.read_bytes())
+    # 第二条记录的内容被改动，CRC 校验失败
+    data[offsets[1] + 40] ^= 0xFF
+    log_path.write_bytes(bytes(data))
+
+    tabs, _current = load(tmp_path)
+    assert [t["prompt"] for t in tabs[0]["turns"]] == ["问题 0"]
+    assert log_path.stat().st_size == offsets[1]
+
+
+def test_reset_removes_log(tmp_path, log):
+    log.append("a", *turn(0))
+    log.reset("a")
+    log.close()
+    assert not any(path.exists() for path in paths(tmp_path, "a"))
+
+
+def test_missing_or_invalid_session_file(tmp_path):
+    assert load(tmp_path) == ([], 0)
+    (tmp_path / SESSION_FILENAME).write_text("{not json", encoding='utf-8')
+    assert load(tmp_path) == ([], 0)
+    # 标签页的日志已经不存在时恢复为空对话
+    (tmp_path / SESSION_FILENAME).write_text(json.dumps({"tabs": [{"id": "gone"}], "current": 5}), encoding='utf-8')
+    tabs, current = load(tmp_path)
+    assert tabs[0]["turns"] == [] and current == 0
+
+
+def test_restore_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHATBOT_SESSION_DIR", str(tmp_path))
+    monkeypatch.delenv("CHATBOT_SESSION_RESTORE", raising=False)
+    assert SessionLog.from_env() is None
+    monkeypatch.setenv("CHATBOT_SESSION_RESTORE", "1")
+    enabled = SessionLog.from_env()
+    try:
+        assert enabled.directory == tmp_path
+    finally:
+        enabled.close()
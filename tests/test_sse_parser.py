@@ -0,0 +1,125 @@
+import json
+import random
+
+import pytest
+
+from sse_parser import DeltaDecoder, SSEParser, select_json_loads
+
+
+def delta(content):
+    return f"data: {json.dumps({'choices': [{'delta': {'content': content}}]}, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+def random_splits(data, rng, max_size=7):
+    """把字节串切成随机长度的数据块 (可能切在 UTF-8 字符、\\r\\n 或 "data: " 中间)"""
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+STREAM = (
+    b": keep-alive comment\n"
+    b"event: ping\n"
+    b"data: {}\n"
+    b"\n"
+    b"id: 42\n"
+    b"retry: 3000\n"
+    b"data: first line\n"
+    b"data:second line\n"
+    b"\n"
+    b"data: \xe4\xbd\xa0\xe5\xa5\xbd\n"
+    b"\n"
+    b"data: [DONE]\n"
+    b"\n"
+)
+
+EXPECTED = [
+    ("ping", b"{}"),
+    ("message", b"first line\nsecond line"),
+    ("message", "你好".encode('utf-8')),
+    ("message", b"[DONE]"),
+]
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_parser_whole_stream(newline):
+    parser = SSEParser()
+    assert parser.feed(STREAM.replace(b"\n", newline)) == EXPECTED
+    assert parser.last_event_id == "42"
+    assert parser.retry == 3000
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_parser_random_chunk_splits(newline):
+    data = STREAM.replace(b"\n", newline)
+    rng = random.Random(1234)
+    for _ in range(300):
+        parser = SSEParser()
+        assert feed_all(parser, random_splits(data, rng)) == EXPECTED
+        assert parser.last_event_id == "42"
+
+
+def test_parser_crlf_split_across_chunks():
+    parser = SSEParser()
+    assert parser.feed(b"data: a\r") == []
+    # 上一块结尾的 \r 和这一块开头的 \n 是同一个换行，不能被当成空行提前结束事件
+    assert parser.feed(b"\ndata: b\r") == []
+    assert parser.feed(b"\n\r\n") == [("message", b"a\nb")]
+
+
+def test_parser_incomplete_event_waits():
+    parser = SSEParser()
+    assert parser.feed(b"data: partial") == []
+    assert parser.feed(b" event\n") == []
+    assert parser.feed(b"\n") == [("message", b"partial event")]
+
+
+def test_parser_ignores_unknown_fields_and_bad_values():
+    parser = SSEParser()
+    events = parser.feed(b"foo: bar\nid: a\0b\nretry: soon\ndata\n\n")
+    # 只有字段名的 data 行表示一行空数据
+    assert events == [("message", b"")]
+    assert parser.last_event_id == ""
+    assert parser.retry is None
+
+
+def test_parser_fast_path_single_event_chunks():
+    parser = SSEParser()
+    assert parser.feed(b"event: custom\n") == []
+    # 快速路径仍然使用此前设置的事件类型，并在之后恢复默认
+    assert parser.feed(b"data: x\n\n") == [("custom", b"x")]
+    assert parser.feed(b"data: y\n\n") == [("message", b"y")]
+
+
+@pytest.mark.parametrize("backend", ["json", "auto"])
+def test_delta_decoder_random_splits(backend):
+    loads, _name = select_json_loads(backend)
+    contents = ["Hello", ", ", "世界", "**粗体**", "\n```py\n", "x = 1\n", "```"]
+    data = b"".join(delta(content) for content in contents)
+    data = (b'data: {"choices":[{"delta":{"role":"assistant"}}]}\n\n' + data
+            + b": heartbeat\n\ndata: not json with \"content\"\n\n" + b"data: [DONE]\n\n" + delta("ignored"))
+    rng = random.Random(99)
+    for _ in range(200):
+        decoder = DeltaDecoder(loads)
+        received = []
+        for chunk in random_splits(data, rng, max_size=11):
+            received.extend(decoder.feed(chunk))
+        assert "".join(received) == "".join(contents)
+        assert decoder.done
+
+
+def test_delta_decoder_ignores_everything_after_done():
+    decoder = DeltaDecoder()
+    assert decoder.feed(delta("a") + b"data: [DONE]\n\n" + delta("b")) == ["a"]
+    assert decoder.feed(delta("c")) == []
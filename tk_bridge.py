@@ -0,0 +1,60 @@
+import collections
+import threading
+import time
+
+
+# --- 后台线程 → Tk 主线程的事件桥接 ---
+# 只依赖标准库，界面启动时创建它不会连带导入 asyncio 和 HTTP 客户端。
+
+
+class TkEventBridge:
+    """
+    线程安全的 "事件循环 → Tk 主线程" 桥接，同时也是逐帧合并的渲染队列。
+    后台线程调用 post(callback, *args) 或 post_text(callback, text)，
+    Tk 主线程每帧 (默认 16ms) 取出一次队列：相邻的文本增量会被合并成一次回调，
+    所以无论模型输出多快，每帧的插入和滚动次数都是固定的。
+    """
+
+    def __init__(self, master, frame_ms=16, max_frame_ms=100):
+        self.master = master
+        self.frame_ms = frame_ms
+        self.max_frame_ms = max_frame_ms
+        self._lock = threading.Lock()
+        self._events = collections.deque()
+        self._poll()
+
+    def post(self, callback, *args):
+        with self._lock:
+            self._events.append((callback, args, None))
+
+    def post_text(self, callback, text):
+        """
+        推送一段文本增量。若队尾是同一回调的文本，直接拼接到它后面，
+        生产方永远不会被阻塞，渲染慢时积压的文本只会在下一帧一次性插入。
+        """
+        with self._lock:
+            if self._events:
+                last_callback, _, parts = self._events[-1]
+                if parts is not None and last_callback == callback:
+                    parts.append(text)
+                    return
+            self._events.append((callback, (), [text]))
+
+    def _poll(self):
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                events, self._events = self._events, collections.deque()
+            for callback, args, parts in events:
+                if parts is None:
+                    callback(*args)
+                else:
+                    callback(''.join(parts))
+        finally:
+            # 本帧渲染耗时超过一帧时拉长下一帧间隔，把时间让给键盘和鼠标事件
+            elapsed_ms = int((time.perf_counter() - start) * 1000)
+            delay = min(max(self.frame_ms, elapsed_ms), self.max_frame_ms)
+            self._after_id = self.master.after(delay, self._poll)
+
+    def close(self):
+        self.master.after_cancel(self._after_id)
@@ -0,0 +1,261 @@
+import os
+import tkinter as tk
+
+from markdown_stream import StreamingMarkdownRenderer
+
+
+# --- 有界的对话显示区 ---
+# ScrolledText 只保留最近 max_turns 轮的完整内容，更早的轮次折叠成一行占位符，点击后按保存的问答重新渲染。
+# 占位符超过 max_placeholders 行后，最早的占位符再合并成一行 "已隐藏 k 轮" 的提示 (可在搜索面板中查找)。
+# 这样无论会话持续多久，文本控件的大小以及每次插入、滚动和打标签的开销都保持不变。
+# 用户滚动到顶部时，由 reveal 把提示行中最近的几轮重新完整显示；恢复上次的会话时 (restore)
+# 也只渲染最后几轮，更早的轮次先放在提示行里，同样在滚动到顶部时逐批加载。
+#
+# 每一轮从标记 turn<n> 开始，到下一轮的标记 (或文本末尾) 结束；应用照常在末尾插入文字，
+# 只需在每轮开始时调用 begin_turn，结束时调用 end_turn。
+
+OPEN = "open"
+COLLAPSED = "collapsed"
+HIDDEN = "hidden"
+
+_HIDDEN_HEAD = "transcript_hidden_head"
+
+
+class TurnRecord:
+    """折叠后重新展开一轮所需的全部内容"""
+
+    def __init__(self, number, prompt, model_name, scenario_name):
+        self.number = number
+        self.prompt = prompt
+        self.model_name = model_name
+        self.scenario_name = scenario_name
+        self.response = ""
+        self.finished = False
+        self.state = OPEN
+        # 用户手动展开的旧轮次，不参与自动折叠
+        self.pinned = False
+
+    @property
+    def mark(self):
+        return f"turn{self.number}"
+
+    def placeholder_text(self):
+        preview = " ".join(self.prompt.split())
+        if len(preview) > 40:
+            preview = preview[:40] + "…"
+        return f"\n▸ 第 {self.number} 轮 ({self.model_name}): {preview}  [点击展开]\n"
+
+
+class TranscriptView:
+    """
+    管理 output_text 中各轮内容的折叠与展开。参数可通过环境变量覆盖：
+      CHATBOT_TRANSCRIPT_TURNS          完整显示的最近轮数
+      CHATBOT_TRANSCRIPT_PLACEHOLDERS   保留的单轮占位符行数
+    """
+
+    def __init__(self, text_widget, max_turns=20, max_placeholders=100):
+        self.text = text_widget
+        self.max_turns = max_turns
+        self.max_placeholders = max_placeholders
+        self.turns = []
+        self.hidden_count = 0
+
+        self.text.tag_config('placeholder', foreground='#808080', font=('Arial', 9, 'italic'))
+        self.text.tag_config('transcript_note', foreground='#808080', font=('Arial', 9, 'italic'))
+        self.text.tag_bind('placeholder', '<Enter>', lambda event: self.text.config(cursor='hand2'))
+        self.text.tag_bind('placeholder', '<Leave>', lambda event: self.text.config(cursor=''))
+
+    @classmethod
+    def from_env(cls, text_widget):
+        return cls(
+            text_widget,
+            max_turns=int(os.environ.get("CHATBOT_TRANSCRIPT_TURNS", 20)),
+            max_placeholders=int(os.environ.get("CHATBOT_TRANSCRIPT_PLACEHOLDERS", 100))
+        )
+
+    # --- 应用调用的接口 ---
+
+    def begin_turn(self, prompt, model_name, scenario_name):
+        """新一轮开始 (在插入本轮任何文字之前调用)；必要时先折叠最早的完整轮次"""
+        self._enforce_limits()
+        turn = TurnRecord(len(self.turns) + 1, prompt, model_name, scenario_name)
+        self.turns.append(turn)
+        self.text.mark_set(turn.mark, "end-1c")
+        self.text.mark_gravity(turn.mark, 'left')
+        return turn
+
+    def end_turn(self, response):
+        """本轮结束 (成功或失败)，保存回复用于之后重新展开"""
+        if self.turns and not self.turns[-1].finished:
+            self.turns[-1].response = response
+            self.turns[-1].finished = True
+
+    def restore(self, turns, visible_turns):
+        """
+        在空白的显示区中恢复上次会话的各轮 (turns 为 [(问题, 回复, 模型, 场景)])：只完整显示最后 visible_turns 轮，
+        更早的轮次并入 "已隐藏" 提示行，不渲染任何内容
+        """
+        for prompt, response, model_name, scenario_name in turns:
+            turn = TurnRecord(len(self.turns) + 1, prompt, model_name, scenario_name)
+            turn.response = response
+            turn.finished = True
+            self.turns.append(turn)
+        self.hidden_count = max(len(self.turns) - visible_turns, 0)
+
+        self.text.config(state='normal')
+        if self.hidden_count:
+            for turn in self.turns[:self.hidden_count]:
+                turn.state = HIDDEN
+            self.text.mark_set(_HIDDEN_HEAD, "end-1c")
+            self.text.mark_gravity(_HIDDEN_HEAD, 'left')
+            self.text.insert(tk.END, self._hidden_note(), 'transcript_note')
+        for turn in self.turns[self.hidden_count:]:
+            self.text.mark_set(turn.mark, "end-1c")
+            self.text.mark_gravity(turn.mark, 'left')
+            for content, tags in self._turn_chunks(turn):
+                self.text.insert(tk.END, content, tags)
+        self.text.config(state='disabled')
+
+    def clear(self):
+        """配合清空对话窗口使用：删除所有标记、占位符标签和记录"""
+        for turn in self.turns:
+            if turn.state != HIDDEN:
+                self.text.mark_unset(turn.mark)
+            self._unbind(turn)
+        if self.hidden_count:
+            self.text.mark_unset(_HIDDEN_HEAD)
+        self.turns = []
+        self.hidden_count = 0
+
+    # --- 折叠与展开 ---
+
+    def _enforce_limits(self):
+        open_turns = [turn for turn in self.turns if turn.state == OPEN and not turn.pinned]
+        for turn in open_turns[:max(len(open_turns) + 1 - self.max_turns, 0)]:
+            if turn.finished:
+                self.collapse(turn)
+
+        # 只隐藏紧接在 "已隐藏" 提示行之后的连续占位符，用户展开的旧轮次保持原位
+        excess = sum(1 for turn in self.turns if turn.state == COLLAPSED) - self.max_placeholders
+        for turn in self.turns[self.hidden_count:]:
+            if excess <= 0 or turn.state != COLLAPSED:
+                break
+            self._hide(turn)
+            excess -= 1
+
+    def _range(self, turn):
+        """返回 (起点, 终点, 紧随其后的标记名)；终点是下一轮的标记或文本末尾"""
+        start = self.text.index(turn.mark)
+        for later in self.turns[turn.number:]:
+            if later.state != HIDDEN:
+                return start, self.text.index(later.mark), later.mark
+        return start, self.text.index("end-1c"), None
+
+    def _replace(self, turn, chunks):
+        """把一轮的内容替换为 chunks [(文字, 标签)]，并把下一轮的标记移回替换后内容的末尾"""
+        start, end, next_mark = self._range(turn)
+        self.text.config(state='normal')
+        self.text.delete(start, end)
+        # 删除后下一轮的标记和本轮标记重合，插入的文字会落在两个标记之后，所以插入完再把下一轮标记移到末尾
+        self.text.mark_set("transcript_insert", start)
+        for content, tags in chunks:
+            self.text.insert("transcript_insert", content, tags)
+        if next_mark is not None:
+            self.text.mark_set(next_mark, "transcript_insert")
+        self.text.mark_set(turn.mark, start)
+        self.text.mark_unset("transcript_insert")
+        self.text.config(state='disabled')
+
+    def collapse(self, turn):
+        if turn.state != OPEN:
+            return
+        self._unbind(turn)
+        tag = f"placeholder{turn.number}"
+        self._replace(turn, [(turn.placeholder_text(), ('placeholder', tag))])
+        self.text.tag_bind(tag, '<Button-1>', lambda event, turn=turn: self.expand(turn))
+        turn.state = COLLAPSED
+        turn.pinned = False
+
+    def expand(self, turn):
+        """按保存的问答重新渲染一轮，顶部放一行 "折叠" 链接；展开的轮次不会被自动折叠"""
+        if turn.state != COLLAPSED:
+            return
+        self._unbind(turn)
+        tag = f"collapse{turn.number}"
+        chunks = [(f"\n▾ 第 {turn.number} 轮  [点击折叠]\n", ('placeholder', tag))] + self._turn_chunks(turn)
+        self._replace(turn, chunks)
+        self.text.tag_bind(tag, '<Button-1>', lambda event, turn=turn: self.collapse(turn))
+        turn.state = OPEN
+        turn.pinned = True
+
+    @staticmethod
+    def _turn_chunks(turn):
+        """按保存的问答重新渲染一轮的 [(文字, 标签)]"""
+        chunks = [
+            (f"\n--- 用户 (模型: {turn.model_name}, 场景: {turn.scenario_name}): ---\n{turn.prompt}\n", 'user'),
+            ("\n--- AI 助手: ---\n", 'ai_response')
+        ]
+        renderer = StreamingMarkdownRenderer()
+        chunks += renderer.feed(turn.response) + renderer.flush()
+        chunks.append(("\n", None))
+        return chunks
+
+    def _hidden_note(self):
+        return f"\n… 更早的 {self.hidden_count} 轮对话已隐藏，滚动到顶部加载，也可通过 \"搜索记录\" 查看\n"
+
+    def reveal(self, count):
+        """
+        把 "已隐藏" 提示行中最近的 count 轮重新完整显示在提示行之后 (用户滚动到顶部时调用)，返回显示的轮数。
+        显示出来的轮次和新的轮次一样，之后超出保留轮数时会再被折叠
+        """
+        count = min(count, self.hidden_count)
+        if count <= 0:
+            return 0
+        revealed = self.turns[self.hidden_count - count:self.hidden_count]
+        # 隐藏的轮次总是最前面的连续几轮，提示行一直延伸到第一个没有隐藏的轮次
+        following = self.turns[self.hidden_count] if self.hidden_count < len(self.turns) else None
+        end = following.mark if following is not None else "end-1c"
+        self.hidden_count -= count
+
+        self.text.config(state='normal')
+        self.text.delete(_HIDDEN_HEAD, end)
+        self.text.mark_set("transcript_insert", _HIDDEN_HEAD)
+        if self.hidden_count:
+            self.text.insert("transcript_insert", self._hidden_note(), 'transcript_note')
+        else:
+            self.text.mark_unset(_HIDDEN_HEAD)
+        for turn in revealed:
+            self.text.mark_set(turn.mark, "transcript_insert")
+            self.text.mark_gravity(turn.mark, 'left')
+            for content, tags in self._turn_chunks(turn):
+                self.text.insert("transcript_insert", content, tags)
+            turn.state = OPEN
+        if following is not None:
+            self.text.mark_set(following.mark, "transcript_insert")
+        self.text.mark_unset("transcript_insert")
+        self.text.config(state='disabled')
+        return count
+
+    def _hide(self, turn):
+        """把最早的占位符并入 "已隐藏" 提示行，控件里不再为它保留任何内容、标记或标签"""
+        start, end, next_mark = self._range(turn)
+        if self.hidden_count == 0:
+            self.text.mark_set(_HIDDEN_HEAD, start)
+            self.text.mark_gravity(_HIDDEN_HEAD, 'left')
+        self.hidden_count += 1
+        self._unbind(turn)
+        self.text.mark_unset(turn.mark)
+        turn.state = HIDDEN
+
+        self.text.config(state='normal')
+        self.text.delete(_HIDDEN_HEAD, end)
+        self.text.mark_set("transcript_insert", _HIDDEN_HEAD)
+        self.text.insert("transcript_insert", self._hidden_note(), 'transcript_note')
+        if next_mark is not None:
+            self.text.mark_set(next_mark, "transcript_insert")
+        self.text.mark_unset("transcript_insert")
+        self.text.config(state='disabled')
+
+    def _unbind(self, turn):
+        for tag in (f"placeholder{turn.number}", f"collapse{turn.number}"):
+            self.text.tag_delete(tag)
@@ -0,0 +1,351 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from context_window import estimate_tokens
+
+
+# --- 每轮请求的延迟指标 ---
+# StreamMetrics 记录一轮流式请求各阶段的时间点：建立连接、收到响应头 (首字节)、第一个文本块 (首字)、
+# 相邻文本块的间隔、生成速度、总耗时，以及文本块从到达到显示在界面上的渲染延迟。
+# MetricsRecorder 在后台线程中把每轮的指标追加到 JSONL 文件，可选地再写一份 Prometheus textfile
+# (node_exporter 的 textfile collector 格式)，用来长期跟踪各个服务商和模型的延迟。
+
+METRICS_FILENAME = "chatbot-metrics.jsonl"
+
+# Prometheus 直方图的桶 (秒)
+_TTFT_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+_DURATION_BUCKETS = (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_CLOSE = object()
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _percentile(values, fraction):
+    """最近秩法取分位数；values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class StreamMetrics:
+    """
+    一轮流式请求的计时，时间点都取 time.perf_counter()。
+    传输层在事件循环或读取线程中调用 start_attempt / trace / mark_headers / mark_content，
+    界面在 Tk 主线程中调用 note_rendered；各方法只做简单赋值和追加，不需要加锁。
+    """
+
+    def __init__(self, model_name, scenario=None, cached=False):
+        self.model_name = model_name
+        self.scenario = scenario
+        self.cached = cached
+        self.created = time.time()
+        self.started = time.perf_counter()
+        self.attempts = 0
+        # 发送前被客户端限流器推迟的总秒数
+        self.throttled = 0.0
+        # 建立 TCP (+TLS) 连接的耗时；复用连接池中的连接时为 0，传输层无法观测时为 None
+        self.connect = None
+        self._connect_started = None
+        self._traced = False
+        self.headers_at = None
+        self.first_content_at = None
+        self.last_content_at = None
+        self.gaps = []
+        self.chunks = 0
+        self.tokens = 0
+        self.finished_at = None
+        self.status = None
+        self.error = None
+        # 已投递给界面、尚未渲染的最早一个文本块的到达时间
+        self._unrendered_since = None
+        self.render_lags = []
+
+    # --- 传输层 ---
+
+    def start_attempt(self):
+        """每次发送请求 (包括重试) 前调用；连接和首字节按最后一次请求统计"""
+        self.attempts += 1
+        self.connect = None
+        self._connect_started = None
+        self._traced = False
+        self.headers_at = None
+
+    def note_throttled(self, seconds):
+        """发送请求前在限流器中等待了 seconds 秒"""
+        self.throttled += seconds
+
+    def trace(self, event_name, info):
+        """httpx / httpcore 的 trace 扩展回调，从中取出建立连接的耗时"""
+        self._traced = True
+        if event_name == "connection.connect_tcp.started":
+            self._connect_started = time.perf_counter()
+        elif (event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete")
+              and self._connect_started is not None):
+            self.connect = time.perf_counter() - self._connect_started
+
+    async def atrace(self, event_name, info):
+        """httpx.AsyncClient 要求 trace 回调是协程函数"""
+        self.trace(event_name, info)
+
+    def mark_headers(self):
+        """收到响应头 (首字节)"""
+        self.headers_at = time.perf_counter()
+        if self._traced and self.connect is None:
+            # 有 trace 事件但没有建立连接的事件：复用了连接池中的连接
+            self.connect = 0.0
+
+    def mark_content(self, content):
+        """收到一个文本块"""
+        now = time.perf_counter()
+        if self.first_content_at is None:
+            self.first_content_at = now
+        else:
+            self.gaps.append(now - self.last_content_at)
+        self.last_content_at = now
+        self.chunks += 1
+        self.tokens += estimate_tokens(content)
+
+    def finish(self, status="ok", error=None):
+        """流结束 (status 为 ok / error / stopped)；只记录第一次调用"""
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+            self.status = status
+            self.error = str(error) if error is not None else None
+
+    # --- 界面 ---
+
+    def note_posted(self):
+        """文本块已投递给 Tk 主线程 (事件循环线程中调用)"""
+        if self._unrendered_since is None:
+            self._unrendered_since = time.perf_counter()
+
+    def note_rendered(self):
+        """Tk 主线程渲染完一帧合并后的文本"""
+        since = self._unrendered_since
+        if since is not None:
+            self._unrendered_since = None
+            self.render_lags.append(time.perf_counter() - since)
+
+    # --- 汇总 ---
+
+    @property
+    def ttft(self):
+        return self.first_content_at - self.started if self.first_content_at is not None else None
+
+    @property
+    def duration(self):
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    @property
+    def tokens_per_second(self):
+        """从首字到最后一个文本块的生成速度；只有一个文本块时无法计算"""
+        if self.first_content_at is None or self.last_content_at == self.first_content_at:
+            return None
+        return self.tokens / (self.last_content_at - self.first_content_at)
+
+    def timing(self):
+        """写入聊天记录库的首字延迟和总耗时"""
+        return {"ttft_ms": _ms(self.ttft), "duration_ms": _ms(self.duration)}
+
+    def as_record(self):
+        """JSONL 中的一行"""
+        tokens_per_second = self.tokens_per_second
+        return {
+            "time": datetime.fromtimestamp(self.created).isoformat(timespec='seconds'),
+            "model": self.model_name,
+            "scenario": self.scenario,
+            "status": self.status or "ok",
+            "error": self.error,
+            "cached": self.cached,
+            "attempts": self.attempts,
+            "throttled_ms": _ms(self.throttled) if self.throttled else None,
+            "connect_ms": _ms(self.connect),
+            "ttfb_ms": _ms(self.headers_at - self.started) if self.headers_at is not None else None,
+            "ttft_ms": _ms(self.ttft),
+            "gap_p50_ms": _ms(_percentile(self.gaps, 0.5)),
+            "gap_p95_ms": _ms(_percentile(self.gaps, 0.95)),
+            "gap_max_ms": _ms(max(self.gaps, default=None)),
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "tokens_per_s": round(tokens_per_second, 1) if tokens_per_second is not None else None,
+            "duration_ms": _ms(self.duration),
+            "render_lag_p95_ms": _ms(_percentile(self.render_lags, 0.95)),
+            "render_lag_max_ms": _ms(max(self.render_lags, default=None))
+        }
+
+    def summary(self):
+        """状态栏上的一行文字"""
+        record = self.as_record()
+        parts = []
+        if record["connect_ms"] is not None:
+            parts.append(f"连接 {record['connect_ms']:.0f} ms")
+        if record["ttfb_ms"] is not None:
+            parts.append(f"首字节 {record['ttfb_ms']:.0f} ms")
+        parts.append(f"首字 {record['ttft_ms']:.0f} ms" if record["ttft_ms"] is not None else "首字 -")
+        if record["gap_max_ms"] is not None:
+            parts.append(f"间隔 p95 {record['gap_p95_ms']:.0f} / 最大 {record['gap_max_ms']:.0f} ms")
+        if record["tokens_per_s"] is not None:
+            parts.append(f"{record['tokens_per_s']:.1f} tokens/s")
+        if self.finished_at is None:
+            parts.append("生成中...")
+            return " · ".join(parts)
+        parts.append(f"总耗时 {self.duration:.2f} s")
+        if record["render_lag_p95_ms"] is not None:
+            parts.append(f"渲染延迟 p95 {record['render_lag_p95_ms']:.0f} ms")
+        if self.cached:
+            parts.append("缓存回放")
+        if record["attempts"] > 1:
+            parts.append(f"请求 {record['attempts']} 次")
+        if record["throttled_ms"] is not None:
+            parts.append(f"限流等待 {self.throttled:.1f} s")
+        if record["status"] != "ok":
+            parts.append({"error": "出错", "stopped": "已停止"}.get(record["status"], record["status"]))
+        return " · ".join(parts)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        lines = [f'{name}_bucket{{{labels},le="{bound:g}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.total}')
+        return lines
+
+
+class MetricsRecorder:
+    """
+    每个记录路径一个写入线程 (与 HistoryWriter 相同，Tk 主线程不做磁盘 I/O)。可通过环境变量设置：
+      CHATBOT_METRICS              设为 0 时不记录延迟指标
+      CHATBOT_METRICS_FILE         JSONL 文件名 (相对路径按记录路径解析)，默认 chatbot-metrics.jsonl
+      CHATBOT_PROMETHEUS_TEXTFILE  设置后每轮结束时重写这个 Prometheus textfile (按模型累计，进程重启后从 0 开始)
+    """
+
+    def __init__(self, path=None, prometheus_path=None, on_error=None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.on_error = on_error
+        self._turns = {}
+        self._tokens = {}
+        self._ttft = {}
+        self._duration = {}
+        self._last = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="chatbot-metrics-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, directory, on_error=None):
+        """directory 为 None (没有选择记录路径，或生成过程中取消了选择文件夹) 时不写 JSONL 文件"""
+        path = None
+        if directory is not None and os.environ.get("CHATBOT_METRICS", "1").lower() not in ("0", "false", "no"):
+            path = directory / os.environ.get("CHATBOT_METRICS_FILE", METRICS_FILENAME)
+        prometheus_path = os.environ.get("CHATBOT_PROMETHEUS_TEXTFILE")
+        return cls(path, Path(prometheus_path) if prometheus_path else None, on_error)
+
+    def record(self, metrics):
+        """记录一轮的指标 (StreamMetrics)，立即返回"""
+        if self.path is not None or self.prometheus_path is not None:
+            self._queue.put(metrics.as_record())
+
+    def close(self, timeout=None):
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = _CLOSE in batch
+            records = [record for record in batch if record is not _CLOSE]
+            if records:
+                try:
+                    self._write(records)
+                except OSError as e:
+                    if self.on_error:
+                        self.on_error(e)
+            if closing:
+                return
+
+    def _write(self, records):
+        if self.path is not None:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self.prometheus_path is not None:
+            for record in records:
+                self._observe(record)
+            self._write_prometheus()
+
+    def _observe(self, record):
+        if record["cached"]:
+            # 缓存回放不反映服务商延迟
+            return
+        model_name = record["model"]
+        key = (model_name, record["status"])
+        self._turns[key] = self._turns.get(key, 0) + 1
+        self._tokens[model_name] = self._tokens.get(model_name, 0) + record["tokens"]
+        self._duration.setdefault(model_name, _Histogram(_DURATION_BUCKETS)).observe(record["duration_ms"] / 1000)
+        if record["ttft_ms"] is not None:
+            self._ttft.setdefault(model_name, _Histogram(_TTFT_BUCKETS)).observe(record["ttft_ms"] / 1000)
+        self._last[model_name] = record
+
+    def _write_prometheus(self):
+        lines = ["# HELP chatbot_turns_total 已结束的对话轮数", "# TYPE chatbot_turns_total counter"]
+        for (model_name, status), count in sorted(self._turns.items()):
+            lines.append(f'chatbot_turns_total{{model="{_label(model_name)}",status="{_label(status)}"}} {count}')
+        lines += ["# HELP chatbot_output_tokens_total 模型输出的 tokens (估算)",
+                  "# TYPE chatbot_output_tokens_total counter"]
+        for model_name, tokens in sorted(self._tokens.items()):
+            lines.append(f'chatbot_output_tokens_total{{model="{_label(model_name)}"}} {tokens}')
+        for name, help_text, histograms in (
+                ("chatbot_ttft_seconds", "从发出请求到第一个文本块的时间", self._ttft),
+                ("chatbot_duration_seconds", "一轮请求的总耗时", self._duration)):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for model_name, histogram in sorted(histograms.items()):
+                lines += histogram.lines(name, f'model="{_label(model_name)}"')
+        for name, key, scale, help_text in (
+                ("chatbot_last_connect_seconds", "connect_ms", 1000, "最近一轮建立连接的耗时"),
+                ("chatbot_last_ttfb_seconds", "ttfb_ms", 1000, "最近一轮收到响应头的时间"),
+                ("chatbot_last_gap_p95_seconds", "gap_p95_ms", 1000, "最近一轮文本块间隔的 p95"),
+                ("chatbot_last_tokens_per_second", "tokens_per_s", 1, "最近一轮的生成速度"),
+                ("chatbot_last_render_lag_p95_seconds", "render_lag_p95_ms", 1000, "最近一轮界面渲染延迟的 p95")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for model_name, record in sorted(self._last.items()):
+                if record[key] is not None:
+                    lines.append(f'{name}{{model="{_label(model_name)}"}} {record[key] / scale:g}')
+
+        # 先写临时文件再改名，textfile collector 不会读到写了一半的文件
+        temp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+        temp_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        os.replace(temp_path, self.prometheus_path)